@@ -2,6 +2,8 @@
 Assembler
 """
 
+import re
+
 class AssemblerError( Exception ):
     def __init__(self, line, col, msg):
         super().__init__(line, col, msg)
@@ -19,6 +21,51 @@ def _getwhile(cadena, pos, fn):
         pos += 1
     return (tok, pos)
 
+# Primera palabra de una línea: directiva o identificador
+_first_word = re.compile(r'\s*(\.|[A-Za-z_@][A-Za-z0-9_@]*)')
+
+# Tipos de evento de un _Chunk
+_OUT = 0
+_LABEL = 1
+_FIXUP = 2
+
+class _Chunk:
+    """Encoded output of a group of source lines, relative to its start address.
+
+    A chunk starts at a line beginning with an instruction or directive and spans
+    the following label/comment lines. Its bytes are position independent: label
+    references are replayed as fixups, and only values that changed the encoding
+    itself (`deps`) or an `.org`/`.align` (`absolute`) tie it to the context
+    where it was assembled.
+
+    `events` holds what the chunk did, in source order: the bytes it wrote (not
+    what they held after later gap fills, which may come from other chunks),
+    the labels it defined and its fixups, each after the bytes of its statement.
+    Replaying them in that order fills and overwrites memory as a fresh pass would.
+    """
+    def __init__(self, start):
+        self.start = start
+        self.absolute = False
+        self.cacheable = True
+        self.end = 0
+        # (_OUT, offset, bytearray), (_LABEL, label, value, relative) o (_FIXUP, size, offset, label)
+        self.events = []
+        # Referencias de la sentencia en curso, que pasan a `events` tras sus bytes
+        self.fixups = []
+        self.deps = {}
+
+    def out(self, offset, values):
+        last = self.events[-1] if self.events else None
+        if last is not None and last[0] == _OUT and (last[1] + len(last[2])) & 0xFFFF == offset:
+            last[2].extend(values)
+        else:
+            self.events.append((_OUT, offset, bytearray(values)))
+
+    def end_statement(self):
+        for size, offset, label in self.fixups:
+            self.events.append((_FIXUP, size, offset, label))
+        self.fixups = []
+
 class Assembler:
     _directives = {'ORG','BYTE','WORD','ALIGN','EQU'}
     _keywords = {'ADC','ADD','AND','BIT','CALL','CCF','CP','CPL','DAA','DEC','DI','EI','HALT','INC','JP','JR',
@@ -67,21 +114,49 @@ class Assembler:
         'AF': 0b11,
     }
 
+    # Índice = código de operación en los bits 3-5
+    _alu = ['ADD','ADC','SUB','SBC','AND','XOR','OR','CP']
+    _rot = ['RLC','RRC','RL','RR','SLA','SRA','SWAP','SRL']
+    # Índice = bits 6-7 tras el prefijo $CB
+    _bit_ops = [None,'BIT','RES','SET']
+
+    # Instrucciones sin operandos
+    _implied = {
+        'CCF':  0x3F,
+        'CPL':  0x2F,
+        'DAA':  0x27,
+        'DI':   0xF3,
+        'EI':   0xFB,
+        'HALT': 0x76,
+        'NOP':  0x00,
+        'RETI': 0xD9,
+        'RLA':  0x17,
+        'RLCA': 0x07,
+        'RRA':  0x1F,
+        'RRCA': 0x0F,
+        'SCF':  0x37,
+        'STOP': 0x10,
+    }
+
     def __init__(self, code=None):
+        # Cachés que se conservan entre llamadas a compile():
+        # línea -> tokens, texto del chunk -> _Chunk
+        self._line_cache = {}
+        self._chunk_cache = {}
+        self._rec = None
         if code:
             self.compile(code)
 
     def compile(self, code):
+        """Assemble `code`, reusing the output of unchanged chunks from the previous call."""
         self.code = code
         # _mem es hash en vez de array porque puede contener espacios vacíos
         self._mem = {}
         self._imem = 0
         # Relaciona label->imem.
         self._labels = {}
-        # Relaciona imem->label para las aún no resueltas.
-        self._gaps8 = {}
-        self._gaps16 = {}
-        self._gapsrel8 = {}
+        # Relaciona label->[(size, imem)] para las aún no resueltas.
+        self._gaps = {}
         self._line = 0
         self._col = 0
         self._parse()
@@ -97,6 +172,9 @@ class Assembler:
         raise AssemblerError(self._line, self._col, msg)
 
     def _warning(self, msg):
+        if self._rec:
+            # Para que el aviso vuelva a salir en la siguiente compilación
+            self._rec.cacheable = False
         print(f"Assembler warning: line {self._line}, col {self._col}: {msg}")
 
     def _set_byte(self, addr, value):
@@ -105,6 +183,8 @@ class Assembler:
         self._mem[addr] = value
 
     def _out_byte(self, value):
+        if self._rec:
+            self._rec.out((self._imem - self._rec.start) & 0xFFFF, (value & 0xFF,))
         self._set_byte(self._imem, value)
         self._imem = (self._imem + 1) & 0xFFFF
 
@@ -116,6 +196,8 @@ class Assembler:
         self._mem[(addr+1) & 0xFFFF] = (value & 0xFF00) >> 8
 
     def _out_word(self, value):
+        if self._rec:
+            self._rec.out((self._imem - self._rec.start) & 0xFFFF, (value & 0xFF, (value >> 8) & 0xFF))
         self._set_word(self._imem, value)
         self._imem = (self._imem + 2) & 0xFFFF
 
@@ -128,43 +210,58 @@ class Assembler:
         self._tok = tok
         return tok
 
-    def _gen_tokenizer(self):
-        for line in self.code.splitlines():
-            line = line.rstrip()
+    def _gen_tokenizer(self, lines):
+        for line in lines:
             self._line += 1
             self._col = 0
-            while self._col < len(line):
-                ch = line[self._col]
-                if ch.isspace():
-                    self._col = _getwhile(line, self._col + 1, str.isspace)[1]
-                elif ch == ';':
-                    break
-                elif ch.isalpha() or ch == '@' or ch == '_' or ch == '.':
-                    tok, self._col = _getwhile(line, self._col + 1, lambda c: c.isalnum() or c=='_' or c=='@')
-                    yield self._set_token( (ch + tok).upper() )
-                elif ch == '$':
-                    tok, self._col = _getwhile(line, self._col + 1, lambda c: '0' <= c <= '9' or 'A' <= c.upper() <= 'F')
-                    yield self._set_token( int(tok, 16) )
-                elif ch == '%':
-                    tok, self._col = _getwhile(line, self._col + 1, lambda c: c=='0' or c=='1')
-                    yield self._set_token( int(tok,2) )
-                elif ch == '0':
-                    tok, self._col = _getwhile(line, self._col + 1, lambda c: '0' <= c <= '7')
-                    yield self._set_token( int('0'+tok,8) )
-                elif ch.isdecimal():
-                    tok, self._col = _getwhile(line, self._col + 1, str.isdecimal)
-                    yield self._set_token( int(ch+tok) )
-                elif ch == '"' or ch == "'":
-                    tok, self._col = _getwhile(line, self._col + 1, lambda c: c != ch)
-                    if self._col >= len(line) or line[self._col] != ch:
-                        self._error('Unclosed string literal')
-                    self._col += 1
-                    yield self._set_token( '"' + tok )
-                elif ch in ',():+-*<>':
-                    self._col += 1
-                    yield self._set_token( ch )
-                else:
-                    self._error(f"Invalid character: '{ch}'")
+            for tok, col in self._tokenize(line):
+                self._col = col
+                yield self._set_token(tok)
+
+    def _tokenize(self, line):
+        """Return the (token, column after token) pairs of a line, cached by its text."""
+        tokens = self._line_cache.get(line)
+        if tokens is not None:
+            self._new_line_cache[line] = tokens
+            return tokens
+        tokens = []
+        text = line.rstrip()
+        while self._col < len(text):
+            ch = text[self._col]
+            if ch.isspace():
+                self._col = _getwhile(text, self._col + 1, str.isspace)[1]
+                continue
+            elif ch == ';':
+                break
+            elif ch.isalpha() or ch == '@' or ch == '_' or ch == '.':
+                tok, self._col = _getwhile(text, self._col + 1, lambda c: c.isalnum() or c=='_' or c=='@')
+                tok = (ch + tok).upper()
+            elif ch == '$':
+                tok, self._col = _getwhile(text, self._col + 1, lambda c: '0' <= c <= '9' or 'A' <= c.upper() <= 'F')
+                tok = int(tok, 16)
+            elif ch == '%':
+                tok, self._col = _getwhile(text, self._col + 1, lambda c: c=='0' or c=='1')
+                tok = int(tok,2)
+            elif ch == '0':
+                tok, self._col = _getwhile(text, self._col + 1, lambda c: '0' <= c <= '7')
+                tok = int('0'+tok,8)
+            elif ch.isdecimal():
+                tok, self._col = _getwhile(text, self._col + 1, str.isdecimal)
+                tok = int(ch+tok)
+            elif ch == '"' or ch == "'":
+                tok, self._col = _getwhile(text, self._col + 1, lambda c: c != ch)
+                if self._col >= len(text) or text[self._col] != ch:
+                    self._error('Unclosed string literal')
+                self._col += 1
+                tok = '"' + tok
+            elif ch in ',():+-*<>':
+                self._col += 1
+                tok = ch
+            else:
+                self._error(f"Invalid character: '{ch}'")
+            tokens.append((tok, self._col))
+        self._new_line_cache[line] = tokens
+        return tokens
 
     def _next_token(self):
         try:
@@ -175,22 +272,91 @@ class Assembler:
 
     def _parse(self):
         self._pos = 0
-        self._tok = None
-        self._tokenizer = self._gen_tokenizer()
-        while self._token() is not None:
-            tok = self._token()
-            if tok[0] == '.':
-                self._parse_directive(tok)
-            elif tok in self._keywords:
-                self._parse_instruction(tok)
-            elif self._is_valid_label(tok):
-                self._parse_label(tok)
+        self._new_line_cache = {}
+        new_chunks = {}
+        lines = self.code.splitlines()
+        for first, last in self._split_chunks(lines):
+            key = '\n'.join(lines[first:last])
+            self._line = first
+            chunk = self._chunk_cache.get(key)
+            if chunk is not None and self._is_reusable(chunk):
+                self._replay(chunk)
             else:
-                self._error(f"Unexpected token: '{tok}'")
-        if self._gaps8 or self._gaps16:
-            labels = set(self._gaps8.values()) | set(self._gaps16.values())
+                chunk = self._parse_chunk(lines[first:last])
+            if chunk.cacheable:
+                new_chunks[key] = chunk
+        self._line = len(lines)
+        # Sólo se conserva lo usado en esta compilación
+        self._chunk_cache = new_chunks
+        self._line_cache = self._new_line_cache
+        if self._gaps:
+            labels = set(self._gaps.keys())
             self._error(f"Unresolved labels: {labels}")
 
+    def _split_chunks(self, lines):
+        """Yield (first, last) line ranges, cutting before every instruction or directive."""
+        first = 0
+        for i in range(1, len(lines)):
+            m = _first_word.match(lines[i])
+            if m and (m.group(1) == '.' or m.group(1).upper() in self._keywords):
+                yield (first, i)
+                first = i
+        if lines:
+            yield (first, len(lines))
+
+    def _parse_chunk(self, lines):
+        self._rec = _Chunk(self._imem)
+        self._tok = None
+        self._tokenizer = self._gen_tokenizer(lines)
+        try:
+            while self._token() is not None:
+                tok = self._token()
+                if tok[0] == '.':
+                    self._parse_directive(tok)
+                elif tok in self._keywords:
+                    self._parse_instruction(tok)
+                elif self._is_valid_label(tok):
+                    self._parse_label(tok)
+                else:
+                    self._error(f"Unexpected token: '{tok}'")
+                self._rec.end_statement()
+            chunk = self._rec
+        finally:
+            self._rec = None
+        chunk.end = (self._imem - chunk.start) & 0xFFFF
+        return chunk
+
+    def _is_reusable(self, chunk):
+        if chunk.absolute and chunk.start != self._imem:
+            return False
+        for label, value in chunk.deps.items():
+            if self._labels.get(label) != value:
+                return False
+        return True
+
+    def _replay(self, chunk):
+        base = self._imem
+        mem = self._mem
+        for event in chunk.events:
+            kind = event[0]
+            if kind == _OUT:
+                addr = base + event[1]
+                for value in event[2]:
+                    mem[addr & 0xFFFF] = value
+                    addr += 1
+            elif kind == _LABEL:
+                label, value, relative = event[1:]
+                self._set_label(label, (base + value) & 0xFFFF if relative else value)
+            else:
+                size, offset, label = event[1:]
+                addr = (base + offset) & 0xFFFF
+                value = self._labels.get(label)
+                if value is None:
+                    self._gaps.setdefault(label, []).append((size, addr))
+                else:
+                    self._fill_gap(size, addr, label, value)
+        self._imem = (base + chunk.end) & 0xFFFF
+
     def _parse_directive(self, tok):
         if tok[0] == '.':
             tok = tok[1:]
@@ -209,6 +375,7 @@ class Assembler:
         addr = self._parse_int(tok)
         addr &= 0xFFFF
         self._imem = addr
+        self._rec.absolute = True
         self._next_token()
 
     def _parse_d_byte(self, tok):
@@ -228,6 +395,7 @@ class Assembler:
     def _parse_d_align(self, tok):
         if type(tok) is not int:
             self._error(f"Expecting integer, found '{tok}'")
+        self._rec.absolute = True
         rem = self._imem % tok
         if rem > 0:
             addr = self._imem + tok - rem
@@ -252,7 +420,12 @@ class Assembler:
         self._set_label(tok, value)
         self._next_token()
 
-    def _set_label(self, label, value):
+    def _set_label(self, label, value, relative=False):
+        if self._rec:
+            if relative:
+                self._rec.events.append((_LABEL, label, (value - self._rec.start) & 0xFFFF, True))
+            else:
+                self._rec.events.append((_LABEL, label, value, False))
         self._labels[label] = value
         self._fill_gaps(label, value)
 
@@ -263,16 +436,17 @@ class Assembler:
         self._resolved = True
         if type(tok) is str and self._is_valid_label(tok):
             value = self._labels.get(tok, None)
+            if size is None:
+                if value is None:
+                    self._error(f"Undefined label not allowed: '{tok}'")
+                if self._rec:
+                    self._rec.deps[tok] = value
+            elif self._rec:
+                # Se vuelve a resolver al reutilizar el chunk en otra dirección
+                self._rec.fixups.append((size, (addr - self._rec.start) & 0xFFFF, tok))
             if value is None:
                 self._resolved = False
-                if size == 8:
-                    self._gaps8[addr] = tok
-                elif size == 16:
-                    self._gaps16[addr] = tok
-                elif size == -8:
-                    self._gapsrel8[addr] = tok
-                else:
-                    self._error(f"Undefined label not allowed: '{tok}'")
+                self._gaps.setdefault(tok, []).append((size, addr))
                 value = 0
             return value
         elif tok == '-':
@@ -293,38 +467,47 @@ class Assembler:
     def _parse_int16(self, tok, addr=None):
         return self._parse_int(tok, 16, addr)
 
+    def _depend(self, label, value):
+        """Turn the fixup just recorded for `label` into a dependency on its value.
+
+        Used where the value of the label changes the encoding, not only the operand.
+        """
+        if self._rec:
+            self._rec.fixups.pop()
+            self._rec.deps[label] = value
+
     def _fill_gaps(self, label, value):
-        for addr,l in [*self._gaps16.items()]:
-            if l == label:
-                self._set_word(addr, value)
-                self._gaps16.pop(addr)
-        for addr,l in [*self._gaps8.items()]:
-            if l == label:
-                self._set_byte(addr, value)
-                self._gaps8.pop(addr)
-        for addr,l in [*self._gapsrel8.items()]:
-            if l == label:
-                offset = value - (addr - 1)
-                if offset < -127 or offset > 129:
-                    self._error(f"Relative jump too far: from ${hex(addr-1)[2:]} to {label} (${hex(value)[2:]})")
-                else:
-                    self._set_byte(addr, offset + 2)
+        for size, addr in self._gaps.pop(label, ()):
+            self._fill_gap(size, addr, label, value)
+
+    def _fill_gap(self, size, addr, label, value):
+        if size == 16:
+            self._set_word(addr, value)
+        elif size == 8:
+            self._set_byte(addr, value)
+        else:
+            offset = value - (addr + 1)
+            if offset < -128 or offset > 127:
+                self._error(f"Relative jump too far: from ${hex(addr-1)[2:]} to {label} (${hex(value)[2:]})")
+            else:
+                self._set_byte(addr, offset)
 
     def _parse_instruction(self, tok):
+        opcode = self._implied.get(tok)
+        if opcode is not None:
+            self._out_byte(opcode)
+            if tok == 'STOP':
+                self._out_byte(0x00)
+            self._next_token()
+            return
         fn = {
             'ADC': self._parse_ALU,
             'ADD': self._parse_ALU,
             'AND': self._parse_ALU,
             'BIT': self._parse_BIT,
             'CALL': self._parse_CALL_JP,
-            'CCF': 0x3F,
             'CP': self._parse_ALU,
-            'CPL': 0x2F,
-            'DAA': 0x27,
             'DEC': self._parse_INC_DEC,
-            'DI': 0xF3,
-            'EI': 0xFB,
-            'HALT': 0x76,
             'INC': self._parse_INC_DEC,
             'JP': self._parse_CALL_JP,
             'JR': self._parse_JR,
@@ -332,42 +515,31 @@ class Assembler:
             'LDD': self._parse_LDD,
             'LDH': self._parse_LDH,
             'LDI': self._parse_LDI,
-            'NOP': 0x00,
             'OR': self._parse_ALU,
             'POP': self._parse_PUSH_POP,
             'PUSH': self._parse_PUSH_POP,
             'RES': self._parse_BIT,
             'RET': self._parse_RET,
-            'RETI': 0xD9,
             'RL': self._parse_0xCB,
-            'RLA': 0x17,
             'RLC': self._parse_0xCB,
-            'RLCA': 0x07,
             'RR': self._parse_0xCB,
-            'RRA': 0x1F,
             'RRC': self._parse_0xCB,
-            'RRCA': 0x0F,
             'RST': self._parse_RST,
             'SBC': self._parse_ALU,
-            'SCF': 0x37,
             'SET': self._parse_BIT,
             'SLA': self._parse_0xCB,
             'SRA': self._parse_0xCB,
             'SRL': self._parse_0xCB,
-            'STOP': 0x10,
             'SUB': self._parse_ALU,
             'SWAP': self._parse_0xCB,
             'XOR': self._parse_ALU,
             }.get(tok)
-        if fn is int:
-            self._out_byte(fn)
-        else:
-            fn(tok)
+        fn(tok)
 
     def _parse_label(self, tok):
         if self._next_token() == ':':
             self._next_token()
-        self._set_label(tok, self._imem)
+        self._set_label(tok, self._imem, True)
 
     def _expect(self, tok, expected):
         if tok != expected:
@@ -387,8 +559,24 @@ class Assembler:
             self._error(f"Expecting destination, found '{tok}'")
 
     def _parse_ALU(self, tok):
-        code = ['ADD','ADC','SUB','SBC','AND','XOR','OR','CP'].index(tok) << 3
+        code = self._alu.index(tok) << 3
         tok = self._next_token()
+        if code == 0 and tok == 'HL':
+            self._next_expect(',')
+            tok = self._next_token()
+            if tok not in self._r16_2.keys():
+                self._unexpected(tok)
+            # ADD HL,R
+            self._out_byte(0x09 | (self._r16_2[tok] << 4))
+            self._next_token()
+            return
+        if code == 0 and tok == 'SP':
+            self._next_expect(',')
+            self._out_byte(0xE8)
+            # ADD SP,N
+            self._out_byte(self._parse_int8(self._next_token()))
+            self._next_token()
+            return
         # Indicar A como destino es opcional en este ensamblador
         if tok == 'A':
             if self._next_token() == ',':
@@ -406,13 +594,15 @@ class Assembler:
         self._next_token()
 
     def _parse_BIT(self, tok):
-        code = [0, 'BIT', 'RES', 'SET'].index(tok) << 6
+        code = self._bit_ops.index(tok) << 6
         n = self._parse_int(self._next_token())
         if n < 0 or n > 7:
             self._error(f"Parameter 1 for {tok} must be in range 0..7")
+        self._next_expect(',')
         dest = self._parse_destination(self._next_token())
         self._out_byte(0xCB)
         self._out_byte(code | (n << 3) | dest)
+        self._next_token()
 
     def _parse_CALL_JP(self, tok):
         call = tok == 'CALL'
@@ -423,10 +613,18 @@ class Assembler:
             code |= (self._cc_code[tok] << 3)
             self._out_byte(code)
             tok = self._next_token()
+        elif tok == '(' and not call:
+            self._next_expect('HL')
+            self._next_expect(')')
+            # JP (HL)
+            self._out_byte(0xE9)
+            self._next_token()
+            return
         else:
             self._out_byte(0xCD if call else 0xC3)
         addr = self._parse_int16(tok)
         self._out_word(addr)
+        self._next_token()
 
     def _parse_INC_DEC(self, tok):
         op = 0 if tok == 'INC' else 1
@@ -440,21 +638,22 @@ class Assembler:
             self._out_byte(code)
         else:
             self._error(f"Expected destination, found '{tok}'")
+        self._next_token()
 
     def _parse_JR(self, tok):
         tok = self._next_token()
         if tok in self._cc:
             code = 0x20 | (self._cc_code[tok] << 3)
             self._next_expect(',')
+            tok = self._next_token()
         else:
             code = 0x18
         self._out_byte(code)
-        tok = self._next_token()
         if tok == '*':
             tok = self._next_token()
             if tok == '+' or tok == '-':
                 tok = self._parse_int(tok) - 2
-                if tok < -127 or tok > 129:
+                if tok < -128 or tok > 127:
                     self._error(f"Relative jump too far: {tok}")
                 else:
                     self._out_byte(tok)
@@ -462,11 +661,14 @@ class Assembler:
                 self._error(f"Expected relative offset, found '{tok}'")
         else:
             tok = self._parse_rel_offset(tok)
-            offset = tok - (self._imem - 1)
-            if offset < -127 or offset > 129:
-                self._error(f"Relative jump too far: {offset}")
+            if self._resolved:
+                offset = tok - (self._imem + 1)
+                if offset < -128 or offset > 127:
+                    self._error(f"Relative jump too far: {offset}")
+                self._out_byte(offset)
             else:
-                self._out_byte(offset + 2)
+                self._out_byte(0)
+        self._next_token()
 
     def _unexpected(self, tok):
         self._error(f"Unexpected token: '{tok}'")
@@ -506,32 +708,33 @@ class Assembler:
                 if type(tok) is not int:
                     sym = tok
                     tok = self._parse_int16(tok, self._imem + 1)
-                    if not self._resolved:
+                    if self._resolved:
+                        # El valor decide entre LD y LDH
+                        self._depend(sym, tok)
+                    else:
                         self._warning(f"Symbol '{sym}' is not resolved at this time. Generated code may be suboptimal. Consider using LDH if {sym} >= $FF00.")
-                if tok == 0xFF00:
+                addr = tok
+                tok = self._next_token()
+                if addr == 0xFF00 and tok == '+':
                     tok = self._next_token()
-                    if tok == '+':
-                        tok = self._next_token()
-                        if tok == 'C':
-                            self._rule_ld_p_c(self._next_token())
-                        else:
-                            tok = self._parse_int8(tok, self._imem + 1)
-                            self._rule_ldh_i8(self._next_token(), tok)
-                    elif tok == ')':
-                        self._rule_ldh_i8_p(self._next_token(), 0)
+                    if tok == 'C':
+                        self._rule_ld_p_c(self._next_token())
                     else:
-                        self._unexpected(tok)
-                elif tok > 0xFF00:
-                    self._rule_ldh_i8(self._next_token(), tok & 0xFF)
+                        tok = self._parse_int8(tok, self._imem + 1)
+                        self._rule_ldh_i8(self._next_token(), tok)
                 else:
-                    addr = tok
-                    self._next_expect(')')
+                    self._expect(tok, ')')
                     self._next_expect(',')
                     tok = self._next_token()
                     if tok == 'A':
-                        # LD (N),A
-                        self._out_byte(0xEA)
-                        self._out_word(addr)
+                        if addr >= 0xFF00:
+                            # LD (FF00+N),A
+                            self._out_byte(0xE0)
+                            self._out_byte(addr & 0xFF)
+                        else:
+                            # LD (N),A
+                            self._out_byte(0xEA)
+                            self._out_word(addr)
                     elif tok == 'SP':
                         # LD (N),SP
                         self._out_byte(0x08)
@@ -553,8 +756,13 @@ class Assembler:
         elif tok in self._r16_2.keys():
             r16_2 = self._r16_2[tok]
             self._next_expect(',')
-            i16 = self._parse_int16(self._next_token(), self._imem + 1)
-            self._pred_ld_r_n(r16_2, i16)
+            tok = self._next_token()
+            if r16_2 == self._r16_2['SP'] and tok == 'HL':
+                # LD SP,HL
+                self._out_byte(0xF9)
+            else:
+                i16 = self._parse_int16(tok, self._imem + 1)
+                self._pred_ld_r_n(r16_2, i16)
         elif tok == 'A':
             self._next_expect(',')
             tok = self._next_token()
@@ -593,7 +801,9 @@ class Assembler:
                     if type(tok) is not int:
                         sym = tok
                         tok = self._parse_int16(tok, self._imem + 1)
-                        if not self._resolved:
+                        if self._resolved:
+                            self._depend(sym, tok)
+                        else:
                             self._warning(f"Symbol '{sym}' is not resolved at this time. Generated code may be suboptimal. Consider using LDH if {sym} >= $FF00.")
                     if tok == 0xFF00:
                         tok = self._next_token()
@@ -617,10 +827,8 @@ class Assembler:
                         self._out_byte(0xFA)
                         self._out_word(tok)
 
-            elif tok in self._r8:
-                self._pred_ld_d_d(self._destination['A'], self._destination[tok])
             else:
-                self._unexpected(tok)
+                self._rule_ld_d(tok, self._destination['A'])
         elif tok in self._r8:
             self._next_expect(',')
             self._rule_ld_d(self._next_token(), self._destination[tok])
@@ -675,7 +883,7 @@ class Assembler:
 
     def _rule_ldh_i8_p(self, tok, i8):
         self._expect(tok, ',')
-        self._expect('A')
+        self._next_expect('A')
         # LD (FF00+N),A
         # LDH (N),A
         self._out_byte(0xE0)
@@ -713,6 +921,7 @@ class Assembler:
         self._out_byte(i8)
 
     def _parse_LDD(self, tok):
+        tok = self._next_token()
         if tok == 'A':
             self._next_expect(',')
             self._next_expect('(')
@@ -728,6 +937,7 @@ class Assembler:
         self._next_token()
 
     def _parse_LDI(self, tok):
+        tok = self._next_token()
         if tok == 'A':
             self._next_expect(',')
             self._next_expect('(')
@@ -743,6 +953,7 @@ class Assembler:
         self._next_token()
 
     def _parse_LDH(self, tok):
+        tok = self._next_token()
         if tok == 'A':
             self._next_expect(',')
             self._next_expect('(')
@@ -781,7 +992,7 @@ class Assembler:
         self._out_byte(code)
 
     def _parse_0xCB(self, tok):
-        code = ['RLC','RRC','RL','RR','SLA','SRA','SWAP','SRL'].index(tok) << 3
+        code = self._rot.index(tok) << 3
         d = self._parse_destination(self._next_token())
         self._out_byte(0xCB)
         self._out_byte(code | d)
@@ -0,0 +1,88 @@
+'''Battery-backed cart RAM in the browser'''
+
+# __pragma__('skip')
+from stubs import window, String, JSON
+# __pragma__('noskip')
+
+# Tamaño de las páginas de RAM de cartucho que se guardan por separado
+PAGE_SIZE = 256
+
+class DirtyPages:
+    """Pages of `memory.sram` written since the last `take()`.
+
+    `on_dirty()` is called on the first write after a `take()`, so the caller can
+    schedule a single flush instead of reacting to every write.
+    """
+    def __init__(self, memory, on_dirty=None):
+        self.memory = memory
+        self.on_dirty = on_dirty
+        self._flags = [False] * ((memory.sram.length + PAGE_SIZE - 1) // PAGE_SIZE)
+        self._pages = []
+        memory.sram_callback = self._written
+
+    def _written(self, index):
+        page = index // PAGE_SIZE
+        if not self._flags[page]:
+            self._flags[page] = True
+            self._pages.append(page)
+            if len(self._pages) == 1 and self.on_dirty is not None:
+                self.on_dirty()
+
+    def take(self):
+        """Dirty page numbers, in the order they were first written. Marks them clean."""
+        pages = self._pages
+        self._pages = []
+        for page in pages:
+            self._flags[page] = False
+        return pages
+
+class BrowserSave:
+    """Cart RAM and RTC kept in localStorage.
+
+    Each page is stored under its own key, and only dirty pages are written, in one
+    batch `delay` milliseconds after the first write, and when the page is hidden.
+    """
+    def __init__(self, memory, name, delay=1000):
+        self.memory = memory
+        self.key = 'gb2001:' + name
+        self.delay = delay
+        self._timeout = None
+        self._load()
+        self.tracker = DirtyPages(memory, self._schedule)
+        window.addEventListener('pagehide', lambda e: self.flush(), False)
+
+    def _load(self):
+        storage = window.localStorage
+        sram = self.memory.sram
+        for page in range((sram.length + PAGE_SIZE - 1) // PAGE_SIZE):
+            data = storage.getItem(self.key + ':' + str(page))
+            if data is not None:
+                base = page * PAGE_SIZE
+                for i in range(min(len(data), sram.length - base)):
+                    sram[base + i] = ord(data[i])
+        rtc = self.memory.rtc
+        data = storage.getItem(self.key + ':rtc')
+        if rtc is not None and data is not None:
+            saved = JSON.parse(data)
+            rtc.set_registers(saved['registers'])
+            rtc.latched = saved['latched']
+            rtc.advance(window.Date.now() // 1000 - saved['time'])
+
+    def _schedule(self):
+        if self._timeout is None:
+            self._timeout = window.setTimeout(self.flush, self.delay)
+
+    def flush(self):
+        if self._timeout is not None:
+            window.clearTimeout(self._timeout)
+            self._timeout = None
+        storage = window.localStorage
+        sram = self.memory.sram
+        for page in self.tracker.take():
+            base = page * PAGE_SIZE
+            storage.setItem(self.key + ':' + str(page),
+                            String.fromCharCode.apply(None, sram.slice(base, base + PAGE_SIZE)))
+        rtc = self.memory.rtc
+        if rtc is not None:
+            storage.setItem(self.key + ':rtc', JSON.stringify({
+                'registers': rtc.registers(), 'latched': rtc.latched, 'time': window.Date.now() // 1000}))
@@ -0,0 +1,92 @@
+'''State left by the boot ROM, to start carts without running it'''
+
+# Registros de E/S tras el arranque (Pan Docs, "Power Up Sequence"), en el
+# orden en que se escriben. LY y STAT los calcula la PPU y DIV se fija aparte
+_io_dmg = [
+    (0xFF00, 0xCF), (0xFF01, 0x00), (0xFF02, 0x7E), (0xFF05, 0x00), (0xFF06, 0x00), (0xFF07, 0xF8),
+    (0xFF10, 0x80), (0xFF11, 0xBF), (0xFF12, 0xF3), (0xFF13, 0xFF), (0xFF14, 0xBF),
+    (0xFF16, 0x3F), (0xFF17, 0x00), (0xFF18, 0xFF), (0xFF19, 0xBF),
+    (0xFF1A, 0x7F), (0xFF1B, 0xFF), (0xFF1C, 0x9F), (0xFF1D, 0xFF), (0xFF1E, 0xBF),
+    (0xFF20, 0xFF), (0xFF21, 0x00), (0xFF22, 0x00), (0xFF23, 0xBF),
+    (0xFF24, 0x77), (0xFF25, 0xF3), (0xFF26, 0xF1),
+    (0xFF42, 0x00), (0xFF43, 0x00), (0xFF45, 0x00), (0xFF47, 0xFC), (0xFF4A, 0x00), (0xFF4B, 0x00),
+    (0xFFFF, 0x00), (0xFF41, 0x00), (0xFF40, 0x91),
+]
+
+# Registros de la CPU: A, F, B, C, D, E, H, L
+_registers_dmg = [0x01, 0xB0, 0x00, 0x13, 0x00, 0xD8, 0x01, 0x4D]
+_registers_cgb = [0x11, 0x80, 0x00, 0x00, 0xFF, 0x56, 0x00, 0x0D]
+
+# Contador interno del timer (DIV es su byte alto) al llegar a $0100
+_div_dmg = 0xABCC
+_div_cgb = 0x1EA0
+
+# Tile del símbolo ® que la ROM de arranque copia de sí misma
+_registered = [0x3C, 0x42, 0xB9, 0xA5, 0xB9, 0xA5, 0x42, 0x3C]
+
+def _double_bits(nibble):
+    """4 bits to 8, each one repeated: the logo is drawn at twice its size."""
+    value = 0
+    for bit in range(3, -1, -1):
+        value = (value << 2) | (((nibble >> bit) & 1) * 3)
+    return value
+
+def draw_logo(memory, rom):
+    """Decompress the header logo into tiles 1-24, add the ® tile and fill the tile map like the boot ROM."""
+    vram = memory.vram
+    addr = 0x0010
+    for i in range(0x30):
+        value = rom[0x104 + i]
+        for nibble in (value >> 4, value & 0x0F):
+            row = _double_bits(nibble)
+            # Cada fila se repite; solo se escribe el primer plano de bits
+            vram[addr] = row
+            vram[addr + 2] = row
+            addr += 4
+    for row in _registered:
+        vram[addr] = row
+        addr += 2
+    vram[0x1910] = 0x19
+    tile = 0x18
+    for start in (0x192F, 0x190F):
+        for i in range(12):
+            vram[start - i] = tile
+            tile -= 1
+
+def skip_boot(system):
+    """Leave `system` as the boot ROM would when jumping to the cart at $0100.
+
+    CGB mode gets the CGB register values and white palettes, but the logo is
+    drawn like on DMG: the CGB boot animation is not reproduced.
+    """
+    cpu = system.cpu
+    memory = system.memory
+    cart = system.cart
+    if memory.cgb:
+        registers = _registers_cgb
+        div = _div_cgb
+    else:
+        registers = _registers_dmg
+        div = _div_dmg
+    cpu.A, cpu.F, cpu.B, cpu.C, cpu.D, cpu.E, cpu.H, cpu.L = registers
+    if not memory.cgb and not cart.rom[0x14D]:
+        # Con checksum de cabecera 0, el último CP de la ROM de arranque deja H y C a 0
+        cpu.F = 0x80
+    cpu.SP = 0xFFFE
+    cpu.PC = 0x0100
+    draw_logo(memory, cart.rom)
+    for addr, value in _io_dmg:
+        memory.poke(addr, value)
+    if memory.cgb:
+        for index in (0xFF68, 0xFF6A):
+            memory.poke(index, 0x80)
+            for i in range(64):
+                memory.poke(index + 1, 0xFF if i & 1 == 0 else 0x7F)
+        memory.poke(0xFF68, 0x00)
+        memory.poke(0xFF6A, 0x00)
+    memory.io[0x0F] = 0xE1
+    system.timer._div_base = cpu.cycles - div
+    system.timer._reschedule()
+    # Escribir en $FF50 desconecta la ROM de arranque
+    memory.io[0x50] = 0x01
+    memory.enable_bootrom = False
@@ -0,0 +1,213 @@
+"""
+Video and audio capture to files
+
+`Capture` writes frames as a YUV4MPEG2 stream (Y4M, 4:4:4, which ffmpeg and most
+players read directly) or as raw RGBA, and audio as a 16-bit PCM WAV file. The
+emulation thread only copies each frame into a bounded queue; a writer thread
+converts and writes them through large file buffers. If the writer falls behind
+and the queue fills up, a new frame is recorded as a repeat of the previous one
+(and counted in `dropped`) instead of making emulation wait for the disk.
+If a write fails, the writer keeps emptying the queue without writing, and the
+error is raised by the next `add_frame`, `add_audio` or `close`.
+
+Consecutive identical frames, common in menus and on paused screens, are
+detected on the emulation thread with a CRC32 plus a comparison against the last
+copy, and go through the queue as a repeat count of the frame before them.
+
+WAV sizes are 32-bit: past 4 GiB of audio (about 6.7 hours of 44.1 kHz stereo)
+the header holds the maximum size and players have to read to the end of file.
+"""
+
+import queue
+import struct
+import threading
+import zlib
+
+from ppu import WIDTH, HEIGHT, FRAME_CYCLES
+from rtc import CLOCK
+
+_wav_header = struct.Struct('<4sI4s4sIHHIIHH4sI')
+
+def _lane_tables(coefficient):
+    # Tablas (byte bajo, byte alto) de coefficient * x; los negativos se aplican sobre 255 - x
+    values = [coefficient * x if coefficient >= 0 else -coefficient * (255 - x) for x in range(256)]
+    return bytes(v & 0xFF for v in values), bytes(v >> 8 for v in values)
+
+class _Plane:
+    """One plane of the BT.601 conversion: (sum of coefficient * channel + offset) >> 8.
+
+    Every pixel is a 16-bit lane of one big integer, so the products come from
+    `bytes.translate` and the sums are big integer additions: no Python loop per
+    pixel. The coefficients are chosen so that no lane ever carries into the next.
+    """
+    def __init__(self, coefficients, offset, pixels):
+        constant = offset + sum(c * 255 for c in coefficients if c < 0)
+        self.tables = [_lane_tables(c) for c in coefficients]
+        self.constant = int.from_bytes(struct.pack('<H', constant) * pixels, 'little')
+        self.lane = bytearray(2 * pixels)
+
+    def convert(self, channels):
+        total = self.constant
+        lane = self.lane
+        for channel, (low, high) in zip(channels, self.tables):
+            lane[0::2] = channel.translate(low)
+            lane[1::2] = channel.translate(high)
+            total += int.from_bytes(lane, 'little')
+        return total.to_bytes(len(lane), 'little')[1::2]
+
+class Yuv444:
+    def __init__(self, pixels=WIDTH * HEIGHT):
+        self.planes = [
+            _Plane((66, 129, 25), 128 + (16 << 8), pixels),
+            _Plane((-38, -74, 112), 128 + (128 << 8), pixels),
+            _Plane((112, -94, -18), 128 + (128 << 8), pixels),
+        ]
+
+    def convert(self, data):
+        """Y, U and V planes, one after another, for RGBA pixels `data`."""
+        channels = (data[0::4], data[1::4], data[2::4])
+        return b''.join(plane.convert(channels) for plane in self.planes)
+
+class Capture:
+    def __init__(self, video=None, audio=None, video_format='y4m', sample_rate=44100, channels=2,
+                 queue_size=64, buffer_size=1 << 22):
+        """Capture to the file paths `video` and/or `audio` (either can be None).
+
+        `video_format` is 'y4m' or 'rgba'. Audio blocks are interleaved signed
+        16-bit little-endian samples with `channels` channels. At most `queue_size`
+        frames and audio blocks wait for the writer.
+        """
+        if video_format not in ('y4m', 'rgba'):
+            raise ValueError(f'Unknown video format {video_format!r}')
+        self.video_format = video_format
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.frames = 0
+        self.duplicates = 0
+        self.dropped = 0
+        self.audio_dropped = 0
+        self._queue = queue.Queue(queue_size)
+        self._video = open(video, 'wb', buffering=buffer_size) if video is not None else None
+        self._audio = open(audio, 'wb', buffering=buffer_size) if audio is not None else None
+        self._audio_size = 0
+        # Primer error del hilo escritor, que se relanza en el hilo de emulación
+        self._error = None
+        # Último cuadro distinto y cuántas veces falta escribirlo; aún no está en la cola
+        self._last = None
+        self._last_crc = None
+        self._repeats = 0
+        if self._video is not None and video_format == 'y4m':
+            self._video.write(b'YUV4MPEG2 W%d H%d F%d:%d Ip A1:1 C444\n' % (WIDTH, HEIGHT, CLOCK, FRAME_CYCLES))
+        if self._audio is not None:
+            self._audio.write(self._wav_header())
+        self._thread = threading.Thread(target=self._writer, name='capture writer', daemon=True)
+        self._thread.start()
+
+    def _wav_header(self):
+        size = min(self._audio_size, 0xFFFFFFFF - 36)
+        block = 2 * self.channels
+        return _wav_header.pack(b'RIFF', size + 36, b'WAVE', b'fmt ', 16, 1, self.channels, self.sample_rate,
+                                self.sample_rate * block, block, 16, b'data', size)
+
+    def add_frame(self, frame):
+        """Record the next frame (RGBA words, e.g. `Ppu.frame`)."""
+        if self._error is not None:
+            raise self._error
+        self.frames += 1
+        data = memoryview(frame).cast('B').tobytes()
+        crc = zlib.crc32(data)
+        if crc == self._last_crc and data == self._last:
+            self.duplicates += 1
+            self._repeats += 1
+            return
+        if self._last is not None:
+            try:
+                self._queue.put_nowait(('frame', self._last, self._repeats))
+            except queue.Full:
+                # El escritor va con retraso: este cuadro se graba como repetición del anterior
+                self.dropped += 1
+                self._repeats += 1
+                return
+        self._last = data
+        self._last_crc = crc
+        self._repeats = 1
+
+    def add_audio(self, samples):
+        """Record an audio block (bytes of interleaved 16-bit samples)."""
+        if self._error is not None:
+            raise self._error
+        try:
+            self._queue.put_nowait(('audio', bytes(samples), 0))
+        except queue.Full:
+            self.audio_dropped += 1
+
+    def attach(self, system):
+        """Record every frame of `system` at VBlank."""
+        ppu = system.ppu
+        chained = ppu.vblank_callback
+        def on_vblank(time):
+            self.add_frame(ppu.frame)
+            if chained is not None:
+                chained(time)
+        ppu.vblank_callback = on_vblank
+
+    def _writer(self):
+        yuv = Yuv444()
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if self._error is not None:
+                # Tras un error solo se vacía la cola, para que nadie se quede esperando
+                continue
+            try:
+                self._write(yuv, *item)
+            except Exception as e:
+                self._error = e
+
+    def _write(self, yuv, kind, data, count):
+        if kind == 'audio':
+            if self._audio is not None:
+                self._audio.write(data)
+                self._audio_size += len(data)
+        elif self._video is not None:
+            if self.video_format == 'y4m':
+                data = b'FRAME\n' + yuv.convert(data)
+            for i in range(count):
+                self._video.write(data)
+
+    def close(self):
+        """Write what is left and close the files. Waits for the writer.
+
+        Raises the error of a failed write, once the files are closed.
+        """
+        if self._thread is None:
+            return
+        # Con el escritor muerto, un put bloqueante sobre la cola llena no volvería nunca
+        if self._thread.is_alive():
+            if self._last is not None and self._error is None:
+                self._queue.put(('frame', self._last, self._repeats))
+            self._queue.put(None)
+            self._thread.join()
+        self._thread = None
+        self._last = None
+        try:
+            if self._audio is not None and self._error is None:
+                self._audio.seek(0)
+                self._audio.write(self._wav_header())
+        finally:
+            for f in (self._video, self._audio):
+                if f is not None:
+                    try:
+                        f.close()
+                    except Exception as e:
+                        if self._error is None:
+                            self._error = e
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -4,7 +4,7 @@
 from stubs import console, __new__, Uint8Array, String
 # __pragma__('noskip')
 
-from .enum import Enum
+from simple_enum import Enum
 
 class Capability(Enum):
     Capable = 0
@@ -86,8 +86,12 @@ ram_sizes = {
     0x01: 2,
     0x02: 8,
     0x03: 32,
+    0x04: 128,
+    0x05: 64,
 }
 
+nintendo_logo = [206, 237, 102, 102, 204, 13, 0, 11, 3, 115, 0, 131, 0, 12, 0, 13, 0, 8, 17, 31, 136, 137, 0, 14, 220, 204, 110, 230, 221, 221, 217, 153, 187, 187, 103, 99, 110, 14, 236, 204, 221, 220, 153, 159, 187, 185, 51, 62]
+
 class Cart:
     def __init__(self, file, rom: Uint8Array):
         self.rom = rom
@@ -110,7 +114,7 @@ class Cart:
         else:
             title_length = 16
         self.title = String.fromCharCode.apply(None, rom.slice(0x134, 0x134+title_length))
-        cero = self.title.indexOf('\0')
+        cero = self.title.find('\0')
         if cero > -1:
             self.title = self.title[0:cero]
         console.debug(f'Cart title: {self.title}')
@@ -125,11 +129,13 @@ class Cart:
         console.debug(f'RAM size: {self.ram_size} KB')
         self.destination_id = rom[0x14A]
         console.debug(f"Destination: {'Non-Japanese' if self.destination_id else 'Japanese'}")
+        self.header_checksum = rom[0x14D]
+        self.checksum = (rom[0x14E] << 8) | rom[0x14F]
         console.debug('Header checksum ...', 'OK' if self.check_header_checksum() else 'ERROR !!!')
         console.debug('Full ROM checksum ...', 'OK' if self.check_rom_checksum() else 'ERROR !!!')
 
     def check_logo(self):
-        logo = __new__(Uint8Array([206, 237, 102, 102, 204, 13, 0, 11, 3, 115, 0, 131, 0, 12, 0, 13, 0, 8, 17, 31, 136, 137, 0, 14, 220, 204, 110, 230, 221, 221, 217, 153, 187, 187, 103, 99, 110, 14, 236, 204, 221, 220, 153, 159, 187, 185, 51, 62]))
+        logo = __new__(Uint8Array(nintendo_logo))
         for i in range(len(logo)):
             if self.rom[0x104+i] != logo[i]:
                 return False
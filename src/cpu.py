@@ -1,4 +1,5 @@
 from memory import Memory
+from scheduler import Scheduler, NEVER
 
 class Cpu:
     @property
@@ -173,3 +174,605 @@ class Cpu:
         self._l = 0
         self._pc = 0
         self._sp = 0
+        self.ime = False
+        self.halted = False
+        # Un código de operación inválido bloquea la CPU hasta el reset
+        self.locked = False
+        # Ciclos de reloj (4.19 MHz) desde el arranque
+        self.cycles = 0
+        # Eventos de los periféricos (timer, PPU...), atendidos entre instrucciones
+        self.scheduler = Scheduler()
+        self._ei_pending = False
+        # Tablas sin instrumentar y capas de instrumentación (perfilador, traza...)
+        self._base_ops, self._base_cb_ops = self._build_ops()
+        self._hooks = []
+        self._ops = self._base_ops
+        self._cb_ops = self._base_cb_ops
+        self._service_interrupt = self._interrupt
+
+    def save_state(self):
+        return {
+            'a': self._a, 'f': self._f, 'b': self._b, 'c': self._c, 'd': self._d, 'e': self._e,
+            'h': self._h, 'l': self._l, 'pc': self._pc, 'sp': self._sp,
+            'ime': self.ime, 'halted': self.halted, 'locked': self.locked,
+            'ei_pending': self._ei_pending, 'cycles': self.cycles,
+        }
+
+    def load_state(self, state):
+        self._a = state['a']
+        self._f = state['f']
+        self._b = state['b']
+        self._c = state['c']
+        self._d = state['d']
+        self._e = state['e']
+        self._h = state['h']
+        self._l = state['l']
+        self._pc = state['pc']
+        self._sp = state['sp']
+        self.ime = state['ime']
+        self.halted = state['halted']
+        self.locked = state['locked']
+        self._ei_pending = state['ei_pending']
+        self.cycles = state['cycles']
+
+    def step(self):
+        """Execute one instruction, or service an interrupt. Returns the clock cycles spent."""
+        ime = self.ime
+        if self._ei_pending:
+            # EI tiene efecto tras la instrucción siguiente
+            self._ei_pending = False
+            self.ime = True
+        if ime or self.halted:
+            io = self.memory.io
+            pending = io[0xFF] & io[0x0F] & 0x1F
+            if pending:
+                self.halted = False
+                if ime:
+                    return self._service_interrupt(pending)
+            elif self.halted:
+                # Nada cambia hasta el siguiente evento: se salta hasta él
+                next_time = self.scheduler.next_time
+                cycles = 4
+                if next_time != NEVER and next_time - self.cycles > 4:
+                    cycles = (next_time - self.cycles + 3) & ~3
+                self.cycles += cycles
+                if self.cycles >= next_time:
+                    self.scheduler.run(self.cycles)
+                return cycles
+        pc = self._pc
+        self._pc = (pc + 1) & 0xFFFF
+        cycles = self._ops[self.memory.fetch(pc)]()
+        self.cycles += cycles
+        if self.cycles >= self.scheduler.next_time:
+            self.scheduler.run(self.cycles)
+        return cycles
+
+    def add_hook(self, hook):
+        """Install an instrumentation layer on top of the current ones.
+
+        `hook.instrument(ops, cb_ops, interrupt)` gets the dispatch tables and the
+        interrupt handler below it and returns its own (ops, cb_ops, interrupt).
+        """
+        self._hooks.append(hook)
+        self._ops, self._cb_ops, self._service_interrupt = hook.instrument(self._ops, self._cb_ops, self._service_interrupt)
+
+    def remove_hook(self, hook):
+        """Remove `hook`, whatever its place in the chain; the layers above it are rebuilt."""
+        self._hooks.remove(hook)
+        ops, cb_ops, interrupt = self._base_ops, self._base_cb_ops, self._interrupt
+        for layer in self._hooks:
+            ops, cb_ops, interrupt = layer.instrument(ops, cb_ops, interrupt)
+        self._ops, self._cb_ops, self._service_interrupt = ops, cb_ops, interrupt
+
+    def run(self, cycles):
+        """Run for at least `cycles` clock cycles. Returns the cycles actually run."""
+        start = self.cycles
+        target = start + cycles
+        step = self.step
+        while self.cycles < target:
+            step()
+        return self.cycles - start
+
+    def _interrupt(self, pending):
+        bit = 0
+        while not pending & (1 << bit):
+            bit += 1
+        io = self.memory.io
+        io[0x0F] &= ~(1 << bit) & 0xFF
+        self.ime = False
+        sp = (self._sp - 2) & 0xFFFF
+        self._sp = sp
+        self.memory.poke((sp + 1) & 0xFFFF, self._pc >> 8)
+        self.memory.poke(sp, self._pc & 0xFF)
+        self._pc = 0x40 + bit * 8
+        self.cycles += 20
+        if self.cycles >= self.scheduler.next_time:
+            self.scheduler.run(self.cycles)
+        return 20
+
+    def _build_ops(self):
+        """Build the dispatch tables: one function per opcode, returning its cycles."""
+        cpu = self
+        mem = self.memory
+
+        def fetch():
+            pc = cpu._pc
+            cpu._pc = (pc + 1) & 0xFFFF
+            return mem.peek(pc)
+
+        def fetch16():
+            pc = cpu._pc
+            cpu._pc = (pc + 2) & 0xFFFF
+            return mem.peek(pc) | (mem.peek((pc + 1) & 0xFFFF) << 8)
+
+        def fetch_signed():
+            e = fetch()
+            return e - 0x100 if e & 0x80 else e
+
+        def push(value):
+            sp = (cpu._sp - 2) & 0xFFFF
+            cpu._sp = sp
+            mem.poke((sp + 1) & 0xFFFF, value >> 8)
+            mem.poke(sp, value & 0xFF)
+
+        def pop():
+            sp = cpu._sp
+            cpu._sp = (sp + 2) & 0xFFFF
+            return mem.peek(sp) | (mem.peek((sp + 1) & 0xFFFF) << 8)
+
+        # Registros de 8 bits, en el orden de Assembler._destination
+        def get_b(): return cpu._b
+        def get_c(): return cpu._c
+        def get_d(): return cpu._d
+        def get_e(): return cpu._e
+        def get_h(): return cpu._h
+        def get_l(): return cpu._l
+        def get_m(): return mem.peek((cpu._h << 8) | cpu._l)
+        def get_a(): return cpu._a
+        def set_b(v): cpu._b = v
+        def set_c(v): cpu._c = v
+        def set_d(v): cpu._d = v
+        def set_e(v): cpu._e = v
+        def set_h(v): cpu._h = v
+        def set_l(v): cpu._l = v
+        def set_m(v): mem.poke((cpu._h << 8) | cpu._l, v)
+        def set_a(v): cpu._a = v
+        get8 = [get_b, get_c, get_d, get_e, get_h, get_l, get_m, get_a]
+        set8 = [set_b, set_c, set_d, set_e, set_h, set_l, set_m, set_a]
+
+        # Pares, en el orden de Assembler._r16_2 (y _r16_3 con AF en lugar de SP)
+        def get_bc(): return (cpu._b << 8) | cpu._c
+        def get_de(): return (cpu._d << 8) | cpu._e
+        def get_hl(): return (cpu._h << 8) | cpu._l
+        def get_sp(): return cpu._sp
+        def get_af(): return (cpu._a << 8) | cpu._f
+        def set_bc(v): cpu._b = v >> 8; cpu._c = v & 0xFF
+        def set_de(v): cpu._d = v >> 8; cpu._e = v & 0xFF
+        def set_hl(v): cpu._h = v >> 8; cpu._l = v & 0xFF
+        def set_sp(v): cpu._sp = v
+        def set_af(v): cpu._a = v >> 8; cpu._f = v & 0xF0
+        get16 = [get_bc, get_de, get_hl, get_sp]
+        set16 = [set_bc, set_de, set_hl, set_sp]
+        get16_3 = [get_bc, get_de, get_hl, get_af]
+        set16_3 = [set_bc, set_de, set_hl, set_af]
+
+        # Condiciones, en el orden de Assembler._cc_code
+        def nz(): return not cpu._f & 0x80
+        def z(): return cpu._f & 0x80
+        def nc(): return not cpu._f & 0x10
+        def cy(): return cpu._f & 0x10
+        conds = [nz, z, nc, cy]
+
+        # ALU, en el orden de Assembler._alu
+        def add(v):
+            a = cpu._a
+            r = a + v
+            cpu._f = (0 if r & 0xFF else 0x80) | (0x20 if (a & 0xF) + (v & 0xF) > 0xF else 0) | (0x10 if r > 0xFF else 0)
+            cpu._a = r & 0xFF
+        def adc(v):
+            a = cpu._a
+            c = (cpu._f >> 4) & 1
+            r = a + v + c
+            cpu._f = (0 if r & 0xFF else 0x80) | (0x20 if (a & 0xF) + (v & 0xF) + c > 0xF else 0) | (0x10 if r > 0xFF else 0)
+            cpu._a = r & 0xFF
+        def sub(v):
+            a = cpu._a
+            r = a - v
+            cpu._f = (0 if r & 0xFF else 0x80) | 0x40 | (0x20 if (a & 0xF) < (v & 0xF) else 0) | (0x10 if r < 0 else 0)
+            cpu._a = r & 0xFF
+        def sbc(v):
+            a = cpu._a
+            c = (cpu._f >> 4) & 1
+            r = a - v - c
+            cpu._f = (0 if r & 0xFF else 0x80) | 0x40 | (0x20 if (a & 0xF) - (v & 0xF) - c < 0 else 0) | (0x10 if r < 0 else 0)
+            cpu._a = r & 0xFF
+        def and_(v):
+            cpu._a &= v
+            cpu._f = 0x20 if cpu._a else 0xA0
+        def xor(v):
+            cpu._a ^= v
+            cpu._f = 0 if cpu._a else 0x80
+        def or_(v):
+            cpu._a |= v
+            cpu._f = 0 if cpu._a else 0x80
+        def cp(v):
+            a = cpu._a
+            r = a - v
+            cpu._f = (0 if r & 0xFF else 0x80) | 0x40 | (0x20 if (a & 0xF) < (v & 0xF) else 0) | (0x10 if r < 0 else 0)
+        alu = [add, adc, sub, sbc, and_, xor, or_, cp]
+
+        # Rotaciones y desplazamientos ($CB), en el orden de Assembler._rot
+        def rlc(v):
+            c = v >> 7
+            r = ((v << 1) | c) & 0xFF
+            cpu._f = (0 if r else 0x80) | (c << 4)
+            return r
+        def rrc(v):
+            c = v & 1
+            r = (v >> 1) | (c << 7)
+            cpu._f = (0 if r else 0x80) | (c << 4)
+            return r
+        def rl(v):
+            c = v >> 7
+            r = ((v << 1) | ((cpu._f >> 4) & 1)) & 0xFF
+            cpu._f = (0 if r else 0x80) | (c << 4)
+            return r
+        def rr(v):
+            c = v & 1
+            r = (v >> 1) | ((cpu._f & 0x10) << 3)
+            cpu._f = (0 if r else 0x80) | (c << 4)
+            return r
+        def sla(v):
+            c = v >> 7
+            r = (v << 1) & 0xFF
+            cpu._f = (0 if r else 0x80) | (c << 4)
+            return r
+        def sra(v):
+            c = v & 1
+            r = (v >> 1) | (v & 0x80)
+            cpu._f = (0 if r else 0x80) | (c << 4)
+            return r
+        def swap(v):
+            r = ((v & 0x0F) << 4) | (v >> 4)
+            cpu._f = 0 if r else 0x80
+            return r
+        def srl(v):
+            c = v & 1
+            r = v >> 1
+            cpu._f = (0 if r else 0x80) | (c << 4)
+            return r
+        rot = [rlc, rrc, rl, rr, sla, sra, swap, srl]
+
+        def make_ld_r_r(set_d, get_s, cycles):
+            def op():
+                set_d(get_s())
+                return cycles
+            return op
+        def make_ld_r_n(set_d, cycles):
+            def op():
+                set_d(fetch())
+                return cycles
+            return op
+        def make_inc_r(get_d, set_d, cycles):
+            def op():
+                r = (get_d() + 1) & 0xFF
+                set_d(r)
+                cpu._f = (cpu._f & 0x10) | (0 if r else 0x80) | (0 if r & 0x0F else 0x20)
+                return cycles
+            return op
+        def make_dec_r(get_d, set_d, cycles):
+            def op():
+                r = (get_d() - 1) & 0xFF
+                set_d(r)
+                cpu._f = (cpu._f & 0x10) | (0 if r else 0x80) | 0x40 | (0x20 if r & 0x0F == 0x0F else 0)
+                return cycles
+            return op
+        def make_alu_r(fn, get_s, cycles):
+            def op():
+                fn(get_s())
+                return cycles
+            return op
+        def make_alu_n(fn):
+            def op():
+                fn(fetch())
+                return 8
+            return op
+        def make_ld_rr_nn(set_rr):
+            def op():
+                set_rr(fetch16())
+                return 12
+            return op
+        def make_inc_rr(get_rr, set_rr):
+            def op():
+                set_rr((get_rr() + 1) & 0xFFFF)
+                return 8
+            return op
+        def make_dec_rr(get_rr, set_rr):
+            def op():
+                set_rr((get_rr() - 1) & 0xFFFF)
+                return 8
+            return op
+        def make_add_hl_rr(get_rr):
+            def op():
+                hl = get_hl()
+                v = get_rr()
+                r = hl + v
+                cpu._f = (cpu._f & 0x80) | (0x20 if (hl & 0xFFF) + (v & 0xFFF) > 0xFFF else 0) | (0x10 if r > 0xFFFF else 0)
+                set_hl(r & 0xFFFF)
+                return 8
+            return op
+        def make_push(get_rr):
+            def op():
+                push(get_rr())
+                return 16
+            return op
+        def make_pop(set_rr):
+            def op():
+                set_rr(pop())
+                return 12
+            return op
+        def make_ld_p_a(get_rr):
+            def op():
+                mem.poke(get_rr(), cpu._a)
+                return 8
+            return op
+        def make_ld_a_p(get_rr):
+            def op():
+                cpu._a = mem.peek(get_rr())
+                return 8
+            return op
+        def make_jr_cc(cond):
+            def op():
+                e = fetch_signed()
+                if cond():
+                    cpu._pc = (cpu._pc + e) & 0xFFFF
+                    return 12
+                return 8
+            return op
+        def make_jp_cc(cond):
+            def op():
+                addr = fetch16()
+                if cond():
+                    cpu._pc = addr
+                    return 16
+                return 12
+            return op
+        def make_call_cc(cond):
+            def op():
+                addr = fetch16()
+                if cond():
+                    push(cpu._pc)
+                    cpu._pc = addr
+                    return 24
+                return 12
+            return op
+        def make_ret_cc(cond):
+            def op():
+                if cond():
+                    cpu._pc = pop()
+                    return 20
+                return 8
+            return op
+        def make_rst(vector):
+            def op():
+                push(cpu._pc)
+                cpu._pc = vector
+                return 16
+            return op
+        def make_rot_r(fn, get_d, set_d, cycles):
+            def op():
+                set_d(fn(get_d()))
+                return cycles
+            return op
+        def make_bit(mask, get_d, cycles):
+            def op():
+                cpu._f = (cpu._f & 0x10) | 0x20 | (0 if get_d() & mask else 0x80)
+                return cycles
+            return op
+        def make_res(mask, get_d, set_d, cycles):
+            def op():
+                set_d(get_d() & ~mask & 0xFF)
+                return cycles
+            return op
+        def make_set(mask, get_d, set_d, cycles):
+            def op():
+                set_d(get_d() | mask)
+                return cycles
+            return op
+
+        def nop():
+            return 4
+        def illegal():
+            cpu.locked = True
+            cpu.halted = True
+            cpu.ime = False
+            cpu._ei_pending = False
+            cpu._pc = (cpu._pc - 1) & 0xFFFF
+            return 4
+        def halt():
+            cpu.halted = True
+            return 4
+        def stop():
+            fetch()
+            return 4
+        def di():
+            cpu.ime = False
+            cpu._ei_pending = False
+            return 4
+        def ei():
+            cpu._ei_pending = True
+            return 4
+        def rlca():
+            cpu._a = rlc(cpu._a)
+            cpu._f &= 0x10
+            return 4
+        def rrca():
+            cpu._a = rrc(cpu._a)
+            cpu._f &= 0x10
+            return 4
+        def rla():
+            cpu._a = rl(cpu._a)
+            cpu._f &= 0x10
+            return 4
+        def rra():
+            cpu._a = rr(cpu._a)
+            cpu._f &= 0x10
+            return 4
+        def daa():
+            a = cpu._a
+            f = cpu._f
+            if f & 0x40:
+                if f & 0x10:
+                    a -= 0x60
+                if f & 0x20:
+                    a -= 0x06
+            else:
+                if f & 0x10 or a > 0x99:
+                    a += 0x60
+                    f |= 0x10
+                if f & 0x20 or (a & 0x0F) > 0x09:
+                    a += 0x06
+            a &= 0xFF
+            cpu._a = a
+            cpu._f = (f & 0x50) | (0 if a else 0x80)
+            return 4
+        def cpl():
+            cpu._a ^= 0xFF
+            cpu._f |= 0x60
+            return 4
+        def scf():
+            cpu._f = (cpu._f & 0x80) | 0x10
+            return 4
+        def ccf():
+            cpu._f = (cpu._f & 0x90) ^ 0x10
+            return 4
+        def ld_nn_sp():
+            addr = fetch16()
+            mem.poke(addr, cpu._sp & 0xFF)
+            mem.poke((addr + 1) & 0xFFFF, cpu._sp >> 8)
+            return 20
+        def jr():
+            e = fetch_signed()
+            cpu._pc = (cpu._pc + e) & 0xFFFF
+            return 12
+        def ldi_hl_a():
+            hl = get_hl()
+            mem.poke(hl, cpu._a)
+            set_hl((hl + 1) & 0xFFFF)
+            return 8
+        def ldi_a_hl():
+            hl = get_hl()
+            cpu._a = mem.peek(hl)
+            set_hl((hl + 1) & 0xFFFF)
+            return 8
+        def ldd_hl_a():
+            hl = get_hl()
+            mem.poke(hl, cpu._a)
+            set_hl((hl - 1) & 0xFFFF)
+            return 8
+        def ldd_a_hl():
+            hl = get_hl()
+            cpu._a = mem.peek(hl)
+            set_hl((hl - 1) & 0xFFFF)
+            return 8
+        def jp():
+            cpu._pc = fetch16()
+            return 16
+        def jp_hl():
+            cpu._pc = get_hl()
+            return 4
+        def call():
+            addr = fetch16()
+            push(cpu._pc)
+            cpu._pc = addr
+            return 24
+        def ret():
+            cpu._pc = pop()
+            return 16
+        def reti():
+            cpu._pc = pop()
+            cpu.ime = True
+            return 16
+        def ldh_n_a():
+            mem.poke(0xFF00 | fetch(), cpu._a)
+            return 12
+        def ldh_a_n():
+            cpu._a = mem.peek(0xFF00 | fetch())
+            return 12
+        def ld_c_a():
+            mem.poke(0xFF00 | cpu._c, cpu._a)
+            return 8
+        def ld_a_c():
+            cpu._a = mem.peek(0xFF00 | cpu._c)
+            return 8
+        def ld_nn_a():
+            mem.poke(fetch16(), cpu._a)
+            return 16
+        def ld_a_nn():
+            cpu._a = mem.peek(fetch16())
+            return 16
+        def sp_plus_e():
+            # Flags calculados sobre el byte bajo, como una suma de 8 bits
+            sp = cpu._sp
+            e = fetch()
+            cpu._f = (0x20 if (sp & 0x0F) + (e & 0x0F) > 0x0F else 0) | (0x10 if (sp & 0xFF) + e > 0xFF else 0)
+            return (sp + (e - 0x100 if e & 0x80 else e)) & 0xFFFF
+        def add_sp_e():
+            cpu._sp = sp_plus_e()
+            return 16
+        def ld_hl_sp_e():
+            set_hl(sp_plus_e())
+            return 12
+        def ld_sp_hl():
+            cpu._sp = get_hl()
+            return 8
+        def prefix_cb():
+            return cpu._cb_ops[fetch()]()
+
+        ops = [illegal] * 256
+        cb = [None] * 256
+        for d in range(8):
+            for s in range(8):
+                ops[0x40 | (d << 3) | s] = make_ld_r_r(set8[d], get8[s], 8 if d == 6 or s == 6 else 4)
+            ops[0x06 | (d << 3)] = make_ld_r_n(set8[d], 12 if d == 6 else 8)
+            ops[0x04 | (d << 3)] = make_inc_r(get8[d], set8[d], 12 if d == 6 else 4)
+            ops[0x05 | (d << 3)] = make_dec_r(get8[d], set8[d], 12 if d == 6 else 4)
+        for code in range(8):
+            for s in range(8):
+                ops[0x80 | (code << 3) | s] = make_alu_r(alu[code], get8[s], 8 if s == 6 else 4)
+                cb[(code << 3) | s] = make_rot_r(rot[code], get8[s], set8[s], 16 if s == 6 else 8)
+                mask = 1 << code
+                cb[0x40 | (code << 3) | s] = make_bit(mask, get8[s], 12 if s == 6 else 8)
+                cb[0x80 | (code << 3) | s] = make_res(mask, get8[s], set8[s], 16 if s == 6 else 8)
+                cb[0xC0 | (code << 3) | s] = make_set(mask, get8[s], set8[s], 16 if s == 6 else 8)
+            ops[0xC6 | (code << 3)] = make_alu_n(alu[code])
+            ops[0xC7 | (code << 3)] = make_rst(code << 3)
+        for code in range(4):
+            ops[0x01 | (code << 4)] = make_ld_rr_nn(set16[code])
+            ops[0x03 | (code << 4)] = make_inc_rr(get16[code], set16[code])
+            ops[0x0B | (code << 4)] = make_dec_rr(get16[code], set16[code])
+            ops[0x09 | (code << 4)] = make_add_hl_rr(get16[code])
+            ops[0xC1 | (code << 4)] = make_pop(set16_3[code])
+            ops[0xC5 | (code << 4)] = make_push(get16_3[code])
+            ops[0x20 | (code << 3)] = make_jr_cc(conds[code])
+            ops[0xC0 | (code << 3)] = make_ret_cc(conds[code])
+            ops[0xC2 | (code << 3)] = make_jp_cc(conds[code])
+            ops[0xC4 | (code << 3)] = make_call_cc(conds[code])
+        for code in range(2):
+            ops[0x02 | (code << 4)] = make_ld_p_a(get16[code])
+            ops[0x0A | (code << 4)] = make_ld_a_p(get16[code])
+        for code, fn in [
+                (0x00, nop), (0x07, rlca), (0x08, ld_nn_sp), (0x0F, rrca),
+                (0x10, stop), (0x17, rla), (0x18, jr), (0x1F, rra),
+                (0x22, ldi_hl_a), (0x27, daa), (0x2A, ldi_a_hl), (0x2F, cpl),
+                (0x32, ldd_hl_a), (0x37, scf), (0x3A, ldd_a_hl), (0x3F, ccf),
+                (0x76, halt), (0xC3, jp), (0xC9, ret), (0xCB, prefix_cb),
+                (0xCD, call), (0xD9, reti), (0xE0, ldh_n_a), (0xE2, ld_c_a),
+                (0xE8, add_sp_e), (0xE9, jp_hl), (0xEA, ld_nn_a), (0xF0, ldh_a_n),
+                (0xF2, ld_a_c), (0xF3, di), (0xF8, ld_hl_sp_e), (0xF9, ld_sp_hl),
+                (0xFA, ld_a_nn), (0xFB, ei),
+                ]:
+            ops[code] = fn
+        for code in (0xD3, 0xDB, 0xDD, 0xE3, 0xE4, 0xEB, 0xEC, 0xED, 0xF4, 0xFC, 0xFD):
+            ops[code] = illegal
+        return ops, cb
@@ -0,0 +1,191 @@
+'''Breakpoints and watchpoints'''
+
+from scheduler import Event
+
+class Break(Exception):
+    """Raised out of `Cpu.step` when a breakpoint or watchpoint is hit.
+
+    `kind` is 'break', 'read' or 'write'; `addr` the breakpoint or watched address,
+    `value` the byte read or written (None for breakpoints) and `bank` the ROM
+    bank mapped at `addr`.
+    """
+    def __init__(self, kind, addr, value=None, bank=None):
+        Exception.__init__(self, f'{kind} at {bank}:{addr:04X}' if bank is not None else f'{kind} at {addr:04X}')
+        self.kind = kind
+        self.addr = addr
+        self.value = value
+        self.bank = bank
+
+class Debugger:
+    """Breakpoints (`break_at`) and watchpoints (`watch`) on a `System`.
+
+    Nothing is checked per access or per instruction: only the 256-byte pages with
+    a breakpoint or watchpoint get their `Memory` opcode fetch, read or write
+    handler replaced by a trap, which checks the address and calls the original
+    handler. Pages go back to their original handler when their last breakpoint or
+    watchpoint is removed.
+
+    A breakpoint traps opcode fetches only, so operands and data never hit it. It
+    stops before the instruction runs: the fetch raises `Break` with the CPU as it
+    was before the step, and running again continues from it.
+    A watchpoint stops after the instruction that made the access, through an
+    event due at once, so the CPU never stops halfway through an instruction.
+    Reads while OAM DMA locks the bus return $FF and do not trap.
+    """
+    def __init__(self, system):
+        self.cpu = system.cpu
+        self.memory = system.memory
+        self.scheduler = self.cpu.scheduler
+        # Dirección -> bancos con punto de ruptura en ella (None: cualquiera)
+        self.breakpoints = {}
+        # Dirección -> 'r', 'w' o 'rw'
+        self.watches = {}
+        # Página -> manejador original, de las páginas con trampa
+        self._fetches = {}
+        self._reads = {}
+        self._writes = {}
+        # Ciclo en que saltó el último punto de ruptura
+        self._break_cycles = -1
+        self._hit = None
+        self._stop = Event('debugger', self._on_stop)
+
+    def break_at(self, bank, pc):
+        """Stop before running the instruction at `pc` with ROM bank `bank` mapped there (None: any bank)."""
+        banks = self.breakpoints.get(pc)
+        if banks is None:
+            banks = []
+            self.breakpoints[pc] = banks
+        if bank not in banks:
+            banks.append(bank)
+        self._update_page(pc >> 8)
+
+    def clear_break(self, bank, pc):
+        banks = self.breakpoints.get(pc)
+        if banks is not None and bank in banks:
+            banks.remove(bank)
+            if not len(banks):
+                del self.breakpoints[pc]
+            self._update_page(pc >> 8)
+
+    def watch(self, addr, rw='w'):
+        """Stop after any instruction that reads ('r'), writes ('w') or does either ('rw') at `addr`."""
+        if rw not in ('r', 'w', 'rw'):
+            raise ValueError(f'Unknown access {rw!r}')
+        self.watches[addr] = rw
+        self._update_page(addr >> 8)
+
+    def unwatch(self, addr):
+        if addr in self.watches:
+            del self.watches[addr]
+            self._update_page(addr >> 8)
+
+    def clear(self):
+        """Remove every breakpoint and watchpoint."""
+        pages = [addr >> 8 for addr in self.breakpoints] + [addr >> 8 for addr in self.watches]
+        self.breakpoints = {}
+        self.watches = {}
+        for page in pages:
+            self._update_page(page)
+        self._hit = None
+        self.scheduler.cancel(self._stop)
+
+    def _read_table(self, page):
+        # Con el bus bloqueado, los manejadores de verdad están guardados aparte, salvo
+        # los de HRAM e I/O, que lock_bus no cambia
+        memory = self.memory
+        return memory._unlocked_read if memory._unlocked_read is not None and page < 0xFF else memory._read
+
+    def _fetch_table(self, page):
+        memory = self.memory
+        return memory._unlocked_fetch if memory._unlocked_fetch is not None and page < 0xFF else memory._fetch
+
+    def _update_page(self, page):
+        fetches = False
+        reads = False
+        writes = False
+        for addr in self.breakpoints:
+            if addr >> 8 == page:
+                fetches = True
+        for addr in self.watches:
+            if addr >> 8 == page:
+                reads = reads or 'r' in self.watches[addr]
+                writes = writes or 'w' in self.watches[addr]
+        # Leer un código de operación también es una lectura para los puntos de vigilancia
+        self._trap(page, fetches or reads, self._fetches, self._fetch_table(page), self._make_fetch_trap)
+        self._trap(page, reads, self._reads, self._read_table(page), self._make_read_trap)
+        self._trap(page, writes, self._writes, self.memory._write, self._make_write_trap)
+
+    def _trap(self, page, needed, saved, table, make_trap):
+        if needed and page not in saved:
+            saved[page] = table[page]
+            table[page] = make_trap(table[page])
+        elif not needed and page in saved:
+            table[page] = saved.pop(page)
+
+    def _bank(self, addr):
+        return self.memory.bank_at(addr) if addr < 0x8000 else None
+
+    def _make_fetch_trap(self, fetch):
+        debugger = self
+        cpu = self.cpu
+
+        def trap(addr):
+            banks = debugger.breakpoints.get(addr)
+            # Al volver a ejecutar tras parar el ciclo es el mismo, y el punto no salta otra vez
+            if banks is not None and cpu.cycles != debugger._break_cycles:
+                bank = debugger._bank(addr)
+                if None in banks or bank in banks:
+                    debugger._break_cycles = cpu.cycles
+                    debugger._undo_fetch(addr)
+                    raise Break('break', addr, None, bank)
+            value = fetch(addr)
+            rw = debugger.watches.get(addr)
+            if rw is not None and 'r' in rw:
+                debugger._watch_hit('read', addr, value)
+            return value
+
+        return trap
+
+    def _make_read_trap(self, read):
+        debugger = self
+
+        def trap(addr):
+            value = read(addr)
+            rw = debugger.watches.get(addr)
+            if rw is not None and 'r' in rw:
+                debugger._watch_hit('read', addr, value)
+            return value
+
+        return trap
+
+    def _make_write_trap(self, write):
+        debugger = self
+
+        def trap(addr, value):
+            write(addr, value)
+            rw = debugger.watches.get(addr)
+            if rw is not None and 'w' in rw:
+                debugger._watch_hit('write', addr, value)
+
+        return trap
+
+    def _undo_fetch(self, addr):
+        cpu = self.cpu
+        cpu._pc = addr
+        # Si IME está activo con una interrupción pendiente, este paso venía de EI
+        # (si no, se habría atendido la interrupción): se deja EI pendiente otra vez
+        io = self.memory.io
+        if cpu.ime and io[0xFF] & io[0x0F] & 0x1F:
+            cpu.ime = False
+            cpu._ei_pending = True
+
+    def _watch_hit(self, kind, addr, value):
+        if self._hit is None:
+            self._hit = Break(kind, addr, value, self._bank(addr))
+            # Se para al acabar la instrucción en curso
+            self.scheduler.schedule(self._stop, self.cpu.cycles)
+
+    def _on_stop(self, time):
+        hit = self._hit
+        self._hit = None
+        raise hit
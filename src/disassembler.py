@@ -0,0 +1,209 @@
+"""
+Disassembler
+
+The decode tables are built at import time by running the encoding rules of the
+`Assembler` backwards, so both always agree on opcodes and register codes.
+"""
+
+from assembler import Assembler
+
+# Tipos de operando
+_NONE = 0
+_D8 = 1      # n
+_D16 = 2     # nn
+_REL = 3     # e (destino de un salto relativo)
+
+def _reverse(table):
+    return {v: k for k, v in table.items()}
+
+def _signed(n):
+    return n - 0x100 if n & 0x80 else n
+
+class _Op:
+    def __init__(self, fmt, kind=_NONE):
+        self.kind = kind
+        self.size = (1, 2, 3, 2)[kind]
+        self.fmt = fmt
+        if kind == _NONE:
+            self.text = fmt
+        elif kind == _D8:
+            # Se precalculan las 256 variantes del operando
+            self.text = [fmt.replace('{n}', f'${n:02X}').replace('{s}', f'{"-" if n & 0x80 else "+"}${abs(_signed(n)):02X}')
+                         for n in range(256)]
+        else:
+            self.text = fmt.replace('{nn}', '${:04X}').replace('{e}', '${:04X}')
+
+def _build_tables():
+    r8 = _reverse(Assembler._destination)
+    cc = _reverse(Assembler._cc_code)
+    r16_1 = _reverse(Assembler._r16_1)
+    r16_2 = _reverse(Assembler._r16_2)
+    r16_3 = _reverse(Assembler._r16_3)
+    ops = [None] * 256
+    cb = [None] * 256
+
+    for d1 in range(8):
+        for d2 in range(8):
+            ops[0x40 | (d1 << 3) | d2] = _Op(f'LD {r8[d1]},{r8[d2]}')
+        ops[0x06 | (d1 << 3)] = _Op(f'LD {r8[d1]},{{n}}', _D8)
+        ops[0x04 | (d1 << 3)] = _Op(f'INC {r8[d1]}')
+        ops[0x05 | (d1 << 3)] = _Op(f'DEC {r8[d1]}')
+    for code, name in enumerate(Assembler._alu):
+        for d in range(8):
+            ops[0x80 | (code << 3) | d] = _Op(f'{name} A,{r8[d]}')
+        ops[0xC6 | (code << 3)] = _Op(f'{name} A,{{n}}', _D8)
+    for code, name in enumerate(Assembler._rot):
+        for d in range(8):
+            cb[(code << 3) | d] = _Op(f'{name} {r8[d]}')
+    for code in range(1, 4):
+        name = Assembler._bit_ops[code]
+        for n in range(8):
+            for d in range(8):
+                cb[(code << 6) | (n << 3) | d] = _Op(f'{name} {n},{r8[d]}')
+    for code, name in r16_2.items():
+        ops[0x01 | (code << 4)] = _Op(f'LD {name},{{nn}}', _D16)
+        ops[0x03 | (code << 4)] = _Op(f'INC {name}')
+        ops[0x0B | (code << 4)] = _Op(f'DEC {name}')
+        ops[0x09 | (code << 4)] = _Op(f'ADD HL,{name}')
+    for code, name in r16_3.items():
+        ops[0xC1 | (code << 4)] = _Op(f'POP {name}')
+        ops[0xC5 | (code << 4)] = _Op(f'PUSH {name}')
+    for code, name in r16_1.items():
+        ops[0x02 | (code << 4)] = _Op(f'LD ({name}),A')
+        ops[0x0A | (code << 4)] = _Op(f'LD A,({name})')
+    for code, name in cc.items():
+        ops[0x20 | (code << 3)] = _Op(f'JR {name},{{e}}', _REL)
+        ops[0xC0 | (code << 3)] = _Op(f'RET {name}')
+        ops[0xC2 | (code << 3)] = _Op(f'JP {name},{{nn}}', _D16)
+        ops[0xC4 | (code << 3)] = _Op(f'CALL {name},{{nn}}', _D16)
+    for n in Assembler._vec:
+        ops[0xC7 | n] = _Op(f'RST ${n:02X}')
+    for name, code in Assembler._implied.items():
+        ops[code] = _Op(name)
+    ops[0x10] = _Op('STOP', _D8)  # STOP ocupa dos bytes
+
+    for code, text, kind in [
+            (0x08, 'LD ({nn}),SP', _D16),
+            (0x18, 'JR {e}', _REL),
+            (0x22, 'LD (HL+),A', _NONE),
+            (0x2A, 'LD A,(HL+)', _NONE),
+            (0x32, 'LD (HL-),A', _NONE),
+            (0x3A, 'LD A,(HL-)', _NONE),
+            (0xC3, 'JP {nn}', _D16),
+            (0xC9, 'RET', _NONE),
+            (0xCD, 'CALL {nn}', _D16),
+            (0xE0, 'LDH ({n}),A', _D8),
+            (0xE2, 'LD (C),A', _NONE),
+            (0xE8, 'ADD SP,{s}', _D8),
+            (0xE9, 'JP (HL)', _NONE),
+            (0xEA, 'LD ({nn}),A', _D16),
+            (0xF0, 'LDH A,({n})', _D8),
+            (0xF2, 'LD A,(C)', _NONE),
+            (0xF8, 'LD HL,SP{s}', _D8),
+            (0xF9, 'LD SP,HL', _NONE),
+            (0xFA, 'LD A,({nn})', _D16),
+            ]:
+        ops[code] = _Op(text, kind)
+
+    for code in range(256):
+        if ops[code] is None:
+            # Códigos no usados por la CPU
+            ops[code] = _Op(f'.byte ${code:02X}')
+    # El prefijo se decodifica aparte, con la tabla cb
+    ops[0xCB] = None
+    return ops, cb
+
+opcodes, cb_opcodes = _build_tables()
+
+def decode(data, pos, addr=None):
+    """Decode the instruction at data[pos], assumed to be at `addr`. Returns (text, size)."""
+    if addr is None:
+        addr = pos
+    n = len(data) - pos
+    code = data[pos]
+    if code == 0xCB:
+        if n < 2:
+            return (f'.byte ${code:02X}', 1)
+        return (cb_opcodes[data[pos + 1]].text, 2)
+    op = opcodes[code]
+    if op.size > n:
+        return (f'.byte ${code:02X}', 1)
+    kind = op.kind
+    if kind == _NONE:
+        return (op.text, 1)
+    elif kind == _D8:
+        return (op.text[data[pos + 1]], 2)
+    elif kind == _D16:
+        return (op.text.format(data[pos + 1] | (data[pos + 2] << 8)), 3)
+    else:
+        return (op.text.format((addr + 2 + _signed(data[pos + 1])) & 0xFFFF), 2)
+
+def disassemble(data, origin=0, start=0, end=None):
+    """Linear sweep of data[start:end] mapped at address `origin`.
+
+    Returns a list of (addr, size, text) tuples.
+    """
+    if end is None:
+        end = len(data)
+    out = []
+    append = out.append
+    ops = opcodes
+    cb = cb_opcodes
+    pos = start
+    base = origin - start
+    while pos < end:
+        code = data[pos]
+        op = ops[code]
+        if op is None:
+            if pos + 1 < end:
+                append((base + pos, 2, cb[data[pos + 1]].text))
+                pos += 2
+                continue
+            op = _Op(f'.byte ${code:02X}')
+        elif pos + op.size > end:
+            op = _Op(f'.byte ${code:02X}')
+        kind = op.kind
+        if kind == _NONE:
+            append((base + pos, 1, op.text))
+            pos += 1
+        elif kind == _D8:
+            append((base + pos, 2, op.text[data[pos + 1]]))
+            pos += 2
+        elif kind == _D16:
+            append((base + pos, 3, op.text.format(data[pos + 1] | (data[pos + 2] << 8))))
+            pos += 3
+        else:
+            addr = base + pos
+            append((addr, 2, op.text.format((addr + 2 + _signed(data[pos + 1])) & 0xFFFF)))
+            pos += 2
+    return out
+
+class Disassembler:
+    """Disassembles a ROM image bank by bank, keeping the output of each bank."""
+    bank_size = 0x4000
+
+    def __init__(self, rom):
+        self.rom = rom
+        self._banks = {}
+
+    @property
+    def bank_count(self):
+        return (len(self.rom) + self.bank_size - 1) // self.bank_size
+
+    def bank(self, n):
+        """List of (addr, size, text) for ROM bank `n`, addressed as the CPU sees it."""
+        lines = self._banks.get(n)
+        if lines is None:
+            if n < 0 or n >= self.bank_count:
+                raise IndexError(f'ROM bank out of range: {n}')
+            start = n * self.bank_size
+            lines = disassemble(self.rom, 0 if n == 0 else 0x4000, start, min(start + self.bank_size, len(self.rom)))
+            self._banks[n] = lines
+        return lines
+
+    def listing(self, n):
+        """Text listing of ROM bank `n`, one instruction per line."""
+        rom = self.rom
+        offset = n * self.bank_size - (0 if n == 0 else 0x4000)
+        return '\n'.join(f'{n:02X}:{addr:04X}  {rom[offset + addr:offset + addr + size].hex().upper():<6}  {text}'
+                         for addr, size, text in self.bank(n))
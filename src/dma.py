@@ -0,0 +1,129 @@
+'''OAM DMA and CGB HDMA/GDMA'''
+
+from scheduler import Event
+
+# La DMA a OAM dura 160 ciclos de máquina más uno de arranque
+OAM_DMA_CYCLES = 644
+# Ciclos que se detiene la CPU por cada bloque de 16 bytes de HDMA/GDMA
+HDMA_BLOCK_CYCLES = 32
+
+class Dma:
+    """DMA transfers done as bulk copies between the `Memory` buffers.
+
+    OAM DMA copies its 160 bytes when FF46 is written and locks the bus (only HRAM
+    and I/O can be read) until a scheduler event marks its end. In CGB mode, a
+    general purpose DMA copies everything at once and stalls the CPU for its
+    duration; an HBlank DMA copies one 16-byte block per HBlank event of the PPU.
+    """
+    def __init__(self, cpu, ppu):
+        self.cpu = cpu
+        self.memory = cpu.memory
+        self.scheduler = cpu.scheduler
+        self.ppu = ppu
+        self._oam_end = Event('oam dma end', self._on_oam_end)
+        memory = self.memory
+        memory.map_io(0xFF46, None, self._write_dma)
+        self.hdma_source = 0
+        self.hdma_destination = 0
+        # Bloques pendientes de la HDMA en curso (o cancelada)
+        self._blocks = 0
+        self.hblank_active = False
+        if memory.cgb:
+            memory.map_io(0xFF51, self._read_unused, self._write_hdma1)
+            memory.map_io(0xFF52, self._read_unused, self._write_hdma2)
+            memory.map_io(0xFF53, self._read_unused, self._write_hdma3)
+            memory.map_io(0xFF54, self._read_unused, self._write_hdma4)
+            memory.map_io(0xFF55, self._read_hdma5, self._write_hdma5)
+            ppu.hblank_callback = self._on_hblank
+
+    @property
+    def oam_active(self):
+        return self._oam_end.scheduled
+
+    def save_state(self):
+        return {
+            'hdma_source': self.hdma_source, 'hdma_destination': self.hdma_destination,
+            'blocks': self._blocks, 'hblank_active': self.hblank_active, 'oam_end': self._oam_end.time,
+        }
+
+    def load_state(self, state):
+        self.hdma_source = state['hdma_source']
+        self.hdma_destination = state['hdma_destination']
+        self._blocks = state['blocks']
+        self.hblank_active = state['hblank_active']
+        self.scheduler.restore(self._oam_end, state['oam_end'])
+
+    def _write_dma(self, addr, value):
+        memory = self.memory
+        memory.io[0x46] = value
+        # Las fuentes de $E000 en adelante se leen en la WRAM, como en el hardware
+        source = value << 8
+        if source >= 0xE000:
+            source -= 0x2000
+        memory.unlock_bus()
+        memory.copy(memory.oam, 0, source, 0xA0)
+        self.ppu.oam_changed()
+        memory.lock_bus()
+        self.scheduler.schedule(self._oam_end, self.cpu.cycles + OAM_DMA_CYCLES)
+
+    def _on_oam_end(self, time):
+        self.memory.unlock_bus()
+
+    def _read_unused(self, addr):
+        return 0xFF
+
+    def _write_hdma1(self, addr, value):
+        self.hdma_source = (value << 8) | (self.hdma_source & 0xFF)
+
+    def _write_hdma2(self, addr, value):
+        self.hdma_source = (self.hdma_source & 0xFF00) | (value & 0xF0)
+
+    def _write_hdma3(self, addr, value):
+        self.hdma_destination = ((value & 0x1F) << 8) | (self.hdma_destination & 0xFF)
+
+    def _write_hdma4(self, addr, value):
+        self.hdma_destination = (self.hdma_destination & 0x1F00) | (value & 0xF0)
+
+    def _read_hdma5(self, addr):
+        if self.hblank_active:
+            return (self._blocks - 1) & 0x7F
+        if self._blocks:
+            # HDMA cancelada: bit 7 a 1 y los bloques que quedaban
+            return 0x80 | ((self._blocks - 1) & 0x7F)
+        return 0xFF
+
+    def _write_hdma5(self, addr, value):
+        if self.hblank_active and not value & 0x80:
+            self.hblank_active = False
+            return
+        self._blocks = (value & 0x7F) + 1
+        if value & 0x80:
+            self.hblank_active = True
+        else:
+            blocks = self._blocks
+            self._transfer(blocks)
+            self._blocks = 0
+            self.cpu.cycles += blocks * HDMA_BLOCK_CYCLES
+
+    def _transfer(self, blocks):
+        """Copy `blocks` 16-byte blocks into the current VRAM bank. Returns how many fitted."""
+        memory = self.memory
+        dst = self.hdma_destination
+        # La transferencia se detiene al llegar al final de la VRAM
+        blocks = min(blocks, (0x2000 - dst) >> 4)
+        length = blocks * 16
+        memory.copy(memory.vram, memory._vram_offset + dst, self.hdma_source, length)
+        self.hdma_source = (self.hdma_source + length) & 0xFFF0
+        self.hdma_destination = (dst + length) & 0x1FF0
+        return blocks
+
+    def _on_hblank(self, time):
+        if not self.hblank_active:
+            return
+        if self._transfer(1):
+            self._blocks -= 1
+        else:
+            self._blocks = 0
+        self.cpu.cycles += HDMA_BLOCK_CYCLES
+        if not self._blocks:
+            self.hblank_active = False
@@ -0,0 +1,158 @@
+"""
+Streaming comparison with Gameboy Doctor logs
+
+Reference logs have one line per instruction with the CPU state before running it:
+
+    A:01 F:B0 B:00 C:13 D:00 E:D8 H:01 L:4D SP:FFFE PC:0100 PCMEM:00,C3,13,02
+
+Both our side (a running `Cpu`, or a binary trace from `tracer`) and the
+reference are consumed line by line, reading the log in big chunks, so memory use
+does not depend on the log size. Comparison stops at the first divergence.
+
+Usage: python doctor.py rom.gb reference.log [--context N] [--limit N]
+"""
+
+import itertools
+import sys
+from collections import deque
+
+_hex2 = [f'{n:02X}' for n in range(256)]
+
+_fields = ('A', 'F', 'B', 'C', 'D', 'E', 'H', 'L', 'SP', 'PC', 'PCMEM')
+
+class Divergence:
+    def __init__(self, line, expected, got, context):
+        self.line = line
+        self.expected = expected
+        self.got = got
+        # Líneas de referencia anteriores a la divergencia, que sí coincidieron
+        self.context = context
+
+    @property
+    def fields(self):
+        """Names of the fields that differ."""
+        if self.expected is None or self.got is None:
+            return []
+        expected = parse_line(self.expected)
+        got = parse_line(self.got)
+        return [name for name in _fields if name in expected and name in got and expected[name] != got[name]]
+
+    def __str__(self):
+        lines = [f'Divergence at line {self.line}:']
+        lines.extend('  ' + line for line in self.context)
+        lines.append('- ' + (self.expected or '(end of reference log)'))
+        lines.append('+ ' + (self.got or '(end of trace)'))
+        if self.fields:
+            lines.append('Differs in: ' + ', '.join(self.fields))
+        return '\n'.join(lines)
+
+def parse_line(line):
+    """Fields of a log line as a dict name -> text."""
+    return dict(field.split(':', 1) for field in line.split())
+
+def read_lines(f, chunk_size=0x100000):
+    """Lines of the text file `f`, without line ends, read in chunks of `chunk_size`."""
+    pending = ''
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        if isinstance(chunk, bytes):
+            chunk = chunk.decode('ascii')
+        lines = (pending + chunk).split('\n')
+        pending = lines.pop()
+        for line in lines:
+            line = line.rstrip('\r')
+            if line:
+                yield line
+    pending = pending.rstrip('\r')
+    if pending:
+        yield pending
+
+def state_line(cpu):
+    """Log line for the current state of `cpu`."""
+    h = _hex2
+    peek = cpu.memory.peek
+    pc = cpu._pc
+    sp = cpu._sp
+    return (f'A:{h[cpu._a]} F:{h[cpu._f]} B:{h[cpu._b]} C:{h[cpu._c]} D:{h[cpu._d]} E:{h[cpu._e]} '
+            f'H:{h[cpu._h]} L:{h[cpu._l]} SP:{h[sp >> 8]}{h[sp & 0xFF]} PC:{h[pc >> 8]}{h[pc & 0xFF]} '
+            f'PCMEM:{h[peek(pc)]},{h[peek((pc + 1) & 0xFFFF)]},{h[peek((pc + 2) & 0xFFFF)]},{h[peek((pc + 3) & 0xFFFF)]}')
+
+def cpu_lines(cpu):
+    """Run `cpu`, yielding the log line of every instruction before executing it.
+
+    Steps spent halted or servicing interrupts produce no line, as in the reference logs.
+    """
+    io = cpu.memory.io
+    step = cpu.step
+    while True:
+        if cpu.halted or cpu.ime and io[0xFF] & io[0x0F] & 0x1F:
+            step()
+            continue
+        yield state_line(cpu)
+        step()
+
+def trace_lines(records):
+    """Log lines for TraceRecord from `tracer`. They have no PCMEM field."""
+    h = _hex2
+    for r in records:
+        yield (f'A:{h[r.a]} F:{h[r.f]} B:{h[r.b]} C:{h[r.c]} D:{h[r.d]} E:{h[r.e]} '
+               f'H:{h[r.h]} L:{h[r.l]} SP:{h[r.sp >> 8]}{h[r.sp & 0xFF]} PC:{h[r.pc >> 8]}{h[r.pc & 0xFF]}')
+
+def set_state(cpu, line):
+    """Load the registers of `cpu` from a log line."""
+    fields = parse_line(line)
+    for name in _fields[:-1]:
+        setattr(cpu, name, int(fields[name], 16))
+
+def compare(expected, got, context=8):
+    """Compare two iterables of log lines. Returns None if `got` follows all of `expected`, or a Divergence.
+
+    When a line of `got` has no PCMEM field, the reference PCMEM is ignored.
+    """
+    previous = deque(maxlen=context)
+    got = iter(got)
+    n = 0
+    for exp in expected:
+        n += 1
+        line = next(got, None)
+        if line != exp:
+            if line is None or ' PCMEM:' in line or exp.split(' PCMEM:', 1)[0] != line:
+                return Divergence(n, exp, line, list(previous))
+        previous.append(exp)
+    return None
+
+def main(argv):
+    import argparse
+    from cart import Cart
+    from stubs import Uint8Array
+    from system import System
+    parser = argparse.ArgumentParser(description='Compare the CPU against a Gameboy Doctor log')
+    parser.add_argument('rom')
+    parser.add_argument('log')
+    parser.add_argument('--context', type=int, default=8, help='matching lines shown before the divergence')
+    parser.add_argument('--limit', type=int, help='stop after this many instructions')
+    args = parser.parse_args(argv)
+
+    with open(args.rom, 'rb') as f:
+        system = System(Cart(args.rom, Uint8Array(f.read())))
+    # Gameboy Doctor asume que LY siempre vale $90
+    system.memory.map_io(0xFF44, read=lambda addr: 0x90)
+    with open(args.log, 'rb') as f:
+        expected = read_lines(f)
+        first = next(expected, None)
+        if first is None:
+            print('Empty log')
+            return 1
+        set_state(system.cpu, first)
+        expected = itertools.islice(itertools.chain([first], expected), args.limit)
+        result = compare(expected, cpu_lines(system.cpu), args.context)
+    if result is None:
+        print('No divergence')
+        return 0
+    print(result)
+    return 1
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
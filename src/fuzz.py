@@ -0,0 +1,211 @@
+"""
+Coverage-guided fuzzing
+
+`Coverage` marks the addresses the CPU executes, one byte per ROM address (so
+bank n is the slice n * $4000 of the map) plus one map for code run from RAM.
+Like the profiler it is a `Cpu` hook over its dispatch tables, and each
+instruction only costs an index computation and a byte test.
+
+`Fuzzer` mutates joypad input sequences (one button mask per frame), runs each
+one from a snapshot and keeps in its corpus those that execute something new.
+Exceptions raised by the emulator and inputs that lock the CPU are recorded.
+`fuzz_code` runs random instruction streams put through the `Assembler` and
+reports those that break the round trip or the emulator.
+"""
+
+import random
+import traceback
+
+from cart import Cart
+from roundtrip import random_code, check_round_trip, origin
+from rombuilder import build_rom
+from stubs import Uint8Array
+from system import System
+
+class Coverage:
+    def __init__(self, cpu):
+        self.cpu = cpu
+        memory = cpu.memory
+        self.rom = bytearray(memory._rom_banks * 0x4000)
+        # $8000-$FFFF
+        self.ram = bytearray(0x8000)
+        # Direcciones marcadas por primera vez desde el último `take_new()`
+        self.new = 0
+        self.running = False
+        # Tabla instrumentada de la última tabla recibida, reutilizada en cada start()
+        self._saved = None
+        self._instrumented = None
+
+    def start(self):
+        if self.running:
+            return
+        self.cpu.add_hook(self)
+        self.running = True
+
+    def stop(self):
+        if not self.running:
+            return
+        self.cpu.remove_hook(self)
+        self.running = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def instrument(self, ops, cb_ops, interrupt):
+        if ops is not self._saved:
+            self._saved = ops
+            self._instrumented = self._instrument(ops)
+        return self._instrumented, cb_ops, interrupt
+
+    def _instrument(self, ops):
+        cov = self
+        cpu = self.cpu
+        memory = cpu.memory
+        rom = self.rom
+        ram = self.ram
+
+        # Las instrucciones $CB pasan por el código $CB: no hace falta tocar _cb_ops
+        def make_op(fn):
+            def op():
+                pc = (cpu._pc - 1) & 0xFFFF
+                if pc < 0x4000:
+                    i = memory._rom0_offset + pc
+                    if not rom[i]:
+                        rom[i] = 1
+                        cov.new += 1
+                elif pc < 0x8000:
+                    i = memory._romx_offset + pc
+                    if not rom[i]:
+                        rom[i] = 1
+                        cov.new += 1
+                elif not ram[pc - 0x8000]:
+                    ram[pc - 0x8000] = 1
+                    cov.new += 1
+                return fn()
+            return op
+
+        return [make_op(fn) for fn in ops]
+
+    def take_new(self):
+        """Addresses covered for the first time since the last call."""
+        new = self.new
+        self.new = 0
+        return new
+
+    def bank(self, bank):
+        """Coverage map of ROM bank `bank`: one byte per address, 1 if executed."""
+        return memoryview(self.rom)[bank * 0x4000:(bank + 1) * 0x4000]
+
+    def covered(self):
+        return self.rom.count(1) + self.ram.count(1)
+
+    def banks(self):
+        """Bank -> addresses executed, for the banks with any."""
+        counts = {}
+        for bank in range(len(self.rom) // 0x4000):
+            count = self.bank(bank).tobytes().count(1)
+            if count:
+                counts[bank] = count
+        return counts
+
+class Fuzzer:
+    def __init__(self, system, frames=60, seed=0, corpus=None, render=False):
+        """Fuzz `system` from its current state, with input sequences of up to `frames` frames.
+
+        Scanlines are not drawn unless `render` is set: only the code path matters.
+        """
+        self.system = system
+        system.ppu.rendering = render
+        self.frames = frames
+        self.rng = random.Random(seed)
+        self.snapshot = system.save_state()
+        self.coverage = Coverage(system.cpu)
+        self.corpus = []
+        # (entrada, traza) de las excepciones del emulador
+        self.crashes = []
+        # Entradas que dejan la CPU bloqueada por un código de operación inválido
+        self.locked = []
+        self.runs = 0
+        for inputs in corpus or [[0] * frames]:
+            self.add(list(inputs))
+
+    def execute(self, inputs):
+        """Run `inputs` from the snapshot. Returns how many addresses were covered for the first time."""
+        system = self.system
+        system.load_state(self.snapshot)
+        self.coverage.take_new()
+        self.runs += 1
+        with self.coverage:
+            try:
+                system.run_inputs(inputs)
+            except Exception:
+                self.crashes.append((inputs, traceback.format_exc()))
+        if system.cpu.locked:
+            self.locked.append(inputs)
+        return self.coverage.take_new()
+
+    def add(self, inputs):
+        if self.execute(inputs) or not self.corpus:
+            self.corpus.append(inputs)
+
+    def mutate(self, inputs):
+        rng = self.rng
+        inputs = list(inputs)
+        for _ in range(rng.randint(1, 4)):
+            kind = rng.randrange(5)
+            i = rng.randrange(len(inputs)) if inputs else 0
+            if kind == 0 and inputs:
+                # Cambia un botón en un cuadro
+                inputs[i] ^= 1 << rng.randrange(8)
+            elif kind == 1 and inputs:
+                # Mantiene una combinación durante varios cuadros
+                buttons = rng.randrange(256)
+                for j in range(i, min(len(inputs), i + rng.randint(1, 16))):
+                    inputs[j] = buttons
+            elif kind == 2 and len(inputs) < self.frames:
+                inputs.insert(i, rng.randrange(256))
+            elif kind == 3 and len(inputs) > 1:
+                del inputs[i]
+            else:
+                # Empalme con otra entrada del corpus
+                other = rng.choice(self.corpus)
+                j = rng.randrange(len(other) + 1)
+                inputs = inputs[:i] + other[j:]
+        return inputs[:self.frames] or [0]
+
+    def run(self, iterations):
+        """Fuzz for `iterations` runs. Returns how many entered the corpus."""
+        added = 0
+        for _ in range(iterations):
+            inputs = self.mutate(self.rng.choice(self.corpus))
+            if self.execute(inputs):
+                self.corpus.append(inputs)
+                added += 1
+        return added
+
+def fuzz_code(seed, iterations, count=200, cycles=100000):
+    """Assemble and run random instruction streams (jumps included) in a full `System`.
+
+    Returns (code, problem) for each stream that does not survive the assembler
+    round trip, or that makes the emulator raise an exception.
+    """
+    rng = random.Random(seed)
+    problems = []
+    for _ in range(iterations):
+        code = random_code(rng, count, straight=False)
+        listing, mismatches = check_round_trip(code)
+        if mismatches:
+            problems.append((code, mismatches))
+            continue
+        rom = build_rom({origin + i: b for i, b in enumerate(code)})
+        system = System(Cart('fuzz.gb', Uint8Array(rom)), fast_boot=True)
+        system.cpu.PC = origin
+        try:
+            system.cpu.run(cycles)
+        except Exception:
+            problems.append((code, traceback.format_exc()))
+    return problems
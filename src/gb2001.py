@@ -1,11 +1,82 @@
 '''GB 2001 A GameBoy Emulator Odyssey'''
 
 # __pragma__('skip')
-from stubs import document, console, __new__, FileReader, Uint8Array
+from stubs import window, document, console, __new__, FileReader, Uint8Array, performance
 # __pragma__('noskip')
 
 from cart import Cart
 from system import System
+from battery import BrowserSave
+from graphics import Graphics
+from ppu import FRAME_CYCLES
+from rtc import CLOCK
+
+# ms reales que dura un cuadro de la consola
+FRAME_MS = FRAME_CYCLES * 1000 / CLOCK
+# Cuadros que se emulan como mucho por cada refresco de la pantalla; si aun así no
+# se llega a tiempo real, el emulador va más lento en lugar de acumular retraso
+MAX_FRAMES = 4
+
+class Runner:
+    '''Runs the loaded `System` in real time, one batch of frames per animation frame'''
+    system = None
+    next_time = 0
+    overlay = None
+    overlay_time = 0
+
+    @classmethod
+    def start( cls, system ):
+        if cls.system is None:
+            window.requestAnimationFrame( cls.on_animation_frame )
+        cls.system = system
+        cls.next_time = 0
+        if not cls.overlay.hidden:
+            system.enable_telemetry()
+
+    @classmethod
+    def on_animation_frame( cls, now ):
+        window.requestAnimationFrame( cls.on_animation_frame )
+        system = cls.system
+        if cls.next_time == 0 or now - cls.next_time > MAX_FRAMES * FRAME_MS:
+            cls.next_time = now
+        if now < cls.next_time:
+            return
+        due = min( int( ( now - cls.next_time ) / FRAME_MS ) + 1, MAX_FRAMES )
+        telemetry = system.telemetry
+        for i in range( due ):
+            system.run_frame()
+            # Solo se muestra el último de los cuadros emulados en este refresco
+            if telemetry is not None and i < due - 1:
+                telemetry.skipped()
+        cls.next_time += due * FRAME_MS
+        start = performance.now()
+        Graphics.render( system.ppu.frame )
+        if telemetry is not None:
+            telemetry.rendered( performance.now() - start )
+            if now - cls.overlay_time > 500:
+                cls.overlay_time = now
+                cls.show_telemetry( telemetry.summary() )
+
+    @classmethod
+    def show_telemetry( cls, summary ):
+        cls.overlay.innerText = '\n'.join( [
+            f"{round( summary['fps'], 1 )} FPS, {round( summary['mhz'], 2 )} MHz",
+            f"Frame {round( summary['host'], 2 )} ms: CPU {round( summary['cpu'], 2 )}, "
+            f"PPU {round( summary['ppu'], 2 )}, render {round( summary['render'], 2 )}",
+            f"{round( summary['instructions'] )} instructions, {round( summary['bank_switches'], 1 )} bank switches",
+            f"{round( summary['skipped'] * 100 )}% frames skipped",
+        ] )
+
+    @classmethod
+    def toggle_telemetry( cls ):
+        cls.overlay.hidden = not cls.overlay.hidden
+        if cls.system is None:
+            return
+        # Sin la capa visible no se paga el coste de contar
+        if cls.overlay.hidden:
+            cls.system.disable_telemetry()
+        else:
+            cls.system.enable_telemetry()
 
 def on_fileInput_change(e):
     load_cart(e.target.files[0])
@@ -15,9 +86,14 @@ def init_dom():
     fileInput.addEventListener('change', on_fileInput_change, False)
     openCart = document.getElementById('openCart')
     openCart.addEventListener('click', lambda e: fileInput.click(), False)
+    Runner.overlay = document.getElementById('telemetry')
+    toggle = document.getElementById('toggleTelemetry')
+    toggle.addEventListener('click', lambda e: Runner.toggle_telemetry(), False)
 
 def main():
     init_dom()
+    Graphics.init()
+    Graphics.setup_context()
 
 def on_FileReader_load(e):
     arrayBuffer = e.target.result
@@ -25,7 +101,10 @@ def on_FileReader_load(e):
     rom = __new__(Uint8Array(arrayBuffer, 0, arrayBuffer.length))
     c = Cart(file, rom)
     document.getElementById('cartName').innerText = file
-    s = System(c)
+    s = System(c, fast_boot=True)
+    if c.cart_type.battery:
+        BrowserSave(s.memory, f'{c.title}:{c.checksum}')
+    Runner.start(s)
 
 def load_cart( file ):
     fr = __new__(FileReader())
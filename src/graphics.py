@@ -1,7 +1,7 @@
 '''Graphics and rendering management'''
 
 # __pragma__('skip')
-from stubs import document, Image, console, __new__
+from stubs import document, Image, console, __new__, Uint32Array
 # __pragma__('noskip')
 
 class Graphics:
@@ -11,6 +11,10 @@ class Graphics:
     height = 144
     clear = True
     smooth = False
+    # Lienzo de 160x144 fuera de pantalla: putImageData no respeta la transformación
+    screen = None
+    image = None
+    pixels = None
 
     def init():
         console.log( '[graphics] init' )
@@ -25,11 +29,19 @@ class Graphics:
         cls.context.setTransform( cls.canvas.width / cls.width, 0, 0, cls.canvas.height / cls.height, 0, 0 )
         if cls.clear:
             cls.context.clearRect( 0, 0, cls.width, cls.height )
+        cls.screen = document.createElement( 'canvas' )
+        cls.screen.width = cls.width
+        cls.screen.height = cls.height
+        cls.image = cls.screen.getContext( '2d' ).createImageData( cls.width, cls.height )
+        # Vista de 32 bits sobre los bytes RGBA de la imagen
+        cls.pixels = __new__( Uint32Array( cls.image.data.buffer ) )
 
     @classmethod
-    def render( cls ):
-        # TODO
-        pass
+    def render( cls, frame ):
+        '''Show a frame of packed RGBA words, as produced by `Ppu`'''
+        cls.pixels.set( frame )
+        cls.screen.getContext( '2d' ).putImageData( cls.image, 0, 0 )
+        cls.context.drawImage( cls.screen, 0, 0 )
 
     @classmethod
     def disable_smooth( cls ):
@@ -0,0 +1,114 @@
+"""
+Headless runner
+
+Runs a cart image for a number of frames with no display, as fast as the host
+allows. Battery-backed carts keep their RAM (and MBC3 clock) in a .sav file
+through `SaveFile`, next to the ROM by default, the way the browser front end
+keeps it in localStorage: running the same cart again continues from its save.
+
+With `video` and/or `audio`, the run is recorded through `Capture` as Y4M or raw
+RGBA frames and a WAV file. There is no sound emulation yet, so the WAV holds
+silence paced by the frame clock and stays as long as the video.
+
+Usage: python headless.py rom.gb [--frames N] [--save PATH | --no-save]
+                          [--video PATH [--video-format y4m|rgba]] [--audio PATH]
+"""
+
+import os
+import sys
+
+from capture import Capture
+from cart import Cart
+from ppu import FRAME_CYCLES
+from rtc import CLOCK
+from savefile import SaveFile
+from stubs import Uint8Array
+from system import System
+
+def default_save_path(rom_path):
+    return os.path.splitext(rom_path)[0] + '.sav'
+
+class Headless:
+    def __init__(self, rom_path, save_path=None, video=None, audio=None, video_format='y4m'):
+        """Load the cart image at `rom_path`.
+
+        Battery-backed carts get their RAM from `save_path`, by default the ROM
+        path with a .sav extension; an empty `save_path` keeps it in memory only.
+        Frames are recorded to the file `video` in `video_format` and sound to the
+        WAV file `audio`, when given.
+        """
+        with open(rom_path, 'rb') as f:
+            self.cart = Cart(os.path.basename(rom_path), Uint8Array(f.read()))
+        self.system = System(self.cart, fast_boot=True)
+        self.save = None
+        if save_path is None:
+            save_path = default_save_path(rom_path)
+        if self.cart.cart_type.battery and save_path:
+            self.save = SaveFile(self.system.memory, save_path)
+        self.capture = None
+        if video is not None or audio is not None:
+            self.capture = Capture(video, audio, video_format)
+            self.capture.attach(self.system)
+            if audio is not None:
+                self._attach_silence()
+
+    def _attach_silence(self):
+        # Sin sonido emulado, cada cuadro graba su duración en silencio
+        ppu = self.system.ppu
+        capture = self.capture
+        chained = ppu.vblank_callback
+        block = 2 * capture.channels
+        # Muestras pendientes, en unidades de 1/CLOCK de muestra
+        pending = [0]
+        def on_vblank(time):
+            pending[0] += capture.sample_rate * FRAME_CYCLES
+            samples = pending[0] // CLOCK
+            pending[0] -= samples * CLOCK
+            capture.add_audio(bytes(samples * block))
+            if chained is not None:
+                chained(time)
+        ppu.vblank_callback = on_vblank
+
+    def run(self, frames, buttons=0):
+        """Run `frames` frames holding the joypad button mask `buttons`."""
+        self.system.run_inputs([buttons] * frames)
+
+    def close(self):
+        """Finish the capture files, write the clock to the save file and close it."""
+        capture = self.capture
+        self.capture = None
+        try:
+            if capture is not None:
+                capture.close()
+        finally:
+            if self.save is not None:
+                self.save.close()
+                self.save = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(description='Run a cart image with no display')
+    parser.add_argument('rom')
+    parser.add_argument('--frames', type=int, default=3600, help='frames to run (60 per second)')
+    parser.add_argument('--save', help='save file for battery-backed carts (default: the ROM path with .sav)')
+    parser.add_argument('--no-save', action='store_true', help='do not read or write a save file')
+    parser.add_argument('--video', help='record frames to this file')
+    parser.add_argument('--video-format', choices=('y4m', 'rgba'), default='y4m', help='Y4M stream or raw RGBA frames')
+    parser.add_argument('--audio', help='record sound to this WAV file')
+    args = parser.parse_args(argv)
+
+    save = '' if args.no_save else args.save
+    with Headless(args.rom, save, args.video, args.audio, args.video_format) as runner:
+        runner.run(args.frames)
+        if runner.save is not None:
+            print(f'Saved to {runner.save.path}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
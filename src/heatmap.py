@@ -0,0 +1,230 @@
+"""
+Memory bus heatmap
+
+While running, `BusHeatmap` shadows `Memory.peek`, `Memory.fetch` and
+`Memory.poke` with counting versions, like the profiler does with the CPU
+dispatch tables, so the bus costs nothing extra when it is not being measured.
+It counts reads (opcode fetches included) and writes per 256-byte page and per
+I/O register ($FF00-$FFFF), optionally sampling one access in `sample` (each
+sampled access then counts `sample` times, so totals stay estimates of the real
+ones).
+
+`split()` closes a time window (`attach()` does it at every VBlank); windows
+become the rows of the heatmap image, one column per page, with reads in green
+and writes in red on a log scale. When there are more than `max_windows`,
+neighbouring windows are merged two by two, so memory use stays bounded on long
+runs. Results can also be written as JSON.
+"""
+
+import json
+import math
+import struct
+import zlib
+
+class BusHeatmap:
+    def __init__(self, memory, sample=1, max_windows=1024):
+        self.memory = memory
+        self.sample = sample
+        self.max_windows = max_windows
+        self.running = False
+        self.reads = [0] * 256
+        self.writes = [0] * 256
+        self.io_reads = [0] * 256
+        self.io_writes = [0] * 256
+        # Accesos que faltan para el siguiente que se cuenta
+        self._left = [sample]
+        self.reset()
+
+    def reset(self):
+        # En su sitio: mientras se mide, las versiones instrumentadas tienen estas listas
+        for counts in (self.reads, self.writes, self.io_reads, self.io_writes):
+            counts[:] = [0] * 256
+        self._left[0] = self.sample
+        # Ventanas cerradas: (lecturas, escrituras) por página
+        self.windows = []
+        # Llamadas a split() que abarca cada ventana; se dobla al fusionarlas
+        self.window_size = 1
+        self._pending = 0
+        self._split_reads = [0] * 256
+        self._split_writes = [0] * 256
+
+    def start(self):
+        if self.running:
+            return
+        memory = self.memory
+        memory.peek, memory.fetch, memory.poke = self._instrument()
+        self.running = True
+
+    def stop(self):
+        if not self.running:
+            return
+        del self.memory.peek
+        del self.memory.fetch
+        del self.memory.poke
+        self.running = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _instrument(self):
+        memory = self.memory
+        # Las listas se modifican en su sitio (lock_bus), así que basta con capturarlas
+        read = memory._read
+        fetch_table = memory._fetch
+        write = memory._write
+        reads = self.reads
+        writes = self.writes
+        io_reads = self.io_reads
+        io_writes = self.io_writes
+        sample = self.sample
+
+        if sample == 1:
+            def peek(addr):
+                addr &= 0xFFFF
+                page = addr >> 8
+                reads[page] += 1
+                if page == 0xFF:
+                    io_reads[addr & 0xFF] += 1
+                return read[page](addr)
+
+            def fetch(addr):
+                page = addr >> 8
+                reads[page] += 1
+                if page == 0xFF:
+                    io_reads[addr & 0xFF] += 1
+                return fetch_table[page](addr)
+
+            def poke(addr, value):
+                addr &= 0xFFFF
+                page = addr >> 8
+                writes[page] += 1
+                if page == 0xFF:
+                    io_writes[addr & 0xFF] += 1
+                write[page](addr, value & 0xFF)
+
+            return peek, fetch, poke
+
+        left = self._left
+
+        def peek(addr):
+            addr &= 0xFFFF
+            left[0] -= 1
+            if not left[0]:
+                left[0] = sample
+                page = addr >> 8
+                reads[page] += sample
+                if page == 0xFF:
+                    io_reads[addr & 0xFF] += sample
+            return read[addr >> 8](addr)
+
+        def fetch(addr):
+            left[0] -= 1
+            if not left[0]:
+                left[0] = sample
+                page = addr >> 8
+                reads[page] += sample
+                if page == 0xFF:
+                    io_reads[addr & 0xFF] += sample
+            return fetch_table[addr >> 8](addr)
+
+        def poke(addr, value):
+            addr &= 0xFFFF
+            left[0] -= 1
+            if not left[0]:
+                left[0] = sample
+                page = addr >> 8
+                writes[page] += sample
+                if page == 0xFF:
+                    io_writes[addr & 0xFF] += sample
+            write[addr >> 8](addr, value & 0xFF)
+
+        return peek, fetch, poke
+
+    def split(self):
+        """Close the current time window."""
+        self._pending += 1
+        if self._pending < self.window_size:
+            return
+        self._pending = 0
+        self.windows.append(self._current())
+        self._split_reads = self.reads[:]
+        self._split_writes = self.writes[:]
+        if len(self.windows) > self.max_windows:
+            windows = self.windows
+            merged = []
+            for i in range(0, len(windows) - 1, 2):
+                a, b = windows[i], windows[i + 1]
+                merged.append(([x + y for x, y in zip(a[0], b[0])], [x + y for x, y in zip(a[1], b[1])]))
+            if len(windows) % 2:
+                merged.append(windows[-1])
+            self.windows = merged
+            self.window_size *= 2
+
+    def _current(self):
+        return ([n - m for n, m in zip(self.reads, self._split_reads)],
+                [n - m for n, m in zip(self.writes, self._split_writes)])
+
+    def attach(self, ppu):
+        """Split windows at every VBlank of `ppu`."""
+        chained = ppu.vblank_callback
+        def on_vblank(time):
+            self.split()
+            if chained is not None:
+                chained(time)
+        ppu.vblank_callback = on_vblank
+
+    def rows(self):
+        """Closed windows plus the current one if it has any access."""
+        rows = list(self.windows)
+        current = self._current()
+        if any(current[0]) or any(current[1]) or not rows:
+            rows.append(current)
+        return rows
+
+    def to_dict(self):
+        """Counts as plain data, ready for json."""
+        return {
+            'sample': self.sample,
+            'reads': sum(self.reads),
+            'writes': sum(self.writes),
+            'pages': {f'{page:02X}': {'reads': self.reads[page], 'writes': self.writes[page]}
+                      for page in range(256) if self.reads[page] or self.writes[page]},
+            'io': {f'FF{reg:02X}': {'reads': self.io_reads[reg], 'writes': self.io_writes[reg]}
+                   for reg in range(256) if self.io_reads[reg] or self.io_writes[reg]},
+            'window_size': self.window_size,
+            'windows': [{'reads': reads, 'writes': writes} for reads, writes in self.rows()],
+        }
+
+    def dump_json(self, f):
+        json.dump(self.to_dict(), f, indent=1, sort_keys=True)
+
+    def image(self):
+        """(width, height, RGB bytes) of the heatmap: a row per window, a column per page."""
+        rows = self.rows()
+        peak = max(max(max(reads), max(writes)) for reads, writes in rows)
+        scale = 255 / math.log1p(peak) if peak else 0
+        pixels = bytearray()
+        for reads, writes in rows:
+            for page in range(256):
+                pixels.append(round(math.log1p(writes[page]) * scale))
+                pixels.append(round(math.log1p(reads[page]) * scale))
+                pixels.append(0)
+        return 256, len(rows), bytes(pixels)
+
+    def dump_png(self, f):
+        width, height, pixels = self.image()
+        stride = width * 3
+        # Cada fila de PNG empieza con el tipo de filtro (0: ninguno)
+        raw = b''.join(b'\0' + pixels[y * stride:(y + 1) * stride] for y in range(height))
+
+        def chunk(kind, data):
+            return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)))
+        f.write(chunk(b'IDAT', zlib.compress(raw)))
+        f.write(chunk(b'IEND', b''))
@@ -0,0 +1,54 @@
+'''Joypad register ($FF00)'''
+
+# Bits de `buttons`: 1 = pulsado
+RIGHT = 0x01
+LEFT = 0x02
+UP = 0x04
+DOWN = 0x08
+A = 0x10
+B = 0x20
+SELECT = 0x40
+START = 0x80
+
+class Joypad:
+    """Button state as a bitmask, read back through P1 according to the selected group."""
+    def __init__(self, memory):
+        self.memory = memory
+        self.buttons = 0
+        self._select = 0x30
+        memory.map_io(0xFF00, self._read_p1, self._write_p1)
+
+    def set_buttons(self, buttons):
+        """Replace the pressed buttons; newly pressed ones in a selected group raise the joypad interrupt."""
+        before = self._lines()
+        self.buttons = buttons & 0xFF
+        if before & ~self._lines() & 0x0F:
+            self.memory.request_interrupt(4)
+
+    def press(self, buttons):
+        self.set_buttons(self.buttons | buttons)
+
+    def release(self, buttons):
+        self.set_buttons(self.buttons & ~buttons)
+
+    def _lines(self):
+        """Low nibble of P1: 0 for each pressed button of the selected groups."""
+        pressed = 0
+        if not self._select & 0x10:
+            pressed |= self.buttons & 0x0F
+        if not self._select & 0x20:
+            pressed |= self.buttons >> 4
+        return 0x0F & ~pressed
+
+    def _read_p1(self, addr):
+        return 0xC0 | self._select | self._lines()
+
+    def _write_p1(self, addr, value):
+        self._select = value & 0x30
+
+    def save_state(self):
+        return {'buttons': self.buttons, 'select': self._select}
+
+    def load_state(self, state):
+        self.buttons = state['buttons']
+        self._select = state['select']
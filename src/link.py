@@ -0,0 +1,129 @@
+'''Serial port ($FF01-$FF02) and link cable'''
+
+from scheduler import Event
+
+# Ciclos por bit: 8192 Hz, o 262144 Hz con el bit 1 de SC en CGB
+_BIT_CYCLES = 512
+_FAST_BIT_CYCLES = 16
+
+class Serial:
+    """Serial port of one console.
+
+    A transfer with the internal clock is a single scheduler event 8 bits later.
+    The linked console is only seen through what it last published at a sync point
+    (`peer_sb`, `peer_ready`): the byte received is its SB if it was waiting on the
+    external clock, else $FF. Sent bytes are queued with their timestamp in `outbox`
+    until the next sync, so no side ever waits for the other per byte. Every byte
+    sent also goes to `sink(byte)` if set (test ROMs print their results this way).
+    """
+    def __init__(self, cpu):
+        self.cpu = cpu
+        self.memory = cpu.memory
+        self.scheduler = cpu.scheduler
+        self.sc = 0
+        self.sink = None
+        # (ciclo, byte) enviados desde la última sincronización
+        self.outbox = []
+        self.peer_sb = 0xFF
+        self.peer_ready = False
+        self._transfer = Event('serial transfer', self._on_transfer)
+        self._unused = 0x7C if self.memory.cgb else 0x7E
+        self.memory.map_io(0xFF02, self._read_sc, self._write_sc)
+
+    @property
+    def sb(self):
+        return self.memory.io[0x01]
+
+    @property
+    def ready(self):
+        """Waiting for the other console to clock a transfer."""
+        return (self.sc & 0x81) == 0x80
+
+    def _read_sc(self, addr):
+        return self.sc | self._unused
+
+    def _write_sc(self, addr, value):
+        now = self.cpu.cycles
+        if now >= self.scheduler.next_time:
+            self.scheduler.run(now)
+        self.sc = value & (0x83 if self.memory.cgb else 0x81)
+        if (self.sc & 0x81) == 0x81:
+            bit_cycles = _FAST_BIT_CYCLES if self.sc & 0x02 else _BIT_CYCLES
+            self.scheduler.schedule(self._transfer, now + 8 * bit_cycles)
+        else:
+            self.scheduler.cancel(self._transfer)
+
+    def _on_transfer(self, time):
+        io = self.memory.io
+        out = io[0x01]
+        if self.peer_ready:
+            io[0x01] = self.peer_sb
+            # El byte del otro ya se ha usado hasta que vuelva a publicar su estado
+            self.peer_ready = False
+        else:
+            io[0x01] = 0xFF
+        self._complete()
+        self.outbox.append([time, out])
+        if self.sink is not None:
+            self.sink(out)
+
+    def _complete(self):
+        self.sc &= 0x7F
+        self.memory.request_interrupt(3)
+
+    def receive(self, time, value):
+        """Byte clocked in by the other console at its cycle `time`."""
+        if self.ready:
+            out = self.memory.io[0x01]
+            self.memory.io[0x01] = value
+            self._complete()
+            if self.sink is not None:
+                self.sink(out)
+
+    def take_outbox(self):
+        outbox = self.outbox
+        self.outbox = []
+        return outbox
+
+    def save_state(self):
+        return {
+            'sc': self.sc, 'transfer': self._transfer.time,
+            'peer_sb': self.peer_sb, 'peer_ready': self.peer_ready,
+        }
+
+    def load_state(self, state):
+        self.sc = state['sc']
+        self.peer_sb = state['peer_sb']
+        self.peer_ready = state['peer_ready']
+        self.outbox = []
+        self.scheduler.restore(self._transfer, state['transfer'])
+
+class LocalLink:
+    """Link cable between two `System` instances in the same process."""
+    def __init__(self, a, b, quantum=4096):
+        self.a = a
+        self.b = b
+        self.quantum = quantum
+
+    def sync(self):
+        """Deliver the bytes sent since the last sync and publish each side's state to the other."""
+        serial_a = self.a.serial
+        serial_b = self.b.serial
+        for time, value in serial_a.take_outbox():
+            serial_b.receive(time, value)
+        for time, value in serial_b.take_outbox():
+            serial_a.receive(time, value)
+        serial_a.peer_sb = serial_b.sb
+        serial_a.peer_ready = serial_b.ready
+        serial_b.peer_sb = serial_a.sb
+        serial_b.peer_ready = serial_a.ready
+
+    def run(self, cycles):
+        """Run both consoles for `cycles` cycles, syncing every `quantum` cycles."""
+        end = self.a.cpu.cycles + cycles
+        offset = self.b.cpu.cycles - self.a.cpu.cycles
+        while self.a.cpu.cycles < end:
+            target = min(self.a.cpu.cycles + self.quantum, end)
+            self.a.cpu.run(target - self.a.cpu.cycles)
+            self.b.cpu.run(target + offset - self.b.cpu.cycles)
+            self.sync()
@@ -0,0 +1,86 @@
+"""
+Link cable over a local Unix socket
+
+Each process runs its own `System` and calls `SocketLink.sync()` every quantum
+of cycles (`run()` does both). A sync sends one message with the state of this
+side's serial port and the timestamped bytes it sent since the previous sync,
+then reads the same from the other side: processes block at most once per
+quantum, never per transferred byte.
+"""
+
+import os
+import socket
+import struct
+
+# SB, esperando reloj externo, número de bytes
+_header = struct.Struct('<BBH')
+# Ciclo, byte
+_entry = struct.Struct('<QB')
+
+def _recv_exact(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError('Link closed')
+        data.extend(chunk)
+    return bytes(data)
+
+class SocketLink:
+    def __init__(self, system, sock, quantum=4096):
+        self.system = system
+        self.sock = sock
+        self.quantum = quantum
+
+    @classmethod
+    def listen(cls, system, path, quantum=4096):
+        """Wait for the other console to connect at `path`."""
+        if os.path.exists(path):
+            os.remove(path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            server.bind(path)
+            server.listen(1)
+            sock, address = server.accept()
+        finally:
+            server.close()
+        return cls(system, sock, quantum)
+
+    @classmethod
+    def connect(cls, system, path, quantum=4096):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(path)
+        return cls(system, sock, quantum)
+
+    def sync(self):
+        serial = self.system.serial
+        outbox = serial.take_outbox()
+        message = bytearray(_header.pack(serial.sb, serial.ready, len(outbox)))
+        for time, value in outbox:
+            message += _entry.pack(time, value)
+        self.sock.sendall(message)
+        sb, ready, count = _header.unpack(_recv_exact(self.sock, _header.size))
+        data = _recv_exact(self.sock, _entry.size * count)
+        for i in range(count):
+            time, value = _entry.unpack_from(data, i * _entry.size)
+            serial.receive(time, value)
+        serial.peer_sb = sb
+        serial.peer_ready = bool(ready)
+
+    def run(self, cycles):
+        """Run for `cycles` cycles, syncing every quantum. Both sides must run the same number of cycles."""
+        cpu = self.system.cpu
+        start = cpu.cycles
+        # Siempre el mismo número de sincronizaciones, aunque cada tramo se pase por unos ciclos
+        for k in range(1, (cycles + self.quantum - 1) // self.quantum + 1):
+            cpu.run(start + min(k * self.quantum, cycles) - cpu.cycles)
+            self.sync()
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
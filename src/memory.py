@@ -1,17 +1,387 @@
+'''Memory map and bank controllers'''
+
 # __pragma__('skip')
-from stubs import Uint8Array
+from stubs import __new__, Uint8Array
 # __pragma__('noskip')
 
-from cart import Cart, Mbc
+from cart import Cart, Mbc, Capability
 
 class Memory:
+    """Game Boy address space.
+
+    Reads and writes go through one handler per 256-byte page (`_read`/`_write`),
+    so bank switching or special regions never cost an if/elif chain per access.
+    Opcode fetches go through their own table (`_fetch`), with the same handlers
+    unless a debugger traps them.
+    I/O registers with side effects are hooked with `map_io`.
+    Carts with CGB support run in CGB mode, with banked VRAM (2 x 8 KiB) and WRAM (8 x 4 KiB).
+    """
     def __init__(self, cart: Cart):
         self.enable_bootrom = True
         self.rom = cart.rom
+        self.mbc = cart.cart_type.mbc
+        self.cgb = cart.cgb_flag != Capability.Unavailable
+        self.vram = __new__(Uint8Array(0x4000 if self.cgb else 0x2000))
+        self.wram = __new__(Uint8Array(0x8000 if self.cgb else 0x2000))
+        self.oam = __new__(Uint8Array(0xA0))
+        # $FF00-$FFFF: registros de E/S, HRAM e IE
+        self.io = __new__(Uint8Array(0x100))
+        if self.mbc == Mbc.MBC2:
+            # 512 x 4 bits integrados en el MBC2
+            self.sram = __new__(Uint8Array(0x200))
+        else:
+            self.sram = __new__(Uint8Array(cart.ram_size * 1024))
+        self.ram_enabled = False
+        self.rom_bank = 1
+        self.ram_bank = 0
+        self._rom_banks = max(len(self.rom) // 0x4000, 2)
+        self._bank_hi = 0
+        self._mbc1_mode = 0
+        self._rom0_offset = 0
+        self._romx_offset = 0
+        self._sram_offset = 0
+        self._vram_offset = 0
+        self._wram_offset = 0x1000
+        self._io_read = [None] * 256
+        self._io_write = [None] * 256
+        self._read = [None] * 256
+        self._write = [None] * 256
+        self._fetch = [None] * 256
+        self._unlocked_read = None
+        self._unlocked_fetch = None
+        # Llamado con (índice, valor) en cada escritura en OAM desde la CPU
+        self.oam_callback = None
+        # Llamado con el índice en `sram` de cada escritura en la RAM del cartucho
+        self.sram_callback = None
+        # Reloj del MBC3, si el cartucho lo tiene
+        self.rtc = None
+        self._map_pages()
+        if self.cgb:
+            self.map_io(0xFF4F, self._read_vbk, self._write_vbk)
+            self.map_io(0xFF70, self._read_svbk, self._write_svbk)
+
+    def _map_pages(self):
+        read_sram, write_sram = self._read_sram, self._write_sram
+        if self.mbc == Mbc.MBC1:
+            mbc_write = self._write_mbc1
+        elif self.mbc == Mbc.MBC2:
+            mbc_write = self._write_mbc2
+            read_sram, write_sram = self._read_sram_mbc2, self._write_sram_mbc2
+        elif self.mbc == Mbc.MBC3:
+            mbc_write = self._write_mbc3
+        elif self.mbc == Mbc.MBC5:
+            mbc_write = self._write_mbc5
+        else:
+            mbc_write = self._write_none
+        for page in range(0x100):
+            if page < 0x40:
+                read, write = self._read_rom0, mbc_write
+            elif page < 0x80:
+                read, write = self._read_romx, mbc_write
+            elif page < 0xA0:
+                read, write = self._read_vram, self._write_vram
+            elif page < 0xC0:
+                read, write = read_sram, write_sram
+            elif page < 0xD0:
+                read, write = self._read_wram, self._write_wram
+            elif page < 0xE0:
+                read, write = self._read_wramx, self._write_wramx
+            elif page < 0xF0:
+                read, write = self._read_echo, self._write_echo
+            elif page < 0xFE:
+                read, write = self._read_echox, self._write_echox
+            elif page < 0xFF:
+                read, write = self._read_oam, self._write_oam
+            else:
+                read, write = self._read_io, self._write_io
+            self._read[page] = read
+            self._fetch[page] = read
+            self._write[page] = write
 
     def peek(self, addr):
         addr &= 0xFFFF
+        return self._read[addr >> 8](addr)
+
+    def fetch(self, addr):
+        """Read the opcode at `addr` (already within $0000-$FFFF) for the CPU."""
+        return self._fetch[addr >> 8](addr)
 
     def poke(self, addr, value):
         addr &= 0xFFFF
-        value &= 0xFF
\ No newline at end of file
+        value &= 0xFF
+        self._write[addr >> 8](addr, value)
+
+    def map_io(self, addr, read=None, write=None):
+        """Hook the I/O register at `addr` ($FF00-$FFFF).
+
+        `read(addr)` returns the register value; `write(addr, value)` is responsible
+        for storing it in `io` if it must read back.
+        """
+        self._io_read[addr & 0xFF] = read
+        self._io_write[addr & 0xFF] = write
+
+    def request_interrupt(self, bit):
+        self.io[0x0F] |= 1 << bit
+
+    def copy(self, dst, offset, addr, length):
+        """Copy `length` bytes of the address space from `addr` into dst[offset:].
+
+        Whole runs of the backing buffers are copied at once; only regions without
+        one (cart RAM, OAM, I/O) go byte by byte through `peek`.
+        """
+        while length > 0:
+            n = min(length, 0x1000 - (addr & 0xFFF))
+            src = None
+            if addr < 0x4000:
+                src, start = self.rom, self._rom0_offset + addr
+            elif addr < 0x8000:
+                src, start = self.rom, self._romx_offset + addr
+            elif addr < 0xA000:
+                src, start = self.vram, self._vram_offset + addr - 0x8000
+            elif 0xC000 <= addr < 0xFE00:
+                wram_addr = addr - 0x2000 if addr >= 0xE000 else addr
+                if wram_addr < 0xD000:
+                    src, start = self.wram, wram_addr - 0xC000
+                else:
+                    src, start = self.wram, self._wram_offset + wram_addr - 0xD000
+            if src is None:
+                for i in range(n):
+                    dst[offset + i] = self.peek(addr + i)
+            else:
+                dst.set(src.subarray(start, start + n), offset)
+            addr = (addr + n) & 0xFFFF
+            offset += n
+            length -= n
+
+    def lock_bus(self):
+        """Make everything but HRAM and I/O read $FF, as during OAM DMA."""
+        if self._unlocked_read is None:
+            self._unlocked_read = self._read[:]
+            self._unlocked_fetch = self._fetch[:]
+            for page in range(0xFF):
+                self._read[page] = self._read_locked
+                self._fetch[page] = self._read_locked
+
+    def unlock_bus(self):
+        saved = self._unlocked_read
+        if saved is not None:
+            saved_fetch = self._unlocked_fetch
+            for page in range(0xFF):
+                self._read[page] = saved[page]
+                self._fetch[page] = saved_fetch[page]
+            self._unlocked_read = None
+            self._unlocked_fetch = None
+
+    def _read_locked(self, addr):
+        return 0xFF
+
+    def save_state(self):
+        return {
+            'vram': self.vram.slice(), 'wram': self.wram.slice(), 'oam': self.oam.slice(),
+            'io': self.io.slice(), 'sram': self.sram.slice(),
+            'enable_bootrom': self.enable_bootrom, 'ram_enabled': self.ram_enabled,
+            'rom_bank': self.rom_bank, 'ram_bank': self.ram_bank,
+            'bank_hi': self._bank_hi, 'mbc1_mode': self._mbc1_mode,
+            'rom0_offset': self._rom0_offset, 'romx_offset': self._romx_offset,
+            'sram_offset': self._sram_offset, 'vram_offset': self._vram_offset,
+            'wram_offset': self._wram_offset, 'locked': self._unlocked_read is not None,
+        }
+
+    def load_state(self, state):
+        # Se copia sobre los buffers existentes: otros objetos guardan referencias a ellos
+        self.vram.set(state['vram'])
+        self.wram.set(state['wram'])
+        self.oam.set(state['oam'])
+        self.io.set(state['io'])
+        self.sram.set(state['sram'])
+        self.enable_bootrom = state['enable_bootrom']
+        self.ram_enabled = state['ram_enabled']
+        self.rom_bank = state['rom_bank']
+        self.ram_bank = state['ram_bank']
+        self._bank_hi = state['bank_hi']
+        self._mbc1_mode = state['mbc1_mode']
+        self._rom0_offset = state['rom0_offset']
+        self._romx_offset = state['romx_offset']
+        self._sram_offset = state['sram_offset']
+        self._vram_offset = state['vram_offset']
+        self._wram_offset = state['wram_offset']
+        self.unlock_bus()
+        if state['locked']:
+            self.lock_bus()
+
+    def bank_at(self, addr):
+        """ROM bank mapped at `addr`."""
+        if addr < 0x4000:
+            return self._rom0_offset >> 14
+        return (self._romx_offset >> 14) + 1
+
+    def _read_rom0(self, addr):
+        return self.rom[self._rom0_offset + addr]
+
+    def _read_romx(self, addr):
+        return self.rom[self._romx_offset + addr]
+
+    def _read_vram(self, addr):
+        return self.vram[self._vram_offset + addr - 0x8000]
+
+    def _write_vram(self, addr, value):
+        self.vram[self._vram_offset + addr - 0x8000] = value
+
+    def _read_sram(self, addr):
+        if not self.ram_enabled:
+            return 0xFF
+        if self._sram_offset < 0:
+            if self.rtc is not None and 0x08 <= self.ram_bank <= 0x0C:
+                return self.rtc.read(self.ram_bank)
+            return 0xFF
+        if not self.sram.length:
+            return 0xFF
+        return self.sram[(self._sram_offset + addr - 0xA000) % self.sram.length]
+
+    def _write_sram(self, addr, value):
+        if not self.ram_enabled:
+            return
+        if self._sram_offset < 0:
+            if self.rtc is not None and 0x08 <= self.ram_bank <= 0x0C:
+                self.rtc.write(self.ram_bank, value)
+        elif self.sram.length:
+            index = (self._sram_offset + addr - 0xA000) % self.sram.length
+            self.sram[index] = value
+            if self.sram_callback is not None:
+                self.sram_callback(index)
+
+    def _read_sram_mbc2(self, addr):
+        if not self.ram_enabled:
+            return 0xFF
+        return self.sram[addr & 0x1FF] | 0xF0
+
+    def _write_sram_mbc2(self, addr, value):
+        if self.ram_enabled:
+            self.sram[addr & 0x1FF] = value & 0x0F
+            if self.sram_callback is not None:
+                self.sram_callback(addr & 0x1FF)
+
+    def _read_wram(self, addr):
+        return self.wram[addr - 0xC000]
+
+    def _write_wram(self, addr, value):
+        self.wram[addr - 0xC000] = value
+
+    def _read_wramx(self, addr):
+        return self.wram[self._wram_offset + addr - 0xD000]
+
+    def _write_wramx(self, addr, value):
+        self.wram[self._wram_offset + addr - 0xD000] = value
+
+    def _read_echo(self, addr):
+        return self.wram[addr - 0xE000]
+
+    def _write_echo(self, addr, value):
+        self.wram[addr - 0xE000] = value
+
+    def _read_echox(self, addr):
+        return self.wram[self._wram_offset + addr - 0xF000]
+
+    def _write_echox(self, addr, value):
+        self.wram[self._wram_offset + addr - 0xF000] = value
+
+    def _read_vbk(self, addr):
+        return 0xFE | (self._vram_offset >> 13)
+
+    def _write_vbk(self, addr, value):
+        self._vram_offset = (value & 1) << 13
+
+    def _read_svbk(self, addr):
+        return 0xF8 | (self._wram_offset >> 12)
+
+    def _write_svbk(self, addr, value):
+        # El banco 0 selecciona el 1
+        self._wram_offset = ((value & 7) or 1) << 12
+
+    def _read_oam(self, addr):
+        if addr < 0xFEA0:
+            return self.oam[addr - 0xFE00]
+        return 0
+
+    def _write_oam(self, addr, value):
+        if addr < 0xFEA0:
+            self.oam[addr - 0xFE00] = value
+            if self.oam_callback is not None:
+                self.oam_callback(addr - 0xFE00, value)
+
+    def _read_io(self, addr):
+        fn = self._io_read[addr & 0xFF]
+        if fn is None:
+            return self.io[addr & 0xFF]
+        return fn(addr)
+
+    def _write_io(self, addr, value):
+        fn = self._io_write[addr & 0xFF]
+        if fn is None:
+            self.io[addr & 0xFF] = value
+        else:
+            fn(addr, value)
+
+    def _update_banks(self):
+        self._sram_offset = self.ram_bank * 0x2000
+        self._romx_offset = (self.rom_bank % self._rom_banks) * 0x4000 - 0x4000
+
+    def _write_none(self, addr, value):
+        pass
+
+    def _write_mbc1(self, addr, value):
+        if addr < 0x2000:
+            self.ram_enabled = (value & 0x0F) == 0x0A
+            return
+        elif addr < 0x4000:
+            low = value & 0x1F
+            self.rom_bank = (self.rom_bank & 0x60) | (low if low else 1)
+        elif addr < 0x6000:
+            self._bank_hi = value & 0x03
+            self.rom_bank = (self._bank_hi << 5) | (self.rom_bank & 0x1F)
+        else:
+            self._mbc1_mode = value & 1
+        if self._mbc1_mode:
+            self.ram_bank = self._bank_hi
+            self._rom0_offset = ((self._bank_hi << 5) % self._rom_banks) * 0x4000
+        else:
+            self.ram_bank = 0
+            self._rom0_offset = 0
+        self._update_banks()
+
+    def _write_mbc2(self, addr, value):
+        if addr >= 0x4000:
+            return
+        if addr & 0x100:
+            self.rom_bank = (value & 0x0F) or 1
+            self._update_banks()
+        else:
+            self.ram_enabled = (value & 0x0F) == 0x0A
+
+    def _write_mbc3(self, addr, value):
+        if addr < 0x2000:
+            self.ram_enabled = (value & 0x0F) == 0x0A
+        elif addr < 0x4000:
+            self.rom_bank = (value & 0x7F) or 1
+            self._update_banks()
+        elif addr < 0x6000:
+            self.ram_bank = value & 0x0F
+            self._update_banks()
+            if self.ram_bank > 3:
+                # Registros del RTC
+                self._sram_offset = -1
+        elif self.rtc is not None:
+            self.rtc.write_latch(value)
+
+    def _write_mbc5(self, addr, value):
+        if addr < 0x2000:
+            self.ram_enabled = (value & 0x0F) == 0x0A
+        elif addr < 0x3000:
+            self.rom_bank = (self.rom_bank & 0x100) | value
+            self._update_banks()
+        elif addr < 0x4000:
+            self.rom_bank = ((value & 1) << 8) | (self.rom_bank & 0xFF)
+            self._update_banks()
+        elif addr < 0x6000:
+            self.ram_bank = value & 0x0F
+            self._update_banks()
@@ -0,0 +1,153 @@
+'''Palette registers and colour lookup tables'''
+
+# __pragma__('skip')
+from stubs import __new__, Uint32Array
+# __pragma__('noskip')
+
+def rgba(r, g, b):
+    """Pixel as stored in a Uint32Array over canvas ImageData (little endian: R, G, B, A in memory)."""
+    # Suma en vez de << para que en JavaScript no salga negativo
+    return 0xFF000000 + (b << 16) + (g << 8) + r
+
+# Tonos de DMG, del más claro al más oscuro
+dmg_shades = [rgba(0xFF, 0xFF, 0xFF), rgba(0xAA, 0xAA, 0xAA), rgba(0x55, 0x55, 0x55), rgba(0x00, 0x00, 0x00)]
+
+# Tablas de color de 15 bits a RGBA, calculadas la primera vez que se piden
+_cgb_tables = {}
+
+def cgb_table(correct):
+    """RGBA for every 15-bit CGB colour, optionally corrected to look like the CGB LCD."""
+    key = 'corrected' if correct else 'raw'
+    table = _cgb_tables.get(key)
+    if table is None:
+        table = __new__(Uint32Array(0x8000))
+        for color in range(0x8000):
+            r = color & 0x1F
+            g = (color >> 5) & 0x1F
+            b = (color >> 10) & 0x1F
+            if correct:
+                # Mezcla de canales y menos brillo, como la pantalla de la CGB
+                table[color] = rgba(min(960, r * 26 + g * 4 + b * 2) >> 2,
+                                    min(960, g * 24 + b * 8) >> 2,
+                                    min(960, r * 6 + g * 4 + b * 22) >> 2)
+            else:
+                table[color] = rgba((r << 3) | (r >> 2), (g << 3) | (g >> 2), (b << 3) | (b >> 2))
+        _cgb_tables[key] = table
+    return table
+
+class Palettes:
+    """Palette registers, with their colours kept as ready-to-use RGBA words.
+
+    `bg` and `obj` hold 8 palettes of 4 colours each, indexed by palette * 4 + colour.
+    In DMG mode only bg palette 0 (BGP) and obj palettes 0 and 1 (OBP0, OBP1) are used.
+    The tables are only recomputed when a palette register or CGB palette RAM is written.
+    """
+    def __init__(self, memory, color_correction=False):
+        self.memory = memory
+        self.cgb = memory.cgb
+        self.color_correction = color_correction
+        self.shades = dmg_shades
+        self.bg = __new__(Uint32Array(32))
+        self.obj = __new__(Uint32Array(32))
+        # RAM de paletas de CGB: 8 paletas x 4 colores x 2 bytes
+        self.bg_ram = [0xFF] * 64
+        self.obj_ram = [0xFF] * 64
+        self.bg_index = 0
+        self.obj_index = 0
+        self._table = None
+        memory.map_io(0xFF47, None, self._write_bgp)
+        memory.map_io(0xFF48, None, self._write_obp0)
+        memory.map_io(0xFF49, None, self._write_obp1)
+        if self.cgb:
+            memory.map_io(0xFF68, self._read_bcps, self._write_bcps)
+            memory.map_io(0xFF69, self._read_bcpd, self._write_bcpd)
+            memory.map_io(0xFF6A, self._read_ocps, self._write_ocps)
+            memory.map_io(0xFF6B, self._read_ocpd, self._write_ocpd)
+        self.refresh()
+
+    def set_color_correction(self, enabled):
+        self.color_correction = enabled
+        self.refresh()
+
+    def refresh(self):
+        """Recompute every table, after changing the shades or the colour correction."""
+        if self.cgb:
+            self._table = cgb_table(self.color_correction)
+            for i in range(32):
+                self._update_cgb(self.bg, self.bg_ram, i)
+                self._update_cgb(self.obj, self.obj_ram, i)
+        io = self.memory.io
+        self._update_dmg(self.bg, 0, io[0x47])
+        self._update_dmg(self.obj, 0, io[0x48])
+        self._update_dmg(self.obj, 1, io[0x49])
+
+    def save_state(self):
+        return {
+            'bg_ram': self.bg_ram[:], 'obj_ram': self.obj_ram[:],
+            'bg_index': self.bg_index, 'obj_index': self.obj_index,
+        }
+
+    def load_state(self, state):
+        """Restore the CGB palette RAM; DMG palettes are read back from `memory.io`."""
+        self.bg_ram = state['bg_ram'][:]
+        self.obj_ram = state['obj_ram'][:]
+        self.bg_index = state['bg_index']
+        self.obj_index = state['obj_index']
+        self.refresh()
+
+    def _update_dmg(self, lut, palette, value):
+        if self.cgb:
+            return
+        shades = self.shades
+        base = palette * 4
+        for color in range(4):
+            lut[base + color] = shades[(value >> (color * 2)) & 3]
+
+    def _update_cgb(self, lut, ram, i):
+        lut[i] = self._table[(ram[i * 2] | (ram[i * 2 + 1] << 8)) & 0x7FFF]
+
+    def _write_bgp(self, addr, value):
+        self.memory.io[0x47] = value
+        self._update_dmg(self.bg, 0, value)
+
+    def _write_obp0(self, addr, value):
+        self.memory.io[0x48] = value
+        self._update_dmg(self.obj, 0, value)
+
+    def _write_obp1(self, addr, value):
+        self.memory.io[0x49] = value
+        self._update_dmg(self.obj, 1, value)
+
+    def _read_bcps(self, addr):
+        return 0x40 | self.bg_index
+
+    def _write_bcps(self, addr, value):
+        self.bg_index = value & 0xBF
+
+    def _read_bcpd(self, addr):
+        return self.bg_ram[self.bg_index & 0x3F]
+
+    def _write_bcpd(self, addr, value):
+        self.bg_index = self._write_ram(self.bg, self.bg_ram, self.bg_index, value)
+
+    def _read_ocps(self, addr):
+        return 0x40 | self.obj_index
+
+    def _write_ocps(self, addr, value):
+        self.obj_index = value & 0xBF
+
+    def _read_ocpd(self, addr):
+        return self.obj_ram[self.obj_index & 0x3F]
+
+    def _write_ocpd(self, addr, value):
+        self.obj_index = self._write_ram(self.obj, self.obj_ram, self.obj_index, value)
+
+    def _write_ram(self, lut, ram, index, value):
+        """Store a palette RAM byte and update its colour. Returns the new index register."""
+        pos = index & 0x3F
+        ram[pos] = value
+        self._update_cgb(lut, ram, pos >> 1)
+        if index & 0x80:
+            # Autoincremento
+            index = (index & 0x80) | ((pos + 1) & 0x3F)
+        return index
@@ -0,0 +1,434 @@
+'''Pixel processing unit'''
+
+# __pragma__('skip')
+from stubs import __new__, Uint8Array, Uint32Array, performance
+# __pragma__('noskip')
+
+from scheduler import Event
+from palette import Palettes
+
+WIDTH = 160
+HEIGHT = 144
+LINE_CYCLES = 456
+FRAME_CYCLES = LINE_CYCLES * 154
+
+# Modos (bits 0-1 de STAT)
+HBLANK = 0
+VBLANK = 1
+OAM_SCAN = 2
+TRANSFER = 3
+
+# Punto de la línea donde empieza cada modo. La duración de TRANSFER es fija:
+# no se modela la penalización por scroll, ventana o sprites
+_TRANSFER_START = 80
+_HBLANK_START = 252
+
+class Ppu:
+    """Scanline renderer with lazily computed LY and STAT.
+
+    LY and the STAT mode are derived on read from the cycles elapsed since the
+    start of the frame. The PPU only runs at scheduler events: the start of each
+    HBlank (the line is rendered then), VBlank, and, only while some STAT interrupt
+    is enabled, the start of each line.
+    `frame` holds the last frame as packed RGBA words, ready for canvas ImageData;
+    colours come from the lookup tables in `palettes`.
+    """
+    def __init__(self, cpu):
+        self.cpu = cpu
+        self.memory = cpu.memory
+        self.scheduler = cpu.scheduler
+        self.cgb = self.memory.cgb
+        self.palettes = Palettes(self.memory)
+        self.frame = __new__(Uint32Array(WIDTH * HEIGHT))
+        self.frame_count = 0
+        self.lcdc = 0
+        self.stat = 0
+        self.lyc = 0
+        # Ciclo en el que empezó un cuadro (al encender la pantalla)
+        self._frame_start = 0
+        self._window_line = 0
+        self._stat_line = False
+        # Índices de color del fondo, sus atributos de CGB y píxeles ya ocupados por
+        # sprites en la línea actual
+        self._bg = __new__(Uint8Array(WIDTH))
+        self._bg_attr = __new__(Uint8Array(WIDTH))
+        self._taken = __new__(Uint8Array(WIDTH))
+        memory = self.memory
+        # Índice de sprites: los que tocan cada línea, en orden de OAM, y las líneas
+        # [primera, última) en las que está apuntado cada sprite
+        self._line_sprites = [[] for line in range(HEIGHT)]
+        self._sprite_lines = [(0, 0)] * 40
+        # Sprites que se dibujan en cada línea, por prioridad; None si hay que recalcularlo
+        self._line_order = [None] * HEIGHT
+        self._sprites_dirty = True
+        memory.oam_callback = self._oam_written
+        self._event = Event('ppu', self._on_event)
+        # Sin salida de vídeo (búsquedas, fuzzing) no hace falta dibujar las líneas
+        self.rendering = True
+        # Con `timed`, `render_time` acumula los ms del anfitrión gastados en dibujar líneas
+        self.timed = False
+        self.render_time = 0
+        # Llamado al empezar cada HBlank, con el ciclo en que empieza (HDMA)
+        self.hblank_callback = None
+        # Llamado al empezar cada VBlank, con el cuadro ya completo en `frame`
+        self.vblank_callback = None
+        memory.map_io(0xFF40, self._read_lcdc, self._write_lcdc)
+        memory.map_io(0xFF41, self._read_stat, self._write_stat)
+        memory.map_io(0xFF44, self._read_ly, self._write_ly)
+        memory.map_io(0xFF45, self._read_lyc, self._write_lyc)
+
+    @property
+    def enabled(self):
+        return bool(self.lcdc & 0x80)
+
+    def save_state(self):
+        return {
+            'lcdc': self.lcdc, 'stat': self.stat, 'lyc': self.lyc, 'frame_count': self.frame_count,
+            'frame_start': self._frame_start, 'window_line': self._window_line,
+            'stat_line': self._stat_line, 'event': self._event.time, 'frame': self.frame.slice(),
+            'palettes': self.palettes.save_state(),
+        }
+
+    def load_state(self, state):
+        self.lcdc = state['lcdc']
+        self.stat = state['stat']
+        self.lyc = state['lyc']
+        self.frame_count = state['frame_count']
+        self._frame_start = state['frame_start']
+        self._window_line = state['window_line']
+        self._stat_line = state['stat_line']
+        self.frame.set(state['frame'])
+        self.scheduler.restore(self._event, state['event'])
+        self.palettes.load_state(state['palettes'])
+        self.oam_changed()
+
+    def _now(self):
+        now = self.cpu.cycles
+        if now >= self.scheduler.next_time:
+            self.scheduler.run(now)
+        return now
+
+    def _position(self, time):
+        """(line, dot) at cycle `time`."""
+        pos = (time - self._frame_start) % FRAME_CYCLES
+        return (pos // LINE_CYCLES, pos % LINE_CYCLES)
+
+    def _ly(self, line, dot):
+        # LY vale 153 solo durante los primeros ciclos de la última línea
+        if line == 153 and dot >= 4:
+            return 0
+        return line
+
+    def _mode(self, line, dot):
+        if line >= HEIGHT:
+            return VBLANK
+        if dot < _TRANSFER_START:
+            return OAM_SCAN
+        if dot < _HBLANK_START:
+            return TRANSFER
+        return HBLANK
+
+    def ly(self):
+        if not self.lcdc & 0x80:
+            return 0
+        line, dot = self._position(self._now())
+        return self._ly(line, dot)
+
+    def mode(self):
+        if not self.lcdc & 0x80:
+            return HBLANK
+        line, dot = self._position(self._now())
+        return self._mode(line, dot)
+
+    def _update_stat_line(self, line, dot):
+        """Request the STAT interrupt on a rising edge of its OR-ed sources."""
+        stat = self.stat
+        mode = self._mode(line, dot)
+        high = ((stat & 0x08 and mode == HBLANK) or (stat & 0x10 and mode == VBLANK)
+                or (stat & 0x20 and mode == OAM_SCAN) or (stat & 0x40 and self._ly(line, dot) == self.lyc))
+        if high and not self._stat_line:
+            self.memory.request_interrupt(1)
+        self._stat_line = bool(high)
+
+    def _schedule(self, time):
+        """Schedule the first event at or after cycle `time`."""
+        line, dot = self._position(time)
+        start = time - dot
+        if self.stat & 0x78:
+            # Con interrupciones STAT activas, cada cambio de modo es un evento
+            if dot == 0:
+                next_time = time
+            elif line < HEIGHT and dot <= _TRANSFER_START and self.stat & 0x20:
+                next_time = start + _TRANSFER_START
+            elif line < HEIGHT and dot <= _HBLANK_START:
+                next_time = start + _HBLANK_START
+            else:
+                next_time = start + LINE_CYCLES
+        elif line < HEIGHT and dot <= _HBLANK_START:
+            next_time = start + _HBLANK_START
+        elif line < HEIGHT - 1:
+            next_time = start + LINE_CYCLES + _HBLANK_START
+        elif line == HEIGHT - 1:
+            next_time = start + LINE_CYCLES
+        else:
+            # VBlank: hasta el HBlank de la línea 0 del cuadro siguiente
+            next_time = start + (154 - line) * LINE_CYCLES + _HBLANK_START
+        self.scheduler.schedule(self._event, next_time)
+
+    def _on_event(self, time):
+        line, dot = self._position(time)
+        if line < HEIGHT and dot == _HBLANK_START:
+            if self.rendering:
+                if self.timed:
+                    start = performance.now()
+                    self.render_line(line)
+                    self.render_time += performance.now() - start
+                else:
+                    self.render_line(line)
+            if self.hblank_callback is not None:
+                self.hblank_callback(time)
+        elif line == HEIGHT and dot == 0:
+            self.memory.request_interrupt(0)
+            self.frame_count += 1
+            self._window_line = 0
+            if self.vblank_callback is not None:
+                self.vblank_callback(time)
+        if self.stat & 0x78:
+            self._update_stat_line(line, dot)
+        else:
+            self._stat_line = False
+        self._schedule(time + 1)
+
+    def _read_lcdc(self, addr):
+        return self.lcdc
+
+    def _write_lcdc(self, addr, value):
+        now = self._now()
+        was_on = self.lcdc & 0x80
+        if (value ^ self.lcdc) & 0x04:
+            # Cambia la altura de los sprites
+            self.oam_changed()
+        self.lcdc = value
+        if value & 0x80 and not was_on:
+            self._frame_start = now
+            self._window_line = 0
+            self._stat_line = False
+            self._schedule(now)
+        elif was_on and not value & 0x80:
+            self.scheduler.cancel(self._event)
+
+    def _read_stat(self, addr):
+        if not self.lcdc & 0x80:
+            return 0x80 | self.stat
+        line, dot = self._position(self._now())
+        return 0x80 | self.stat | (0x04 if self._ly(line, dot) == self.lyc else 0) | self._mode(line, dot)
+
+    def _write_stat(self, addr, value):
+        now = self._now()
+        self.stat = value & 0x78
+        if self.lcdc & 0x80:
+            line, dot = self._position(now)
+            self._update_stat_line(line, dot)
+            self._schedule(now)
+
+    def _read_ly(self, addr):
+        return self.ly()
+
+    def _write_ly(self, addr, value):
+        pass
+
+    def _read_lyc(self, addr):
+        return self.lyc
+
+    def _write_lyc(self, addr, value):
+        now = self._now()
+        self.lyc = value
+        if self.lcdc & 0x80 and self.stat & 0x40:
+            line, dot = self._position(now)
+            self._update_stat_line(line, dot)
+
+    def render_line(self, line):
+        """Draw background, window and sprites of scanline `line` into `frame`."""
+        lcdc = self.lcdc
+        io = self.memory.io
+        frame = self.frame
+        bg = self._bg
+        base = line * WIDTH
+        lut = self.palettes.bg
+        # En CGB el bit 0 de LCDC no apaga el fondo, solo le quita la prioridad
+        if lcdc & 0x01 or self.cgb:
+            self._render_tiles(bg, 0, io[0x43], (line + io[0x42]) & 0xFF, 0x1C00 if lcdc & 0x08 else 0x1800)
+            wx = io[0x4B] - 7
+            if lcdc & 0x20 and io[0x4A] <= line and wx < WIDTH:
+                self._render_tiles(bg, max(wx, 0), -wx, self._window_line, 0x1C00 if lcdc & 0x40 else 0x1800)
+                self._window_line += 1
+            if self.cgb:
+                attr = self._bg_attr
+                for x in range(WIDTH):
+                    frame[base + x] = lut[((attr[x] & 7) << 2) | bg[x]]
+            else:
+                for x in range(WIDTH):
+                    frame[base + x] = lut[bg[x]]
+        else:
+            white = self.palettes.shades[0]
+            for x in range(WIDTH):
+                bg[x] = 0
+                frame[base + x] = white
+        if lcdc & 0x02:
+            self._render_sprites(line, base)
+
+    def _render_tiles(self, out, start, scroll_x, y, map_base):
+        """Color indices of a tile map row into out[start:]; pixel x of the screen shows map column x + scroll_x.
+
+        In CGB mode the tile attributes (palette, bank, flips, priority) go into `_bg_attr`.
+        """
+        vram = self.memory.vram
+        attrs = self._bg_attr
+        cgb = self.cgb
+        signed = not self.lcdc & 0x10
+        row = map_base + (y >> 3) * 32
+        x = start
+        attr = 0
+        while x < WIDTH:
+            map_x = (x + scroll_x) & 0xFF
+            tile = vram[row + (map_x >> 3)]
+            fine_y = y & 7
+            if cgb:
+                # Los atributos están en el banco 1, en la misma posición del mapa
+                attr = vram[0x2000 + row + (map_x >> 3)]
+                if attr & 0x40:
+                    fine_y = 7 - fine_y
+            if signed:
+                addr = 0x1000 + (tile - 0x100 if tile & 0x80 else tile) * 16 + fine_y * 2
+            else:
+                addr = tile * 16 + fine_y * 2
+            if attr & 0x08:
+                addr += 0x2000
+            lo = vram[addr]
+            hi = vram[addr + 1]
+            bit = 7 - (map_x & 7)
+            while bit >= 0 and x < WIDTH:
+                shift = 7 - bit if attr & 0x20 else bit
+                out[x] = ((lo >> shift) & 1) | (((hi >> shift) & 1) << 1)
+                attrs[x] = attr
+                bit -= 1
+                x += 1
+
+    def oam_changed(self):
+        """Mark the sprite index for a rebuild, after OAM is replaced as a whole (DMA)."""
+        self._sprites_dirty = True
+
+    def _oam_written(self, index, value):
+        if self._sprites_dirty:
+            return
+        i = index >> 2
+        field = index & 3
+        if field == 0:
+            self._unindex(i)
+            self._index(i, False)
+        elif field == 1:
+            # Cambia la X: solo cambia el orden de prioridad
+            first, last = self._sprite_lines[i]
+            for line in range(first, last):
+                self._line_order[line] = None
+
+    def _index(self, i, append):
+        height = 16 if self.lcdc & 0x04 else 8
+        y = self.memory.oam[i * 4] - 16
+        first = max(y, 0)
+        last = min(y + height, HEIGHT)
+        for line in range(first, last):
+            sprites = self._line_sprites[line]
+            if append:
+                sprites.append(i)
+            else:
+                # Se mantiene el orden de OAM
+                pos = len(sprites)
+                while pos > 0 and sprites[pos - 1] > i:
+                    pos -= 1
+                sprites.insert(pos, i)
+            self._line_order[line] = None
+        self._sprite_lines[i] = (first, max(first, last))
+
+    def _unindex(self, i):
+        first, last = self._sprite_lines[i]
+        for line in range(first, last):
+            self._line_sprites[line].remove(i)
+            self._line_order[line] = None
+        self._sprite_lines[i] = (0, 0)
+
+    def _rebuild_sprites(self):
+        for line in range(HEIGHT):
+            self._line_sprites[line] = []
+            self._line_order[line] = None
+        for i in range(40):
+            self._index(i, True)
+        self._sprites_dirty = False
+
+    def sprites_on_line(self, line):
+        """OAM indices of the sprites drawn on `line`, highest priority first."""
+        if self._sprites_dirty:
+            self._rebuild_sprites()
+        order = self._line_order[line]
+        if order is None:
+            oam = self.memory.oam
+            # Hasta 10 sprites por línea, los primeros en OAM. Prioridad en DMG:
+            # menor X primero y, a igual X, menor índice
+            # En CGB manda solo el orden de OAM
+            order = self._line_sprites[line][:10]
+            if not self.cgb:
+                order.sort(key=lambda i: (oam[i * 4 + 1], i))
+            self._line_order[line] = order
+        return order
+
+    def _render_sprites(self, line, base):
+        height = 16 if self.lcdc & 0x04 else 8
+        taken = self._taken
+        for x in range(WIDTH):
+            taken[x] = 0
+        for i in self.sprites_on_line(line):
+            self._draw_sprite(i, line, height, base)
+
+    def _draw_sprite(self, i, line, height, base):
+        oam = self.memory.oam
+        vram = self.memory.vram
+        frame = self.frame
+        bg = self._bg
+        bg_attr = self._bg_attr
+        taken = self._taken
+        y = oam[i * 4] - 16
+        x = oam[i * 4 + 1] - 8
+        tile = oam[i * 4 + 2]
+        attr = oam[i * 4 + 3]
+        row = line - y
+        if attr & 0x40:
+            row = height - 1 - row
+        if height == 16:
+            tile &= 0xFE
+        addr = tile * 16 + row * 2
+        if self.cgb:
+            if attr & 0x08:
+                addr += 0x2000
+            palette = (attr & 7) << 2
+            # Con el bit 0 de LCDC a 0, los sprites quedan siempre delante
+            master = self.lcdc & 0x01
+        else:
+            palette = 4 if attr & 0x10 else 0
+            master = 1
+        lo = vram[addr]
+        hi = vram[addr + 1]
+        lut = self.palettes.obj
+        behind = attr & 0x80
+        for px in range(8):
+            sx = x + px
+            if sx < 0 or sx >= WIDTH or taken[sx]:
+                continue
+            bit = px if attr & 0x20 else 7 - px
+            color = ((lo >> bit) & 1) | (((hi >> bit) & 1) << 1)
+            if color == 0:
+                continue
+            # El píxel es de este sprite aunque quede detrás del fondo
+            taken[sx] = 1
+            if master and bg[sx] and (behind or bg_attr[sx] & 0x80):
+                continue
+            frame[base + sx] = lut[palette | color]
@@ -0,0 +1,238 @@
+"""
+Instruction-level profiler
+
+While running, the profiler is a `Cpu` hook that layers instrumented copies over
+its dispatch tables, so a CPU that is not being profiled pays nothing for it.
+It records per-opcode counts and cycles, hits per PC bucketed by ROM bank, and a
+shadow call stack (CALL/RST/interrupts push, RET/RETI pop) from which cycles are
+attributed to routines. Results can be written as JSON or as folded stacks for
+flamegraph.pl and compatible tools.
+"""
+
+import json
+
+from disassembler import opcodes, cb_opcodes
+
+# Banco ficticio para el código que se ejecuta fuera de la ROM
+RAM = 0xFFFF
+
+_call_ops = {0xC4, 0xCC, 0xCD, 0xD4, 0xDC} | {0xC7 | (n << 3) for n in range(8)}
+_ret_ops = {0xC0, 0xC8, 0xC9, 0xD0, 0xD8, 0xD9}
+
+# Límite de la pila de llamadas: hay juegos que saltan fuera de una rutina sin RET
+max_depth = 64
+
+def _mnemonic(op):
+    return op.fmt.replace('{n}', 'n').replace('{nn}', 'nn').replace('{e}', 'e').replace('{s}', '+e')
+
+def bank_name(bank):
+    return 'RAM' if bank == RAM else f'{bank:02X}'
+
+class Profiler:
+    def __init__(self, cpu, symbols=None):
+        """`symbols` optionally maps routine addresses, either `addr` or `(bank, addr)`, to names."""
+        self.cpu = cpu
+        self.symbols = symbols or {}
+        self.running = False
+        self.reset()
+
+    def reset(self):
+        self.instructions = 0
+        self.cycles = 0
+        self.op_counts = [0] * 256
+        self.op_cycles = [0] * 256
+        self.cb_counts = [0] * 256
+        self.cb_cycles = [0] * 256
+        # (banco << 16) | pc -> veces ejecutado
+        self.pc_hits = {}
+        # Pila de llamadas: cada marco es (banco << 16) | dirección de la rutina
+        self._frames = []
+        self._stack_ids = {(): 0}
+        self._stacks = [()]
+        self._stack_id = 0
+        self._id_stack = []
+        self._overflow = 0
+        # (id de pila << 9) | opcode (256 + n para $CB n) -> ciclos
+        self._folded = {}
+
+    def start(self):
+        """Install the instrumented dispatch tables as a `Cpu` hook."""
+        if self.running:
+            return
+        self.cpu.add_hook(self)
+        self.running = True
+
+    def stop(self):
+        """Remove the instrumented dispatch tables."""
+        if not self.running:
+            return
+        self.cpu.remove_hook(self)
+        self.running = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _location(self, pc):
+        if pc < 0x8000:
+            return (self.cpu.memory.bank_at(pc) << 16) | pc
+        return (RAM << 16) | pc
+
+    def _push(self, frame):
+        if len(self._frames) >= max_depth:
+            self._overflow += 1
+            return
+        self._id_stack.append(self._stack_id)
+        self._frames.append(frame)
+        stack = tuple(self._frames)
+        stack_id = self._stack_ids.get(stack)
+        if stack_id is None:
+            stack_id = len(self._stacks)
+            self._stack_ids[stack] = stack_id
+            self._stacks.append(stack)
+        self._stack_id = stack_id
+
+    def _pop(self):
+        if self._overflow:
+            self._overflow -= 1
+        elif self._frames:
+            self._frames.pop()
+            self._stack_id = self._id_stack.pop()
+
+    def instrument(self, ops, cb_ops, interrupt):
+        prof = self
+        cpu = self.cpu
+        hits = self.pc_hits
+        folded = self._folded
+        location = self._location
+        op_counts, op_cycles = self.op_counts, self.op_cycles
+        cb_counts, cb_cycles = self.cb_counts, self.cb_cycles
+
+        def count(code, pc, cycles):
+            prof.instructions += 1
+            prof.cycles += cycles
+            op_counts[code] += 1
+            op_cycles[code] += cycles
+            key = location(pc)
+            hits[key] = hits.get(key, 0) + 1
+
+        def make_op(code, fn):
+            def op():
+                pc = (cpu._pc - 1) & 0xFFFF
+                cycles = fn()
+                count(code, pc, cycles)
+                key = (prof._stack_id << 9) | code
+                folded[key] = folded.get(key, 0) + cycles
+                return cycles
+            return op
+
+        def make_prefix(fn):
+            def op():
+                pc = (cpu._pc - 1) & 0xFFFF
+                cycles = fn()
+                # Los ciclos por rutina se anotan desde la tabla $CB
+                count(0xCB, pc, cycles)
+                return cycles
+            return op
+
+        def make_cb(code, fn):
+            def op():
+                cycles = fn()
+                cb_counts[code] += 1
+                cb_cycles[code] += cycles
+                key = (prof._stack_id << 9) | (256 + code)
+                folded[key] = folded.get(key, 0) + cycles
+                return cycles
+            return op
+
+        def make_call(code, fn):
+            counted = make_op(code, fn)
+            def op():
+                sp = cpu._sp
+                cycles = counted()
+                if cpu._sp == (sp - 2) & 0xFFFF:
+                    prof._push(location(cpu._pc))
+                return cycles
+            return op
+
+        def make_ret(code, fn):
+            counted = make_op(code, fn)
+            def op():
+                sp = cpu._sp
+                cycles = counted()
+                if cpu._sp == (sp + 2) & 0xFFFF:
+                    prof._pop()
+                return cycles
+            return op
+
+        new_ops = []
+        for code, fn in enumerate(ops):
+            if code == 0xCB:
+                new_ops.append(make_prefix(fn))
+            elif code in _call_ops:
+                new_ops.append(make_call(code, fn))
+            elif code in _ret_ops:
+                new_ops.append(make_ret(code, fn))
+            else:
+                new_ops.append(make_op(code, fn))
+        return new_ops, [make_cb(code, fn) for code, fn in enumerate(cb_ops)], self._make_interrupt(interrupt)
+
+    def _make_interrupt(self, interrupt):
+        prof = self
+        cpu = self.cpu
+        def op(pending):
+            cycles = interrupt(pending)
+            prof.cycles += cycles
+            prof._push(prof._location(cpu._pc))
+            return cycles
+        return op
+
+    def frame_name(self, frame):
+        bank, addr = frame >> 16, frame & 0xFFFF
+        name = self.symbols.get((bank, addr))
+        if name is None:
+            name = self.symbols.get(addr)
+        if name is None:
+            name = f'{bank_name(bank)}:{addr:04X}'
+        return name
+
+    def to_dict(self):
+        """Profile as plain data, ready for json."""
+        pcs = {}
+        for key, n in self.pc_hits.items():
+            pcs.setdefault(bank_name(key >> 16), {})[f'{key & 0xFFFF:04X}'] = n
+        return {
+            'instructions': self.instructions,
+            'cycles': self.cycles,
+            'opcodes': {f'{code:02X}': {'name': _mnemonic(opcodes[code]) if opcodes[code] else 'PREFIX CB',
+                                        'count': n, 'cycles': self.op_cycles[code]}
+                        for code, n in enumerate(self.op_counts) if n},
+            'cb_opcodes': {f'{code:02X}': {'name': _mnemonic(cb_opcodes[code]), 'count': n, 'cycles': self.cb_cycles[code]}
+                           for code, n in enumerate(self.cb_counts) if n},
+            'pc': pcs,
+        }
+
+    def dump_json(self, f):
+        json.dump(self.to_dict(), f, indent=1, sort_keys=True)
+
+    def folded(self):
+        """Folded stack lines ('frame;frame;opcode cycles'), sorted."""
+        names = {}
+        lines = []
+        for key, cycles in self._folded.items():
+            stack_id, code = key >> 9, key & 0x1FF
+            prefix = names.get(stack_id)
+            if prefix is None:
+                prefix = ''.join(self.frame_name(frame) + ';' for frame in self._stacks[stack_id])
+                names[stack_id] = prefix
+            op = _mnemonic(cb_opcodes[code - 256]) if code > 0xFF else _mnemonic(opcodes[code])
+            lines.append(f'{prefix}{op} {cycles}')
+        lines.sort()
+        return lines
+
+    def dump_folded(self, f):
+        for line in self.folded():
+            f.write(line + '\n')
@@ -0,0 +1,112 @@
+'''ROM image builder for assembled code'''
+
+from cart import Capability, nintendo_logo, cart_types, rom_sizes, ram_sizes
+
+_entry_point = bytes([0x00, 0xC3, 0x50, 0x01])  # NOP; JP $0150
+_logo = bytes(nintendo_logo)
+
+def _as_patch(code):
+    '''Accepts an Assembler (or anything with get_patch()) or a dict addr->byte'''
+    if hasattr(code, 'get_patch'):
+        return code.get_patch()
+    return code
+
+def _rom_size_for(size):
+    for size_id in range(0x09):
+        if size_id in rom_sizes and rom_sizes[size_id] * 0x4000 >= size:
+            return size_id
+    raise ValueError(f'Code does not fit in any ROM size: {size} bytes')
+
+def build_rom(code, title='', cart_type=0x00, rom_size_id=None, ram_size_id=0x00, banks=None,
+              cgb=Capability.Unavailable, sgb=False, manufacturer='', destination=1, version=0, fill=0xFF):
+    '''Build a complete cartridge image from assembled code.
+
+    `code` is an Assembler or its patch, addressed in the $0000-$7FFF ROM area. `banks`
+    optionally maps switchable bank numbers to more patches addressed in $4000-$7FFF.
+    The header ($0104-$014F) is generated here, so the code must not write to it; if it
+    leaves the entry point ($0100-$0103) empty, a jump to $0150 is added.
+    Returns a bytearray that passes every check made by `Cart`.
+    '''
+    patch = _as_patch(code)
+    banks = {bank: _as_patch(c) for bank, c in (banks or {}).items()}
+    if cart_type not in cart_types:
+        raise ValueError(f'Unknown cart type: ${cart_type:02X}')
+    if ram_size_id not in ram_sizes:
+        raise ValueError(f'Unknown RAM size id: ${ram_size_id:02X}')
+
+    size = 0x8000
+    if patch:
+        size = max(size, max(patch.keys()) + 1)
+    if banks:
+        size = max(size, (max(banks.keys()) + 1) * 0x4000)
+    if rom_size_id is None:
+        rom_size_id = _rom_size_for(size)
+    elif rom_size_id not in rom_sizes:
+        raise ValueError(f'Unknown ROM size id: ${rom_size_id:02X}')
+    elif rom_sizes[rom_size_id] * 0x4000 < size:
+        raise ValueError(f'Code does not fit in ROM size id ${rom_size_id:02X}')
+
+    rom = bytearray([fill]) * (rom_sizes[rom_size_id] * 0x4000)
+    for addr, value in patch.items():
+        if addr >= 0x8000:
+            raise ValueError(f'Address out of ROM: ${addr:04X}')
+        if 0x104 <= addr < 0x150:
+            raise ValueError(f'Code overlaps cartridge header: ${addr:04X}')
+        rom[addr] = value
+    for bank, bank_patch in banks.items():
+        if bank < 1:
+            raise ValueError(f'Bank {bank} is not switchable')
+        offset = bank * 0x4000 - 0x4000
+        for addr, value in bank_patch.items():
+            if addr < 0x4000 or addr >= 0x8000:
+                raise ValueError(f'Address out of switchable bank: ${addr:04X}')
+            rom[offset + addr] = value
+    if all(addr not in patch for addr in range(0x100, 0x104)):
+        rom[0x100:0x104] = _entry_point
+
+    write_header(rom, title, cart_type, rom_size_id, ram_size_id, cgb, sgb, manufacturer, destination, version)
+    return rom
+
+def write_header(rom, title='', cart_type=0x00, rom_size_id=0x00, ram_size_id=0x00,
+                 cgb=Capability.Unavailable, sgb=False, manufacturer='', destination=1, version=0):
+    '''Write the cartridge header ($0104-$014F) and both checksums into `rom`'''
+    if cgb == Capability.Unavailable:
+        title_length = 16
+        if manufacturer:
+            raise ValueError('Manufacturer code requires a CGB cart')
+    elif manufacturer:
+        if len(manufacturer) != 4 or '\0' in manufacturer:
+            raise ValueError(f'Manufacturer code must have 4 characters: {manufacturer!r}')
+        title_length = 11
+    else:
+        # Con $013F-$0142 todos distintos de cero, Cart lee un código de fabricante:
+        # el último byte del título se deja a cero
+        title_length = 14
+    title = title.encode('ascii')
+    if len(title) > title_length:
+        raise ValueError(f'Title longer than {title_length} characters: {title!r}')
+
+    rom[0x104:0x134] = _logo
+    rom[0x134:0x144] = bytes(16)
+    rom[0x134:0x134 + len(title)] = title
+    if manufacturer:
+        rom[0x13F:0x143] = manufacturer.encode('ascii')
+    if cgb != Capability.Unavailable:
+        rom[0x143] = 0xC0 if cgb == Capability.Required else 0x80
+    rom[0x144:0x146] = b'00'
+    rom[0x146] = 0x03 if sgb else 0x00
+    rom[0x147] = cart_type
+    rom[0x148] = rom_size_id
+    rom[0x149] = ram_size_id
+    rom[0x14A] = 1 if destination else 0
+    # $33: usar el código de licencia nuevo ($0144), obligatorio para SGB
+    rom[0x14B] = 0x33
+    rom[0x14C] = version & 0xFF
+    update_checksums(rom)
+
+def update_checksums(rom):
+    '''Recompute the header and global checksums of a ROM image in place'''
+    rom[0x14D] = -(sum(rom[0x134:0x14D]) + 0x19) & 0xFF
+    total = (sum(rom) - rom[0x14E] - rom[0x14F]) & 0xFFFF
+    rom[0x14E] = total >> 8
+    rom[0x14F] = total & 0xFF
@@ -0,0 +1,314 @@
+"""
+Round-trip checks and benchmarks
+
+Random instruction streams are generated from the decode tables, disassembled,
+assembled back and executed on `Cpu`. Any difference between the original bytes,
+the reassembled bytes and what the CPU actually does is reported as a mismatch.
+Cycle counts are checked against the documented timing of every opcode, and a
+set of reference vectors checks registers and flags after known operations.
+The same streams feed the throughput benchmarks, whose results are compared with
+the baseline stored in bench_baseline.json. Rates are stored relative to a fixed
+pure-Python calibration loop timed in the same run, so the baseline carries over
+between machines; it still shifts between Python versions, where the
+interpreter speeds up some kinds of code more than others.
+
+Usage: python roundtrip.py [--seed N] [--count N] [--update] [--tolerance F]
+"""
+
+import json
+import os
+import random
+import sys
+import time
+
+from assembler import Assembler
+from cart import Cart
+from cpu import Cpu
+from disassembler import opcodes, disassemble
+from memory import Memory
+from rombuilder import build_rom
+from stubs import Uint8Array
+
+baseline_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.json')
+
+# Dirección donde se carga el código generado
+origin = 0x150
+
+# Instrucciones que cambian el flujo o paran la CPU: no valen para código lineal
+_flow = {'JR', 'JP', 'CALL', 'RET', 'RETI', 'RST', 'HALT', 'STOP', 'EI'}
+
+# Ciclos de reloj de cada código de operación según la documentación del SM83, sin
+# pasar por Cpu; 0 en los inválidos. En los saltos condicionales, sin saltar
+_cycles = [
+     4, 12,  8,  8,  4,  4,  8,  4, 20,  8,  8,  8,  4,  4,  8,  4,
+     4, 12,  8,  8,  4,  4,  8,  4, 12,  8,  8,  8,  4,  4,  8,  4,
+     8, 12,  8,  8,  4,  4,  8,  4,  8,  8,  8,  8,  4,  4,  8,  4,
+     8, 12,  8,  8, 12, 12, 12,  4,  8,  8,  8,  8,  4,  4,  8,  4,
+] + [4, 4, 4, 4, 4, 4, 8, 4] * 6 + [8, 8, 8, 8, 8, 8, 4, 8, 4, 4, 4, 4, 4, 4, 8, 4] + [4, 4, 4, 4, 4, 4, 8, 4] * 8 + [
+     8, 12, 12, 16, 12, 16,  8, 16,  8, 16, 12,  0, 12, 24,  8, 16,
+     8, 12, 12,  0, 12, 16,  8, 16,  8, 16, 12,  0, 12,  0,  8, 16,
+    12, 12,  8,  0,  0, 16,  8, 16, 16,  4, 16,  0,  0,  0,  8, 16,
+    12, 12,  8,  4,  0, 16,  8, 16, 12,  8, 16,  4,  0,  0,  8, 16,
+]
+
+# Ciclos de los saltos condicionales cuando se salta
+_taken = {0x20: 12, 0x28: 12, 0x30: 12, 0x38: 12, 0xC0: 20, 0xC8: 20, 0xD0: 20, 0xD8: 20,
+          0xC2: 16, 0xCA: 16, 0xD2: 16, 0xDA: 16, 0xC4: 24, 0xCC: 24, 0xD4: 24, 0xDC: 24}
+
+def expected_cycles(code):
+    """Clock cycles the instruction starting with bytes `code` may take, per the documentation."""
+    if code[0] == 0xCB:
+        n = code[1]
+        if n & 7 != 6:
+            return (8,)
+        return (12,) if 0x40 <= n < 0x80 else (16,)
+    if code[0] in _taken:
+        return (_cycles[code[0]], _taken[code[0]])
+    return (_cycles[code[0]],)
+
+# Vectores de referencia: (código, registros antes, registros esperados después).
+# Los resultados salen de la documentación, no de Cpu; los registros que no se
+# dan empiezan a 0
+vectors = [
+    ('ADD A,B', {'A': 0x3A, 'B': 0xC6}, {'A': 0x00, 'F': 0xB0}),
+    ('ADC A,E', {'A': 0xE1, 'E': 0x0F, 'F': 0x10}, {'A': 0xF1, 'F': 0x20}),
+    ('SUB E', {'A': 0x3E, 'E': 0x3E}, {'A': 0x00, 'F': 0xC0}),
+    ('SBC A,H', {'A': 0x3B, 'H': 0x2A, 'F': 0x10}, {'A': 0x10, 'F': 0x40}),
+    ('CP B', {'A': 0x3C, 'B': 0x2F}, {'A': 0x3C, 'F': 0x60}),
+    ('AND L', {'A': 0x5A, 'L': 0x3F}, {'A': 0x1A, 'F': 0x20}),
+    ('XOR A', {'A': 0xFF, 'F': 0x70}, {'A': 0x00, 'F': 0x80}),
+    ('OR B', {'A': 0x5A, 'F': 0xF0}, {'A': 0x5A, 'F': 0x00}),
+    ('INC L', {'L': 0xFF, 'F': 0x10}, {'L': 0x00, 'F': 0xB0}),
+    ('DEC L', {'L': 0x01}, {'L': 0x00, 'F': 0xC0}),
+    ('DEC A', {'A': 0x00}, {'A': 0xFF, 'F': 0x60}),
+    ('ADD HL,BC', {'HL': 0x8A23, 'BC': 0x0605, 'F': 0x80}, {'HL': 0x9028, 'F': 0xA0}),
+    ('ADD HL,HL', {'HL': 0x8A23}, {'HL': 0x1446, 'F': 0x30}),
+    ('ADD SP,2', {'SP': 0xFFF8, 'F': 0xF0}, {'SP': 0xFFFA, 'F': 0x00}),
+    ('ADD SP,-1', {'SP': 0x0001}, {'SP': 0x0000, 'F': 0x30}),
+    ('LD HL,SP+2', {'SP': 0xFFF8}, {'HL': 0xFFFA, 'SP': 0xFFF8, 'F': 0x00}),
+    ('ADD A,B\nDAA', {'A': 0x45, 'B': 0x38}, {'A': 0x83, 'F': 0x00}),
+    ('SUB B\nDAA', {'A': 0x83, 'B': 0x38}, {'A': 0x45, 'F': 0x40}),
+    ('RLCA', {'A': 0x85}, {'A': 0x0B, 'F': 0x10}),
+    ('RLA', {'A': 0x95, 'F': 0x10}, {'A': 0x2B, 'F': 0x10}),
+    ('RRCA', {'A': 0x3B}, {'A': 0x9D, 'F': 0x10}),
+    ('RRA', {'A': 0x81}, {'A': 0x40, 'F': 0x10}),
+    ('SWAP A', {'A': 0xF0, 'F': 0xF0}, {'A': 0x0F, 'F': 0x00}),
+    ('BIT 7,H', {'H': 0x80}, {'H': 0x80, 'F': 0x20}),
+    ('BIT 4,L', {'L': 0xEF, 'F': 0x10}, {'F': 0xB0}),
+    ('SRA A', {'A': 0x8A}, {'A': 0xC5, 'F': 0x00}),
+    ('SRL A', {'A': 0x01}, {'A': 0x00, 'F': 0x90}),
+    ('SLA D', {'D': 0x80}, {'D': 0x00, 'F': 0x90}),
+    ('CPL', {'A': 0x35}, {'A': 0xCA, 'F': 0x60}),
+    ('SCF', {'F': 0xE0}, {'F': 0x90}),
+    ('CCF', {'F': 0x90}, {'F': 0x80}),
+]
+
+def _opcode_pool(straight):
+    pool = []
+    for code, op in enumerate(opcodes):
+        if op is None:
+            pool.extend((0xCB, n) for n in range(256))
+        elif op.fmt.startswith('.byte'):
+            continue
+        elif not straight or op.fmt.split()[0] not in _flow:
+            pool.append((code,))
+    return pool
+
+_pools = {True: _opcode_pool(True), False: _opcode_pool(False)}
+
+def random_code(rng, count, straight=True):
+    """`count` random valid instructions, as bytes.
+
+    With `straight`, only instructions that fall through to the next one are
+    generated, so the stream can be executed from start to end.
+    """
+    pool = _pools[straight]
+    out = bytearray()
+    for _ in range(count):
+        code = rng.choice(pool)
+        out.extend(code)
+        if len(code) == 1:
+            size = opcodes[code[0]].size
+            if code[0] == 0x10:
+                # El ensamblador siempre genera STOP como 10 00
+                out.append(0)
+            elif code[0] in (0xEA, 0xFA):
+                # Con direcciones $FFxx el ensamblador elige LDH, más corto
+                out.extend((rng.randrange(256), rng.randrange(0xFF)))
+            else:
+                out.extend(rng.randrange(256) for _ in range(size - 1))
+    return bytes(out)
+
+def assemble(lines, org=origin):
+    """Assemble a list of source lines placed at `org`. Returns the bytes."""
+    patch = Assembler(f'.org {org}\n' + '\n'.join(lines)).get_patch()
+    return bytes(patch[org + i] for i in range(len(patch)))
+
+def _system(code, org=origin):
+    rom = build_rom({org + i: b for i, b in enumerate(code)})
+    memory = Memory(Cart('roundtrip.gb', Uint8Array(rom)))
+    cpu = Cpu(memory)
+    cpu.PC = org
+    cpu.SP = 0xFFFE
+    return cpu
+
+def check_round_trip(code, org=origin):
+    """Disassemble `code`, assemble the listing and compare.
+
+    Returns (listing, mismatches); each mismatch is a (addr, text, description) tuple.
+    """
+    listing = disassemble(code, org)
+    mismatches = []
+    try:
+        again = assemble([text for addr, size, text in listing], org)
+    except Exception as e:
+        return listing, [(org, '', f'assembler error: {e}')]
+    for addr, size, text in listing:
+        expected = code[addr - org:addr - org + size]
+        got = again[addr - org:addr - org + size]
+        if expected != got:
+            mismatches.append((addr, text, f'assembled {got.hex()} instead of {expected.hex()}'))
+    if len(again) != len(code):
+        mismatches.append((org + len(code), '', f'assembled {len(again)} bytes instead of {len(code)}'))
+    return listing, mismatches
+
+def check_execution(code, listing, org=origin):
+    """Run straight-line `code` on a fresh Cpu, one instruction per listing entry.
+
+    Checks that every instruction ends at the next one and spends the cycles the
+    documentation gives for its opcode. Returns a list of (addr, text, description) tuples.
+    """
+    cpu = _system(code, org)
+    mismatches = []
+    for addr, size, text in listing:
+        if cpu.PC != addr:
+            mismatches.append((addr, text, f'PC is ${cpu.PC:04X}'))
+            break
+        cycles = cpu.step()
+        if cpu.locked:
+            mismatches.append((addr, text, 'CPU locked'))
+            break
+        expected = expected_cycles(code[addr - org:addr - org + size])
+        if cycles not in expected:
+            mismatches.append((addr, text, f'{cycles} cycles instead of {"/".join(map(str, expected))}'))
+    return mismatches
+
+def check_vectors(vectors=vectors):
+    """Run every reference vector on a fresh Cpu. Returns a list of (addr, text, description) tuples."""
+    mismatches = []
+    for text, before, after in vectors:
+        lines = text.split('\n')
+        cpu = _system(assemble(lines))
+        for name, value in before.items():
+            setattr(cpu, name, value)
+        for line in lines:
+            cpu.step()
+        for name, value in sorted(after.items()):
+            got = getattr(cpu, name)
+            if got != value:
+                mismatches.append((origin, text.replace('\n', '; '), f'{name} is ${got:02X} instead of ${value:02X}'))
+    return mismatches
+
+def check(seed, count=1000):
+    """Full property check for one random stream. Returns the list of mismatches."""
+    rng = random.Random(seed)
+    code = random_code(rng, count)
+    listing, mismatches = check_round_trip(code)
+    if not mismatches:
+        mismatches = check_execution(code, listing)
+    return mismatches
+
+def _rate(fn, n, min_time=0.2):
+    # Repite hasta tener una medida de al menos min_time segundos
+    runs = 0
+    start = time.perf_counter()
+    while True:
+        fn()
+        runs += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return n * runs / elapsed
+
+def _calibration(n=10000):
+    # Trabajo fijo de Python puro (bucle, índices, aritmética y una llamada), del
+    # mismo tipo que el del emulador
+    table = list(range(256))
+    def add(total, value):
+        return (total + value) & 0xFFFF
+    def work():
+        total = 0
+        for i in range(n):
+            total = add(total, table[i & 0xFF])
+        return total
+    return _rate(work, n)
+
+def benchmark(seed=0, count=2000):
+    """Throughput of the hot paths, in items per calibration loop iteration."""
+    rng = random.Random(seed)
+    code = random_code(rng, count)
+    lines = [text for addr, size, text in disassemble(code, origin)]
+
+    # Bucle infinito sobre el código generado
+    loop = code + bytes([0xC3, origin & 0xFF, origin >> 8])
+    cpu = _system(loop)
+    def execute():
+        step = cpu.step
+        for _ in range(count):
+            step()
+
+    results = {
+        'assemble_lines': _rate(lambda: Assembler('\n'.join(lines)), len(lines)),
+        'disassemble_bytes': _rate(lambda: disassemble(code, origin), len(code)),
+        'execute_instructions': _rate(execute, count),
+    }
+    calibration = _calibration()
+    return {name: rate / calibration for name, rate in results.items()}
+
+def load_baseline(path=baseline_file):
+    with open(path) as f:
+        return json.load(f)
+
+def save_baseline(results, path=baseline_file):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+def regressions(results, baseline, tolerance=0.25):
+    """Names of the results that are more than `tolerance` slower than the baseline."""
+    return [name for name, rate in sorted(results.items())
+            if name in baseline and rate < baseline[name] * (1 - tolerance)]
+
+def main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(description='Assembler/disassembler/CPU round-trip checks and benchmarks')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--count', type=int, default=2000, help='instructions per stream')
+    parser.add_argument('--streams', type=int, default=20, help='random streams to check')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--update', action='store_true', help='store the results as the new baseline')
+    args = parser.parse_args(argv)
+
+    failed = False
+    for addr, text, description in check_vectors():
+        print(f'vector {text}: {description}')
+        failed = True
+    for seed in range(args.seed, args.seed + args.streams):
+        for addr, text, description in check(seed, args.count):
+            print(f'seed {seed}: ${addr:04X} {text}: {description}')
+            failed = True
+
+    results = benchmark(args.seed, args.count)
+    baseline = {} if args.update or not os.path.exists(baseline_file) else load_baseline()
+    for name, rate in sorted(results.items()):
+        ref = baseline.get(name)
+        print(f'{name:28} {rate:12.4f}' + (f'  ({rate / ref:.0%} of baseline)' if ref else ''))
+    slow = regressions(results, baseline, args.tolerance)
+    if slow:
+        print('Regressions: ' + ', '.join(slow))
+        failed = True
+    if args.update:
+        save_baseline(results)
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
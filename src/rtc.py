@@ -0,0 +1,104 @@
+'''MBC3 real time clock'''
+
+# Ciclos de reloj por segundo
+CLOCK = 4194304
+DAY = 86400
+# El contador de días tiene 9 bits
+_DAYS = 512
+
+class Rtc:
+    """MBC3 clock registers, computed from the CPU cycle counter like the timer.
+
+    Only the cycle at which the counter held 0 seconds is stored while it runs; the
+    registers are derived from it when they are latched. Selected with RAM banks
+    $08-$0C: seconds, minutes, hours, day low byte, and day high bit/halt/carry.
+    """
+    def __init__(self, cpu):
+        self.cpu = cpu
+        self._base = 0
+        # Segundos contados mientras está parado
+        self._halted_seconds = -1
+        self.carry = False
+        self.latched = [0] * 5
+        self._latch_armed = False
+
+    @property
+    def halted(self):
+        return self._halted_seconds >= 0
+
+    def seconds(self):
+        """Seconds counted, from 0 to 512 days."""
+        if self._halted_seconds >= 0:
+            return self._halted_seconds
+        seconds = (self.cpu.cycles - self._base) // CLOCK
+        if seconds >= _DAYS * DAY:
+            # El contador de días se desborda: se activa el acarreo y vuelve a empezar
+            wraps = seconds // (_DAYS * DAY)
+            self._base += wraps * _DAYS * DAY * CLOCK
+            seconds -= wraps * _DAYS * DAY
+            self.carry = True
+        return seconds
+
+    def _set_seconds(self, seconds):
+        if self._halted_seconds >= 0:
+            self._halted_seconds = seconds
+        else:
+            # Se conserva la fracción de segundo en curso
+            now = self.cpu.cycles
+            self._base = now - seconds * CLOCK - (now - self._base) % CLOCK
+
+    def registers(self):
+        """Current S, M, H, DL, DH values."""
+        seconds = self.seconds()
+        days = seconds // DAY
+        dh = (days >> 8) & 1
+        if self.halted:
+            dh |= 0x40
+        if self.carry:
+            dh |= 0x80
+        return [seconds % 60, (seconds // 60) % 60, (seconds // 3600) % 24, days & 0xFF, dh]
+
+    def set_registers(self, registers):
+        s, m, h, dl, dh = registers
+        seconds = (((dh & 1) << 8 | dl) * DAY + (h % 24) * 3600 + (m % 60) * 60 + s % 60) % (_DAYS * DAY)
+        self.carry = bool(dh & 0x80)
+        if dh & 0x40:
+            self._halted_seconds = seconds
+        else:
+            self._halted_seconds = -1
+            self._base = self.cpu.cycles
+            self._set_seconds(seconds)
+
+    def advance(self, seconds):
+        """Let `seconds` of real time pass, as when the cart was switched off."""
+        if not self.halted and seconds > 0:
+            self._base -= seconds * CLOCK
+
+    def read(self, register):
+        """Latched value of register $08-$0C."""
+        return self.latched[register - 0x08]
+
+    def write(self, register, value):
+        registers = self.registers()
+        registers[register - 0x08] = value
+        self.set_registers(registers)
+        self.latched[register - 0x08] = value
+
+    def write_latch(self, value):
+        # Escribir 0 y luego 1 copia los registros en los latches
+        if value == 1 and self._latch_armed:
+            self.latched = self.registers()
+        self._latch_armed = value == 0
+
+    def save_state(self):
+        return {
+            'base': self._base, 'halted_seconds': self._halted_seconds, 'carry': self.carry,
+            'latched': self.latched[:], 'latch_armed': self._latch_armed,
+        }
+
+    def load_state(self, state):
+        self._base = state['base']
+        self._halted_seconds = state['halted_seconds']
+        self.carry = state['carry']
+        self.latched = state['latched'][:]
+        self._latch_armed = state['latch_armed']
@@ -0,0 +1,86 @@
+"""
+Battery-backed cart RAM in a .sav file
+
+The cart RAM is an mmap of the file, so every write from the game goes straight
+to the page cache and the OS persists it; nothing has to be flushed per frame.
+Carts with an MBC3 clock get the usual 48-byte footer after the RAM (current and
+latched registers as 32-bit words, then the UNIX time of the save), which is
+rewritten on `flush()` and `close()`.
+"""
+
+import mmap
+import os
+import struct
+import time
+
+from stubs import Uint8Array
+
+# S, M, H, DL, DH actuales y latcheados, y la hora de guardado
+rtc_footer = struct.Struct('<10IQ')
+
+class MappedRam(mmap.mmap):
+    """mmap with the Uint8Array methods `Memory` uses."""
+    def slice(self, begin=None, end=None):
+        return Uint8Array(self[begin:end])
+    def subarray(self, begin=None, end=None):
+        return memoryview(self)[begin:end]
+    def set(self, array, offset=0):
+        self[offset:offset + len(array)] = bytes(array)
+    @property
+    def length(self) -> int:
+        return len(self)
+
+class SaveFile:
+    def __init__(self, memory, path):
+        """Back the cart RAM (and clock) of `memory` with the file at `path`, creating it if needed."""
+        self.memory = memory
+        self.path = path
+        size = memory.sram.length
+        self.f = open(path, 'r+b' if os.path.exists(path) else 'w+b')
+        self.f.seek(0, os.SEEK_END)
+        if self.f.tell() < size:
+            self.f.truncate(size)
+        self.ram = None
+        if size:
+            self.ram = MappedRam(self.f.fileno(), size)
+            memory.sram = self.ram
+        self._load_rtc(size)
+
+    def _load_rtc(self, size):
+        rtc = self.memory.rtc
+        if rtc is None:
+            return
+        self.f.seek(size)
+        data = self.f.read(rtc_footer.size)
+        if len(data) == rtc_footer.size:
+            values = rtc_footer.unpack(data)
+            rtc.set_registers([value & 0xFF for value in values[0:5]])
+            rtc.latched = [value & 0xFF for value in values[5:10]]
+            # El reloj sigue en marcha con la consola apagada
+            rtc.advance(int(time.time()) - values[10])
+
+    def flush(self):
+        rtc = self.memory.rtc
+        if rtc is not None:
+            self.f.seek(self.memory.sram.length)
+            self.f.write(rtc_footer.pack(*(rtc.registers() + rtc.latched + [int(time.time())])))
+            self.f.flush()
+        if self.ram is not None:
+            self.ram.flush()
+
+    def close(self):
+        """Write the clock and unmap the file; the cart RAM goes back to an in-memory copy."""
+        if self.f.closed:
+            return
+        self.flush()
+        if self.ram is not None:
+            self.memory.sram = self.ram.slice()
+            self.ram.close()
+            self.ram = None
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,61 @@
+'''Cycle-timestamped event queue'''
+
+# Marca de tiempo de un evento sin programar (2^52, exacto también en JavaScript)
+NEVER = 0x10000000000000
+
+class Event:
+    """Something that must happen at a given cycle. `callback(time)` receives the scheduled time."""
+    def __init__(self, name, callback):
+        self.name = name
+        self.callback = callback
+        self.time = NEVER
+
+    @property
+    def scheduled(self):
+        return self.time != NEVER
+
+class Scheduler:
+    """Pending events sorted by time.
+
+    There are only a handful of event sources (timer, PPU, DMA...), so a sorted list
+    beats a heap. `next_time` is kept up to date so the CPU only has to compare it
+    with its cycle counter after each instruction.
+    """
+    def __init__(self):
+        self._events = []
+        self.next_time = NEVER
+
+    def schedule(self, event, time):
+        """Schedule `event` at cycle `time`, replacing its previous time if it had one."""
+        if event.time != NEVER:
+            self._events.remove(event)
+        event.time = time
+        events = self._events
+        i = len(events)
+        while i > 0 and events[i - 1].time > time:
+            i -= 1
+        events.insert(i, event)
+        self.next_time = events[0].time
+
+    def cancel(self, event):
+        if event.time != NEVER:
+            self._events.remove(event)
+            event.time = NEVER
+            self.next_time = self._events[0].time if len(self._events) else NEVER
+
+    def restore(self, event, time):
+        """Schedule or cancel `event` so it fires at `time`, as saved in a state."""
+        if time == NEVER:
+            self.cancel(event)
+        else:
+            self.schedule(event, time)
+
+    def run(self, now):
+        """Fire, in order, every event due at or before cycle `now`."""
+        events = self._events
+        while len(events) and events[0].time <= now:
+            event = events.pop(0)
+            time = event.time
+            event.time = NEVER
+            self.next_time = events[0].time if len(events) else NEVER
+            event.callback(time)
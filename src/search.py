@@ -0,0 +1,130 @@
+"""
+Branching search from a snapshot
+
+`explore()` runs many joypad input sequences (one button mask per frame) from
+the current state of a `System` and reports, for each branch, a hash of the
+state it reaches and the values of user-defined metrics computed from it.
+
+Two ways of going back to the starting point for each branch:
+- 'restore': one in-memory snapshot, loaded before each branch. `load_state`
+  copies into the existing buffers, so it costs a few memcpys.
+- 'fork': every branch runs in a child created with `os.fork()`, which inherits
+  the whole emulator copy-on-write; only the pages the branch writes get copied.
+  Branches run in parallel, up to `workers` at a time (POSIX only).
+"""
+
+import hashlib
+import os
+import pickle
+from collections import namedtuple
+
+Branch = namedtuple('Branch', 'inputs state_hash metrics')
+
+def _update(h, state):
+    for key in sorted(state):
+        value = state[key]
+        h.update(key.encode())
+        if isinstance(value, dict):
+            h.update(b'{')
+            _update(h, value)
+            h.update(b'}')
+        elif isinstance(value, (bool, int, str, list)):
+            h.update(b'=' + repr(value).encode())
+        else:
+            data = memoryview(value).cast('B')
+            h.update(b':%d:' % len(data))
+            h.update(data)
+        h.update(b';')
+
+def state_hash(system):
+    """Hash of what determines the future of `system`: everything in its saved state.
+
+    The frame buffer is left out: it is only output.
+    """
+    state = system.save_state()
+    state['ppu'] = {key: value for key, value in state['ppu'].items() if key != 'frame'}
+    h = hashlib.blake2b(digest_size=16)
+    _update(h, state)
+    return h.hexdigest()
+
+def _run(system, inputs, metrics):
+    system.run_inputs(inputs)
+    return Branch(inputs, state_hash(system), {name: fn(system) for name, fn in metrics.items()})
+
+def explore_restore(system, branches, metrics):
+    snapshot = system.save_state()
+    results = []
+    for inputs in branches:
+        try:
+            results.append(_run(system, inputs, metrics))
+        finally:
+            system.load_state(snapshot)
+    return results
+
+def _read_all(fd):
+    chunks = []
+    while True:
+        chunk = os.read(fd, 0x10000)
+        if not chunk:
+            return b''.join(chunks)
+        chunks.append(chunk)
+
+def explore_fork(system, branches, metrics, workers=None):
+    if workers is None:
+        workers = os.cpu_count() or 1
+    results = [None] * len(branches)
+    running = {}
+    pending = list(enumerate(branches))
+    pending.reverse()
+    try:
+        while pending or running:
+            while pending and len(running) < workers:
+                index, inputs = pending.pop()
+                r, w = os.pipe()
+                pid = os.fork()
+                if pid == 0:
+                    # Hijo: ejecuta la rama sobre su copia y devuelve el resultado por la tubería
+                    os.close(r)
+                    status = 0
+                    try:
+                        data = pickle.dumps(_run(system, inputs, metrics), pickle.HIGHEST_PROTOCOL)
+                        view = memoryview(data)
+                        while view:
+                            view = view[os.write(w, view):]
+                    except BaseException:
+                        status = 1
+                    finally:
+                        os._exit(status)
+                os.close(w)
+                running[pid] = (index, r)
+            # Se lee antes de esperar: un resultado grande bloquearía al hijo en la tubería
+            pid = next(iter(running))
+            index, r = running.pop(pid)
+            try:
+                data = _read_all(r)
+            finally:
+                os.close(r)
+                os.waitpid(pid, 0)
+            if not data:
+                raise RuntimeError(f'Branch {index} failed')
+            results[index] = pickle.loads(data)
+    finally:
+        # Si algo falla, no quedan hijos sin recoger ni tuberías abiertas; al cerrar
+        # la tubería, un hijo que siga escribiendo termina con error
+        for pid, (index, r) in running.items():
+            os.close(r)
+            os.waitpid(pid, 0)
+    return results
+
+def explore(system, branches, metrics=None, mode='restore', workers=None):
+    """Run every input sequence in `branches` from the current state of `system`.
+
+    `metrics` maps names to functions of the resulting `System`. Returns a `Branch`
+    per input sequence, in order; `system` is left in its starting state.
+    """
+    metrics = metrics or {}
+    if mode == 'restore':
+        return explore_restore(system, branches, metrics)
+    if mode == 'fork':
+        return explore_fork(system, branches, metrics, workers)
+    raise ValueError(f'Unknown mode {mode!r}')
@@ -0,0 +1,228 @@
+"""
+Frame buffer and memory regions in shared memory
+
+`SharedExport` puts the PPU frame and selected `Memory` buffers of a `System`
+into one `multiprocessing.shared_memory` block: the emulator keeps writing to
+the memory buffers as usual, and other processes read them in place through
+`SharedView`, as memoryviews or NumPy arrays, with no serialization.
+
+The PPU keeps drawing into its private frame buffer; the shared `frame` is a
+second buffer that gets a copy of it at every VBlank, so it always holds one
+complete frame. The block starts with a 64-bit sequence counter used as a
+seqlock: it is odd while that copy is being made and even otherwise, and it
+advances by two per frame. Readers retry while it is odd or has changed during
+their copy, or poll it for new frames. Memory regions are the live buffers of
+the emulator and keep changing while it runs. The layout of the regions is
+stored as JSON after the counter, so a reader only needs the block name.
+`multiprocessing.shared_memory` needs Python 3.8.
+"""
+
+import ctypes
+import json
+import struct
+
+from stubs import Uint8Array, Uint32Array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Contador de secuencia y longitud del JSON con la distribución
+header = struct.Struct('<QI')
+# Las regiones empiezan en esta frontera, tras la cabecera
+_ALIGN = 4096
+
+# Región: (objeto, atributo, tipo de elemento)
+_regions = {
+    'frame': ('ppu', 'frame', ctypes.c_uint32),
+    'vram': ('memory', 'vram', ctypes.c_uint8),
+    'wram': ('memory', 'wram', ctypes.c_uint8),
+    'oam': ('memory', 'oam', ctypes.c_uint8),
+    'io': ('memory', 'io', ctypes.c_uint8),
+    'sram': ('memory', 'sram', ctypes.c_uint8),
+}
+
+class _TypedArrayMethods:
+    """Uint8Array/Uint32Array methods for ctypes arrays living in the shared block."""
+    _typed = None
+
+    def slice(self, begin=None, end=None):
+        return self._typed(self[begin:end])
+
+    def subarray(self, begin=None, end=None):
+        return memoryview(self).cast('B').cast(self._format)[begin:end]
+
+    def set(self, array, offset=0):
+        memoryview(self).cast('B').cast(self._format)[offset:offset + len(array)] = self._typed(array)
+
+    @property
+    def length(self) -> int:
+        return len(self)
+
+def _array_type(ctype, length):
+    typed, fmt = (Uint32Array, 'I') if ctype is ctypes.c_uint32 else (Uint8Array, 'B')
+    return type('Shared' + typed.__name__, (ctype * length, _TypedArrayMethods), {'_typed': typed, '_format': fmt})
+
+def _align(offset):
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+
+class SharedExport:
+    def __init__(self, system, regions=('frame', 'wram'), name=None):
+        """Move `regions` of `system` into a new shared block, called `name` if given.
+
+        Call it before anything else keeps references to those buffers: the current
+        contents are copied and the memory buffers are replaced on the `Memory`.
+        The frame buffer of the `Ppu` stays private and is copied at each VBlank.
+        """
+        from multiprocessing import shared_memory
+        self.system = system
+        layout = {}
+        offset = _ALIGN
+        for region in regions:
+            owner, attr, ctype = _regions[region]
+            length = getattr(getattr(system, owner), attr).length
+            layout[region] = [offset, length, ctypes.sizeof(ctype)]
+            offset = _align(offset + length * ctypes.sizeof(ctype))
+        text = json.dumps(layout).encode()
+        if header.size + len(text) > _ALIGN:
+            raise ValueError('Too many regions')
+        self.shm = shared_memory.SharedMemory(name=name, create=True, size=max(offset, _ALIGN))
+        self.name = self.shm.name
+        buf = self.shm.buf
+        header.pack_into(buf, 0, 0, len(text))
+        buf[header.size:header.size + len(text)] = text
+        self._sequence = ctypes.c_uint64.from_buffer(buf, 0)
+        self._saved = []
+        # Vistas de bytes del cuadro compartido y del privado de la PPU, para copiarlo
+        self._frame = None
+        for region in regions:
+            owner, attr, ctype = _regions[region]
+            target = getattr(system, owner)
+            old = getattr(target, attr)
+            start, length, size = layout[region]
+            if region == 'frame':
+                self._frame = buf[start:start + length * size]
+                self._frame[:] = memoryview(old).cast('B')
+                continue
+            array = _array_type(ctype, length).from_buffer(buf, start)
+            array.set(old)
+            setattr(target, attr, array)
+            self._saved.append((target, attr))
+        self._chained = system.ppu.vblank_callback
+        system.ppu.vblank_callback = self._on_vblank
+
+    @property
+    def sequence(self):
+        """Number of frames published so far."""
+        return self._sequence.value >> 1
+
+    def _on_vblank(self, time):
+        if self._frame is not None:
+            # Impar mientras se copia el cuadro, par de nuevo al terminar
+            self._sequence.value += 1
+            self._frame[:] = memoryview(self.system.ppu.frame).cast('B')
+            self._sequence.value += 1
+        else:
+            self._sequence.value += 2
+        if self._chained is not None:
+            self._chained(time)
+
+    def close(self):
+        """Give the system private copies of the buffers again and delete the block."""
+        if self.shm is None:
+            return
+        for target, attr in self._saved:
+            setattr(target, attr, getattr(target, attr).slice())
+        self.system.ppu.vblank_callback = self._chained
+        # Sin referencias a los arrays de ctypes, el bloque deja de estar exportado
+        self._saved = []
+        self._sequence = None
+        if self._frame is not None:
+            self._frame.release()
+            self._frame = None
+        shm = self.shm
+        self.shm = None
+        try:
+            shm.close()
+        finally:
+            shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class SharedView:
+    """Reader side of a `SharedExport`, attached by block name.
+
+    Memoryviews from `region()` are released by `close()`. Arrays from `array()`
+    must be deleted before it, or it raises BufferError.
+    """
+    def __init__(self, name):
+        from multiprocessing import shared_memory
+        self.shm = shared_memory.SharedMemory(name=name)
+        buf = self.shm.buf
+        sequence, length = header.unpack_from(buf, 0)
+        self.layout = json.loads(bytes(buf[header.size:header.size + length]).decode())
+        # Región -> vistas (la de bytes y, para el cuadro, la de 32 bits)
+        self._views = {}
+
+    @property
+    def sequence(self):
+        """Number of frames published so far."""
+        return header.unpack_from(self.shm.buf, 0)[0] >> 1
+
+    def region(self, region):
+        """Zero-copy memoryview of `region`, with 32-bit items for the frame."""
+        views = self._views.get(region)
+        if views is None:
+            start, length, size = self.layout[region]
+            view = self.shm.buf[start:start + length * size]
+            views = [view, view.cast('I')] if size == 4 else [view]
+            self._views[region] = views
+        return views[-1]
+
+    def array(self, region):
+        """`region` as a NumPy array: (144, 160, 4) RGBA bytes for the frame."""
+        if numpy is None:
+            raise RuntimeError('NumPy is not installed')
+        start, length, size = self.layout[region]
+        array = numpy.frombuffer(self.shm.buf, dtype=numpy.uint8, count=length * size, offset=start)
+        if region == 'frame':
+            return array.reshape(144, 160, 4)
+        return array
+
+    def read(self, region):
+        """Copy of `region` and the sequence number it was taken at.
+
+        The copy is retried while a VBlank publishes a new frame, so `frame` is
+        always one whole frame; memory regions are copied as they are at that time.
+        """
+        view = self.region(region)
+        buf = self.shm.buf
+        while True:
+            sequence = header.unpack_from(buf, 0)[0]
+            if sequence & 1:
+                continue
+            data = view.tobytes()
+            if header.unpack_from(buf, 0)[0] == sequence:
+                return sequence >> 1, data
+
+    def close(self):
+        if self.shm is None:
+            return
+        for views in self._views.values():
+            for view in views:
+                view.release()
+        self._views = {}
+        shm = self.shm
+        self.shm = None
+        shm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
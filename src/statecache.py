@@ -0,0 +1,104 @@
+"""
+Warm-start cache of save states
+
+Headless jobs that replay the same intro before the part they care about can
+start from a cached state instead. States are stored on disk, one pickle per
+key, where the key hashes the whole ROM image, the emulator version and the
+joypad input prefix (one button mask per frame). A hit refreshes the file's
+modification time, and the least recently used files are deleted whenever the
+cache grows over its disk budget.
+"""
+
+import hashlib
+import os
+import pickle
+
+from system import System, VERSION
+
+suffix = '.state'
+
+def state_key(cart, inputs, fast_boot=True):
+    """Cache key of the state reached from power on after running `inputs`."""
+    h = hashlib.sha256()
+    h.update(f'{VERSION}|{int(fast_boot)}|'.encode())
+    # La ROM entera: los checksums de la cabecera no distinguen parches ni homebrew
+    h.update(hashlib.sha256(cart.rom).digest())
+    h.update(bytes(inputs))
+    return h.hexdigest()
+
+class StateCache:
+    def __init__(self, directory, budget=256 * 1024 * 1024):
+        """Cache in `directory`, keeping at most `budget` bytes of states."""
+        self.directory = directory
+        self.budget = budget
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + suffix)
+
+    def get(self, key):
+        """Saved state for `key`, or None."""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                state = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+        # La fecha de modificación hace de marca de último uso
+        os.utime(path)
+        self.hits += 1
+        return state
+
+    def put(self, key, state):
+        path = self._path(key)
+        # Se escribe aparte y se renombra para que otro proceso nunca lea un estado a medias
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        self.evict()
+
+    def entries(self):
+        """(mtime, size, path) of every cached state, least recently used first."""
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(suffix):
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+        entries.sort()
+        return entries
+
+    def size(self):
+        return sum(size for mtime, size, path in self.entries())
+
+    def evict(self):
+        """Delete least recently used states until the cache fits its budget."""
+        entries = self.entries()
+        total = sum(size for mtime, size, path in entries)
+        for mtime, size, path in entries:
+            if total <= self.budget:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def start(self, cart, inputs, fast_boot=True):
+        """A `System` for `cart` in the state after `inputs`, from the cache if possible."""
+        system = System(cart, fast_boot)
+        key = state_key(cart, inputs, fast_boot)
+        state = self.get(key)
+        if state is not None:
+            system.load_state(state)
+        else:
+            system.run_inputs(inputs)
+            self.put(key, system.save_state())
+        return system
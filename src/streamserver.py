@@ -0,0 +1,297 @@
+"""
+Frame and audio streaming for remote viewing
+
+`StreamServer` runs an asyncio event loop in its own thread. The emulation thread
+only hands it a copy of each finished frame (`publish_frame`, or `attach` to
+do it at every VBlank) and the audio blocks it produces (`publish_audio`); all
+encoding and sending happens on the server side.
+
+Frames are zlib-compressed, either whole (key frames) or XOR-ed with the
+previous encoded frame (delta frames), which is mostly zeros for a game screen.
+Each client has a one-frame slot: when it cannot keep up, newer frames replace
+the one waiting and the older one is dropped, and after a drop it gets a key
+frame. Emulation never waits for a client.
+
+Clients connect over TCP and either send `hello` to get the raw message stream,
+or a WebSocket handshake to get each message as a binary WebSocket message.
+Every message is a `message` header (kind, frame or block number, payload size)
+followed by the payload. `StreamClient` is a minimal client that decodes it.
+"""
+
+import asyncio
+import base64
+import collections
+import hashlib
+import struct
+import threading
+import zlib
+
+hello = b'GB01'
+message = struct.Struct('<BII')
+
+KEY_FRAME = 0
+DELTA_FRAME = 1
+AUDIO = 2
+
+_WEBSOCKET_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+def xor_bytes(a, b):
+    size = len(a)
+    return (int.from_bytes(a, 'little') ^ int.from_bytes(b, 'little')).to_bytes(size, 'little')
+
+def encode_frame(data, previous, level=1):
+    """(key, delta) payloads for frame `data`; delta is None without a previous frame."""
+    key = zlib.compress(data, level)
+    delta = None if previous is None else zlib.compress(xor_bytes(data, previous), level)
+    return key, delta
+
+def _websocket_frame(payload):
+    size = len(payload)
+    if size < 126:
+        head = struct.pack('!BB', 0x82, size)
+    elif size < 0x10000:
+        head = struct.pack('!BBH', 0x82, 126, size)
+    else:
+        head = struct.pack('!BBQ', 0x82, 127, size)
+    return head + payload
+
+class _Client:
+    def __init__(self, writer, websocket, audio_blocks):
+        self.writer = writer
+        self.websocket = websocket
+        # Número del último cuadro enviado a este cliente
+        self.last = -1
+        self.pending = None
+        self.audio = collections.deque(maxlen=audio_blocks)
+        self.wakeup = asyncio.Event()
+        self.dropped = 0
+        self.sent = 0
+
+    def offer(self, frame):
+        if self.pending is not None:
+            self.dropped += 1
+        self.pending = frame
+        self.wakeup.set()
+
+    def write(self, kind, number, payload):
+        data = message.pack(kind, number, len(payload)) + payload
+        self.writer.write(_websocket_frame(data) if self.websocket else data)
+
+    async def run(self):
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            while self.audio:
+                number, payload = self.audio.popleft()
+                self.write(AUDIO, number, payload)
+            frame = self.pending
+            self.pending = None
+            if frame is not None:
+                number, base, key, delta = frame
+                if delta is not None and self.last == base:
+                    self.write(DELTA_FRAME, number, delta)
+                else:
+                    self.write(KEY_FRAME, number, key)
+                self.last = number
+                self.sent += 1
+            # Mientras se vacía el búfer, los cuadros nuevos sustituyen al pendiente
+            await self.writer.drain()
+
+class StreamServer:
+    def __init__(self, host='127.0.0.1', port=0, level=1, audio_blocks=64):
+        """Server on `host`:`port` (0 picks a free port, see `port` after `start()`)."""
+        self.host = host
+        self.port = port
+        self.level = level
+        self.audio_blocks = audio_blocks
+        self.clients = set()
+        # Cuadros que no llegaron ni a codificarse porque llegó otro antes
+        self.skipped = 0
+        self.encoded = 0
+        self._loop = None
+        self._thread = None
+        self._server = None
+        self._raw = None
+        self._encoding = False
+        self._previous = None
+        self._previous_number = -1
+        self._audio_number = 0
+        self._handlers = set()
+        self._ready = threading.Event()
+
+    def start(self):
+        """Start serving in a background thread."""
+        self._thread = threading.Thread(target=self._run, name='stream server', daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        self._loop = loop
+        asyncio.set_event_loop(loop)
+        self._server = loop.run_until_complete(asyncio.start_server(self._handle, self.host, self.port))
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        try:
+            loop.run_forever()
+        finally:
+            self._server.close()
+            # Al cerrar las conexiones, cada cliente termina por su cuenta
+            for client in self.clients:
+                client.writer.close()
+            if self._handlers:
+                loop.run_until_complete(asyncio.wait(self._handlers))
+            for task in asyncio.all_tasks(loop):
+                task.cancel()
+            loop.run_until_complete(asyncio.sleep(0))
+            loop.run_until_complete(loop.shutdown_default_executor())
+            loop.close()
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def publish_frame(self, frame, number):
+        """Queue frame `number` (RGBA words, e.g. `Ppu.frame`). Called from the emulation thread."""
+        data = memoryview(frame).cast('B').tobytes()
+        self._loop.call_soon_threadsafe(self._on_frame, number, data)
+
+    def publish_audio(self, samples):
+        """Queue an audio block (bytes, in whatever sample format the producer uses)."""
+        self._loop.call_soon_threadsafe(self._on_audio, bytes(samples))
+
+    def attach(self, system):
+        """Publish every frame of `system` at VBlank."""
+        ppu = system.ppu
+        chained = ppu.vblank_callback
+        def on_vblank(time):
+            self.publish_frame(ppu.frame, ppu.frame_count)
+            if chained is not None:
+                chained(time)
+        ppu.vblank_callback = on_vblank
+
+    def _on_frame(self, number, data):
+        if self._encoding:
+            # Solo se guarda el último: el que esperaba se descarta sin codificar
+            if self._raw is not None:
+                self.skipped += 1
+            self._raw = (number, data)
+            return
+        self._encoding = True
+        self._loop.create_task(self._encode(number, data))
+
+    async def _encode(self, number, data):
+        while True:
+            key, delta = await self._loop.run_in_executor(None, encode_frame, data, self._previous, self.level)
+            frame = (number, self._previous_number, key, delta)
+            self._previous = data
+            self._previous_number = number
+            self.encoded += 1
+            for client in self.clients:
+                client.offer(frame)
+            if self._raw is None:
+                break
+            number, data = self._raw
+            self._raw = None
+        self._encoding = False
+
+    def _on_audio(self, samples):
+        number = self._audio_number
+        self._audio_number += 1
+        for client in self.clients:
+            client.audio.append((number, samples))
+            client.wakeup.set()
+
+    async def _handle(self, reader, writer):
+        handler = asyncio.current_task()
+        self._handlers.add(handler)
+        try:
+            await self._serve_client(reader, writer)
+        finally:
+            self._handlers.discard(handler)
+
+    async def _serve_client(self, reader, writer):
+        try:
+            start = await reader.readexactly(4)
+            if start == hello:
+                websocket = False
+            elif start == b'GET ':
+                request = start + await reader.readuntil(b'\r\n\r\n')
+                self._accept_websocket(request, writer)
+                websocket = True
+            else:
+                writer.close()
+                return
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            writer.close()
+            return
+        client = _Client(writer, websocket, self.audio_blocks)
+        self.clients.add(client)
+        sender = asyncio.ensure_future(client.run())
+        receiver = asyncio.ensure_future(self._discard_input(reader))
+        # Termina cuando el cliente cierra o cuando falla el envío
+        await asyncio.wait([sender, receiver], return_when=asyncio.FIRST_COMPLETED)
+        self.clients.discard(client)
+        for task in (sender, receiver):
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, ConnectionError):
+                pass
+        writer.close()
+
+    async def _discard_input(self, reader):
+        # Lo que mande el cliente se ignora; solo importa saber cuándo se va
+        while await reader.read(4096):
+            pass
+
+    def _accept_websocket(self, request, writer):
+        key = None
+        for line in request.split(b'\r\n'):
+            name, sep, value = line.partition(b':')
+            if sep and name.strip().lower() == b'sec-websocket-key':
+                key = value.strip()
+        if key is None:
+            raise ValueError('Not a WebSocket handshake')
+        accept = base64.b64encode(hashlib.sha1(key + _WEBSOCKET_GUID).digest())
+        writer.write(b'HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                     b'Sec-WebSocket-Accept: ' + accept + b'\r\n\r\n')
+
+class StreamClient:
+    """Raw TCP client that decodes the stream back into frames and audio blocks."""
+    def __init__(self):
+        self.frame = None
+        self.number = -1
+        self.audio = []
+
+    async def connect(self, host, port):
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        self.writer.write(hello)
+        await self.writer.drain()
+
+    async def receive(self):
+        """Read one message. Returns its kind."""
+        kind, number, size = message.unpack(await self.reader.readexactly(message.size))
+        payload = await self.reader.readexactly(size)
+        if kind == AUDIO:
+            self.audio.append((number, payload))
+        elif kind == KEY_FRAME:
+            self.frame = zlib.decompress(payload)
+            self.number = number
+        else:
+            self.frame = xor_bytes(zlib.decompress(payload), self.frame)
+            self.number = number
+        return kind
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
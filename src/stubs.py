@@ -2,10 +2,44 @@
 
 # __pragma__('skip')
 
+import array
+import logging
+import time
+
 window = None
-console = None
 document = None
 FileReader = None
+JSON = None
+
+class console:
+    '''Browser console, mapped to the `gb2001` logger when running under CPython'''
+    _logger = logging.getLogger('gb2001')
+
+    @classmethod
+    def _join(cls, args):
+        return ' '.join(map(str, args))
+
+    @classmethod
+    def log(cls, *args):
+        cls._logger.info(cls._join(args))
+
+    @classmethod
+    def debug(cls, *args):
+        cls._logger.debug(cls._join(args))
+
+    @classmethod
+    def warn(cls, *args):
+        cls._logger.warning(cls._join(args))
+
+    @classmethod
+    def error(cls, *args):
+        cls._logger.error(cls._join(args))
+
+class performance:
+    '''High resolution timer, in milliseconds like `performance.now()` in the browser'''
+    @staticmethod
+    def now():
+        return time.perf_counter() * 1000
 
 class Audio:
     loop: bool
@@ -18,20 +52,40 @@ def __new__(newobj):
 class Image:
     src: str
 
-class Uint8Array:
-    def __init__(self, *args):
-        pass
-    def __getitem__(self, item):
-        pass
-    def __setitem__(self, key, value):
-        pass
+class Uint8Array(bytearray):
+    '''Uint8Array backed by a bytearray, so the emulator core can also run under CPython'''
+    def slice(self, begin=None, end=None):
+        return Uint8Array(self[begin:end])
+    def subarray(self, begin=None, end=None):
+        # Vista sin copia, como en JavaScript
+        return memoryview(self)[begin:end]
+    def set(self, array, offset=0):
+        self[offset:offset + len(array)] = array
+    @property
+    def length(self) -> int:
+        return len(self)
+
+class Uint32Array(array.array):
+    '''Uint32Array backed by an array('I'), for the RGBA frame buffer under CPython'''
+    def __new__(cls, init=0):
+        if isinstance(init, int):
+            return super().__new__(cls, 'I', bytes(4 * init))
+        return super().__new__(cls, 'I', init)
     def slice(self, begin=None, end=None):
-        pass
+        return Uint32Array(self[begin:end])
+    def subarray(self, begin=None, end=None):
+        return memoryview(self)[begin:end]
+    def set(self, array, offset=0):
+        self[offset:offset + len(array)] = type(self)(array)
     @property
     def length(self) -> int:
-        pass
+        return len(self)
 
 def Array(*args):
     pass
 
-String = None
\ No newline at end of file
+class String:
+    class fromCharCode:
+        @staticmethod
+        def apply(this, codes):
+            return ''.join(map(chr, codes))
@@ -1,8 +1,121 @@
 from cart import Cart
 from memory import Memory
 from cpu import Cpu
+from timer import Timer
+from ppu import Ppu, FRAME_CYCLES
+from dma import Dma
+from joypad import Joypad
+from link import Serial
+from rtc import Rtc
+from boot import skip_boot
+from telemetry import Telemetry
+
+# __pragma__('skip')
+from stubs import performance
+# __pragma__('noskip')
+
+# Versión del emulador. Cambiarla invalida los estados guardados en caché, así
+# que hay que subirla con cada cambio del formato o de la temporización
+VERSION = '0.1.2'
 
 class System:
-    def __init__(self, cart: Cart):
+    def __init__(self, cart: Cart, fast_boot=False):
         self.cart = cart
-        self.memory = Memory(cart)
\ No newline at end of file
+        self.memory = Memory(cart)
+        self.cpu = Cpu(self.memory)
+        self.timer = Timer(self.cpu)
+        self.ppu = Ppu(self.cpu)
+        self.dma = Dma(self.cpu, self.ppu)
+        self.joypad = Joypad(self.memory)
+        self.serial = Serial(self.cpu)
+        self.rtc = None
+        if cart.cart_type.timer:
+            self.rtc = Rtc(self.cpu)
+            self.memory.rtc = self.rtc
+        self.telemetry = None
+        # Sin ROM de arranque que ejecutar, se parte del estado en que la deja
+        if fast_boot:
+            skip_boot(self)
+
+    def enable_telemetry(self, size=256):
+        """Record per-frame counters in a `Telemetry` ring buffer of `size` frames."""
+        self.telemetry = Telemetry(size)
+        self.ppu.timed = True
+        return self.telemetry
+
+    def disable_telemetry(self):
+        self.telemetry = None
+        self.ppu.timed = False
+
+    def run_frame(self):
+        """Run until the next VBlank, or for a frame's worth of cycles if the LCD is off."""
+        if self.telemetry is not None:
+            self._run_frame_measured()
+            return
+        ppu = self.ppu
+        cpu = self.cpu
+        count = ppu.frame_count
+        limit = cpu.cycles + FRAME_CYCLES
+        step = cpu.step
+        while ppu.frame_count == count and cpu.cycles < limit:
+            step()
+
+    def _run_frame_measured(self):
+        # Igual que run_frame, contando instrucciones y tiempos para la telemetría
+        ppu = self.ppu
+        cpu = self.cpu
+        memory = self.memory
+        count = ppu.frame_count
+        cycles = cpu.cycles
+        limit = cycles + FRAME_CYCLES
+        step = cpu.step
+        instructions = 0
+        # Los cambios de banco se detectan aquí, para no contarlos en la emulación sin medir
+        switches = 0
+        romx = memory._romx_offset
+        sram = memory._sram_offset
+        ppu.render_time = 0
+        start = performance.now()
+        while ppu.frame_count == count and cpu.cycles < limit:
+            step()
+            instructions += 1
+            if memory._romx_offset != romx or memory._sram_offset != sram:
+                switches += 1
+                romx = memory._romx_offset
+                sram = memory._sram_offset
+        host = performance.now() - start
+        self.telemetry.record(start, host, ppu.render_time, cpu.cycles - cycles, instructions, switches)
+
+    def run_inputs(self, inputs):
+        """Run one frame per entry of `inputs`, holding that joypad button mask."""
+        for buttons in inputs:
+            self.joypad.set_buttons(buttons)
+            self.run_frame()
+
+    def save_state(self):
+        state = {
+            'version': VERSION,
+            'cpu': self.cpu.save_state(),
+            'memory': self.memory.save_state(),
+            'timer': self.timer.save_state(),
+            'ppu': self.ppu.save_state(),
+            'dma': self.dma.save_state(),
+            'joypad': self.joypad.save_state(),
+            'serial': self.serial.save_state(),
+        }
+        if self.rtc is not None:
+            state['rtc'] = self.rtc.save_state()
+        return state
+
+    def load_state(self, state):
+        if state['version'] != VERSION:
+            raise ValueError(f"Save state from version {state['version']}, expected {VERSION}")
+        self.cpu.load_state(state['cpu'])
+        self.memory.load_state(state['memory'])
+        self.timer.load_state(state['timer'])
+        self.ppu.load_state(state['ppu'])
+        self.dma.load_state(state['dma'])
+        self.joypad.load_state(state['joypad'])
+        self.serial.load_state(state['serial'])
+        if self.rtc is not None:
+            self.rtc.load_state(state['rtc'])
@@ -0,0 +1,88 @@
+'''Per-frame timing and counters'''
+
+# Campos de cada cuadro:
+# - start: instante del anfitrión en que empezó (ms)
+# - host: ms del anfitrión en `run_frame`, de ellos `ppu` dibujando líneas y el resto `cpu`
+#   (la CPU y los eventos del planificador)
+# - render: ms en `Graphics.render`, si el cuadro se mostró
+# - cycles, instructions: emulados durante el cuadro
+# - bank_switches: instrucciones que cambiaron el banco de ROM o de RAM del cartucho
+# - skipped: 1 si el cuadro se emuló pero no se mostró
+FIELDS = ['start', 'host', 'cpu', 'ppu', 'render', 'cycles', 'instructions', 'bank_switches', 'skipped']
+
+class Telemetry:
+    """Ring buffer with the counters of the last `size` frames.
+
+    `System.run_frame` fills a record per frame; whoever shows the frames adds the
+    render time (`rendered`) or marks it as not shown (`skipped`).
+    """
+    def __init__(self, size=256):
+        self.size = size
+        # Cuadros registrados desde el principio; el último está en (count - 1) % size
+        self.count = 0
+        self.columns = {}
+        for name in FIELDS:
+            self.columns[name] = [0] * size
+
+    def record(self, start, host, ppu, cycles, instructions, bank_switches):
+        i = self.count % self.size
+        columns = self.columns
+        columns['start'][i] = start
+        columns['host'][i] = host
+        columns['cpu'][i] = host - ppu
+        columns['ppu'][i] = ppu
+        columns['render'][i] = 0
+        columns['cycles'][i] = cycles
+        columns['instructions'][i] = instructions
+        columns['bank_switches'][i] = bank_switches
+        columns['skipped'][i] = 0
+        self.count += 1
+
+    def rendered(self, ms):
+        """Add the time taken to show the last frame."""
+        if self.count:
+            self.columns['render'][(self.count - 1) % self.size] += ms
+
+    def skipped(self):
+        """Mark the last frame as not shown."""
+        if self.count:
+            self.columns['skipped'][(self.count - 1) % self.size] = 1
+
+    def frames(self):
+        """Records of the frames in the buffer, oldest first, as dicts of `FIELDS`."""
+        records = []
+        for n in range(max(0, self.count - self.size), self.count):
+            i = n % self.size
+            record = {}
+            for name in FIELDS:
+                record[name] = self.columns[name][i]
+            records.append(record)
+        return records
+
+    def latest(self):
+        if not self.count:
+            return None
+        return self.frames()[-1]
+
+    def summary(self):
+        """Averages over the buffer: frames per second and emulated MHz (host time between
+        the first and last frame), and mean ms per frame for each part."""
+        frames = self.frames()
+        result = {'frames': len(frames), 'fps': 0, 'mhz': 0}
+        for name in FIELDS[1:]:
+            total = 0
+            for record in frames:
+                total += record[name]
+            result[name] = total / len(frames) if frames else 0
+        if len(frames) > 1:
+            elapsed = frames[-1]['start'] - frames[0]['start']
+            if elapsed > 0:
+                result['fps'] = (len(frames) - 1) * 1000 / elapsed
+                cycles = 0
+                for record in frames[:-1]:
+                    cycles += record['cycles']
+                result['mhz'] = cycles / elapsed / 1000
+        return result
+
+    def clear(self):
+        self.count = 0
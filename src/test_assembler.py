@@ -142,6 +142,79 @@ class Test_assembler(unittest.TestCase):
     def test_XOR(self):
         self.sub_test_ALU('XOR', 0x28)
 
+    def test_recompile(self):
+        code = [
+            '.equ valor $40',
+            '.org $100',
+            'inicio:',
+            '    .word final',
+            '    ADD A, valor',
+            '    .word inicio',
+            'medio: XOR B',
+            '    .word medio',
+            '.org $200',
+            '    .byte valor',
+            '    .word medio',
+            'final:',
+        ]
+        a = Assembler('\n'.join(code))
+        self.assertEqual(Assembler('\n'.join(code)).get_patch(), a.get_patch())
+        # Cambia el tamaño: se mueven medio y final
+        code.insert(5, '    AND (HL)')
+        a.compile('\n'.join(code))
+        self.assertEqual(Assembler('\n'.join(code)).get_patch(), a.get_patch())
+        # Cambia un valor del que depende otro chunk
+        code[0] = '.equ valor $41'
+        a.compile('\n'.join(code))
+        self.assertEqual(Assembler('\n'.join(code)).get_patch(), a.get_patch())
+        code[1] = '.org $180'
+        a.compile('\n'.join(code))
+        self.assertEqual(Assembler('\n'.join(code)).get_patch(), a.get_patch())
+
+    def test_recompile_overlap(self):
+        # Un .org vuelve sobre la salida anterior: el hueco de .word lab3 se rellena
+        # sobre el JR que lo tapa, y al quitarlo el JR debe quedar intacto.
+        # lab4 se usa en un chunk que luego la redefine: vale el valor de antes
+        code = [
+            '.org $200',
+            '    .word lab3',
+            '    .org $200',
+            '    JR Z, lab3',
+            'lab3:',
+            '    NOP',
+            'lab4:',
+            '    LD A, lab4',
+            'lab4:',
+            '    NOP',
+        ]
+        a = Assembler('\n'.join(code))
+        self.assertEqual(Assembler('\n'.join(code)).get_patch(), a.get_patch())
+        code[1] = '    .byte 0'
+        a.compile('\n'.join(code))
+        fresh = Assembler('\n'.join(code)).get_patch()
+        self.assertEqual(0x28, fresh[0x200])
+        self.assertEqual(fresh, a.get_patch())
+
+    def test_recompile_reuses_chunks(self):
+        parsed = []
+        class CountingAssembler(Assembler):
+            def _parse_chunk(self, lines):
+                parsed.append(lines)
+                return super()._parse_chunk(lines)
+
+        code = ['lab0:'] + [f'    ADD A, {i}' for i in range(100)] + ['    .word lab0']
+        a = CountingAssembler('\n'.join(code))
+        self.assertEqual(102, len(parsed))
+        parsed.clear()
+        code[50] = '    SUB B'
+        a.compile('\n'.join(code))
+        self.assertEqual([['    SUB B']], parsed)
+        parsed.clear()
+        code[0] = 'lab0: ADD A, 1'
+        a.compile('\n'.join(code))
+        self.assertEqual([['lab0: ADD A, 1']], parsed)
+        self.assertEqual(Assembler('\n'.join(code)).get_patch(), a.get_patch())
+
 
 if __name__ == '__main__':
     unittest.main()
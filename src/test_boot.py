@@ -0,0 +1,43 @@
+import unittest
+from assembler import Assembler
+from cart import Cart, Capability
+from rombuilder import build_rom
+from stubs import Uint8Array
+from system import System
+
+class Test_boot(unittest.TestCase):
+    def load(self, cgb=Capability.Unavailable):
+        rom = build_rom(Assembler('.org $150\nNOP'), cgb=cgb)
+        return System(Cart('test.gb', Uint8Array(rom)), fast_boot=True)
+
+    def test_dmg(self):
+        system = self.load()
+        cpu, mem = system.cpu, system.memory
+        self.assertEqual((0x01B0, 0x0013, 0x00D8, 0x014D), (cpu.AF, cpu.BC, cpu.DE, cpu.HL))
+        self.assertEqual((0xFFFE, 0x0100), (cpu.SP, cpu.PC))
+        self.assertFalse(mem.enable_bootrom)
+        self.assertEqual(0x91, mem.peek(0xFF40))
+        self.assertEqual(0xFC, mem.peek(0xFF47))
+        self.assertEqual(0xAB, mem.peek(0xFF04))
+        self.assertEqual(0xF8, mem.peek(0xFF07))
+        self.assertEqual(0xE1, mem.peek(0xFF0F))
+        # Primer byte del logo, $CE: filas 11110000 y 11111100, repetidas
+        self.assertEqual([0xF0, 0, 0xF0, 0, 0xFC, 0, 0xFC, 0], list(mem.vram[0x10:0x18]))
+        self.assertEqual(0x3C, mem.vram[0x190])
+        self.assertEqual([1, 2, 3], list(mem.vram[0x1904:0x1907]))
+        self.assertEqual([0x0D, 0x0E, 0x18, 0x19], [mem.vram[i] for i in (0x1924, 0x1925, 0x192F, 0x1910)])
+        # El logo ya está en pantalla en el primer cuadro
+        cpu.cycles = 70224
+        mem.peek(0xFF44)
+        self.assertEqual(1, system.ppu.frame_count)
+
+    def test_cgb(self):
+        system = self.load(Capability.Required)
+        cpu, mem = system.cpu, system.memory
+        self.assertEqual((0x1180, 0x0000, 0xFF56, 0x000D), (cpu.AF, cpu.BC, cpu.DE, cpu.HL))
+        self.assertEqual(0xFFFFFFFF, system.ppu.palettes.bg[0])
+        self.assertEqual(0xFFFFFFFF, system.ppu.palettes.obj[31])
+
+
+if __name__ == '__main__':
+    unittest.main()
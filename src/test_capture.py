@@ -0,0 +1,115 @@
+import array
+import errno
+import os
+import random
+import tempfile
+import time
+import unittest
+import wave
+from assembler import Assembler
+from capture import Capture, Yuv444
+from cart import Cart
+from ppu import WIDTH, HEIGHT
+from rombuilder import build_rom
+from stubs import Uint8Array
+from system import System
+from test_statecache import source
+
+def reference(data):
+    planes = (bytearray(), bytearray(), bytearray())
+    for i in range(0, len(data), 4):
+        r, g, b = data[i], data[i + 1], data[i + 2]
+        planes[0].append(((66 * r + 129 * g + 25 * b + 128) >> 8) + 16)
+        planes[1].append(((-38 * r - 74 * g + 112 * b + 128) >> 8) + 128)
+        planes[2].append(((112 * r - 94 * g - 18 * b + 128) >> 8) + 128)
+    return b''.join(planes)
+
+class Test_capture(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def test_yuv(self):
+        rng = random.Random(1)
+        data = bytes(rng.randrange(256) for i in range(WIDTH * HEIGHT * 4))
+        self.assertEqual(Yuv444().convert(data), reference(data))
+        extremes = bytes([0, 0, 0, 255, 255, 255, 255, 255, 255, 0, 0, 255, 0, 0, 255, 255])
+        self.assertEqual(Yuv444(4).convert(extremes), reference(extremes))
+
+    def test_y4m(self):
+        system = System(Cart('test.gb', Uint8Array(build_rom(Assembler(source)))), fast_boot=True)
+        frames = []
+        with Capture(video=self.path('run.y4m')) as capture:
+            capture.attach(system)
+            # Guarda una copia de cada cuadro después de grabarlo
+            recorded = system.ppu.vblank_callback
+            def on_vblank(time):
+                recorded(time)
+                frames.append(memoryview(system.ppu.frame).cast('B').tobytes())
+            system.ppu.vblank_callback = on_vblank
+            for i in range(5):
+                system.run_frame()
+            for i in range(3):
+                capture.add_frame(system.ppu.frame)
+                frames.append(frames[-1])
+        self.assertEqual(capture.frames, len(frames))
+        self.assertGreaterEqual(capture.duplicates, 3)
+        with open(self.path('run.y4m'), 'rb') as f:
+            header = f.readline()
+            self.assertEqual(header, b'YUV4MPEG2 W160 H144 F4194304:70224 Ip A1:1 C444\n')
+            body = f.read()
+        expected = b''.join(b'FRAME\n' + reference(frame) for frame in frames)
+        self.assertEqual(body, expected)
+
+    def test_raw_and_wav(self):
+        frames = [array.array('I', [i] * (WIDTH * HEIGHT)) for i in (1, 1, 2, 1)]
+        with Capture(video=self.path('run.rgba'), audio=self.path('run.wav'), video_format='rgba') as capture:
+            for frame in frames:
+                capture.add_frame(frame)
+            capture.add_audio(b'\x01\x00\x02\x00' * 100)
+            capture.add_audio(b'\x03\x00\x04\x00' * 50)
+        self.assertEqual(capture.duplicates, 1)
+        with open(self.path('run.rgba'), 'rb') as f:
+            self.assertEqual(f.read(), b''.join(frame.tobytes() for frame in frames))
+        with wave.open(self.path('run.wav'), 'rb') as w:
+            self.assertEqual((w.getnchannels(), w.getsampwidth(), w.getframerate()), (2, 2, 44100))
+            self.assertEqual(w.getnframes(), 150)
+            self.assertEqual(w.readframes(150), b'\x01\x00\x02\x00' * 100 + b'\x03\x00\x04\x00' * 50)
+
+    def test_write_error(self):
+        class Full:
+            def write(self, data):
+                raise OSError(errno.ENOSPC, 'No space left on device')
+            def close(self):
+                pass
+        capture = Capture(video=self.path('run.rgba'), video_format='rgba', queue_size=2)
+        capture._video.close()
+        capture._video = Full()
+        capture.add_frame(array.array('I', [1] * 4))
+        capture.add_frame(array.array('I', [2] * 4))
+        for i in range(100):
+            if capture._error is not None:
+                break
+            time.sleep(0.01)
+        # El escritor sigue vaciando la cola y el error llega al hilo de emulación
+        self.assertTrue(capture._thread.is_alive())
+        with self.assertRaises(OSError):
+            capture.add_frame(array.array('I', [3] * 4))
+        with self.assertRaises(OSError):
+            capture.add_audio(b'\0\0\0\0')
+        with self.assertRaises(OSError) as context:
+            capture.close()
+        self.assertEqual(context.exception.errno, errno.ENOSPC)
+        capture.close()
+
+    def test_format(self):
+        with self.assertRaises(ValueError):
+            Capture(video_format='mp4')
+
+if __name__ == '__main__':
+    unittest.main()
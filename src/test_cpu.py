@@ -1,9 +1,156 @@
 import unittest
+from assembler import Assembler
+from cart import Cart
+from cpu import Cpu
+from memory import Memory
+from rombuilder import build_rom
+from stubs import Uint8Array
+
+class Test_cpu(unittest.TestCase):
+    def load(self, code):
+        rom = build_rom(Assembler('.org $150\n' + code))
+        cpu = Cpu(Memory(Cart('test.gb', Uint8Array(rom))))
+        cpu.PC = 0x150
+        cpu.SP = 0xFFFE
+        return cpu
+
+    def run_code(self, code, limit=1000):
+        cpu = self.load(code)
+        while not cpu.halted and limit:
+            cpu.step()
+            limit -= 1
+        return cpu
+
+    def test_registers(self):
+        cpu = self.load('')
+        cpu.BC = 0x12345
+        self.assertEqual((0x23, 0x45), (cpu.B, cpu.C))
+        cpu.A = 0x1FF
+        self.assertEqual(0xFF, cpu.A)
+        cpu.Z = True
+        cpu.CY = True
+        self.assertEqual(0x90, cpu.F)
+        cpu.Z = False
+        self.assertEqual(0x10, cpu.F)
+
+    def test_alu_flags(self):
+        cpu = self.run_code('''
+            LD A, $0F
+            ADD A, 1
+            LD B, A
+            PUSH AF
+            POP DE
+            LD A, $10
+            SUB A, $20
+            HALT
+        ''')
+        self.assertEqual((0x10, 0x20), (cpu.B, cpu.E))
+        self.assertEqual((0xF0, 0x50), (cpu.A, cpu.F))
+        cpu = self.run_code('''
+            XOR A
+            SCF
+            CCF
+            CP A, 0
+            HALT
+        ''')
+        self.assertEqual(0xC0, cpu.F)
+
+    def test_daa(self):
+        cpu = self.run_code('''
+            LD A, $45
+            ADD A, $38
+            DAA
+            LD B, A
+            SUB A, $19
+            DAA
+            HALT
+        ''')
+        self.assertEqual(0x83, cpu.B)
+        self.assertEqual(0x64, cpu.A)
+        self.assertFalse(cpu.CY)
+
+    def test_pop_af(self):
+        cpu = self.run_code('''
+            LD BC, $12FF
+            PUSH BC
+            POP AF
+            HALT
+        ''')
+        self.assertEqual(0x12F0, cpu.AF)
+
+    def test_call_ret(self):
+        cpu = self.run_code('''
+            LD HL, $C000
+            CALL store
+            LD (HL+), A
+            HALT
+        store:
+            LD A, $55
+            RET
+        ''')
+        self.assertEqual(0x55, cpu.memory.wram[0])
+        self.assertEqual(0xC001, cpu.HL)
+        self.assertEqual(0xFFFE, cpu.SP)
+
+    def test_loop_cycles(self):
+        cpu = self.run_code('''
+            LD B, 3
+        loop:
+            DEC B
+            JR NZ, loop
+            HALT
+        ''')
+        # LD 8 + 3 * DEC 4 + 2 * JR tomado 12 + JR no tomado 8 + HALT 4
+        self.assertEqual(8 + 12 + 24 + 8 + 4, cpu.cycles)
+
+    def test_cb(self):
+        cpu = self.run_code('''
+            LD A, $81
+            RLC A
+            LD B, A
+            SWAP B
+            SET 7, C
+            BIT 6, C
+            HALT
+        ''')
+        self.assertEqual(0x03, cpu.A)
+        self.assertEqual(0x30, cpu.B)
+        self.assertEqual(0x80, cpu.C)
+        self.assertEqual(0xA0, cpu.F)
+
+    def test_interrupt(self):
+        cpu = self.load('''
+            EI
+            NOP
+            NOP
+        ''')
+        cpu.memory.io[0xFF] = 0x04
+        cpu.memory.io[0x0F] = 0x04
+        cpu.step()
+        # EI tiene efecto tras la instrucción siguiente
+        self.assertEqual(4, cpu.step())
+        self.assertEqual(20, cpu.step())
+        self.assertEqual(0x50, cpu.PC)
+        self.assertEqual(0, cpu.memory.io[0x0F])
+        self.assertFalse(cpu.ime)
+        self.assertEqual(0x152, cpu.memory.peek(0xFFFC) | (cpu.memory.peek(0xFFFD) << 8))
+
+    def test_halt(self):
+        cpu = self.run_code('HALT\nNOP')
+        self.assertTrue(cpu.halted)
+        self.assertEqual(4, cpu.step())
+        cpu.memory.io[0xFF] = 0x01
+        cpu.memory.request_interrupt(0)
+        cpu.step()
+        # Sin IME la CPU sale de HALT pero no atiende la interrupción
+        self.assertFalse(cpu.halted)
+        self.assertEqual(0x152, cpu.PC)
+
+    def test_illegal(self):
+        cpu = self.run_code('.byte $D3')
+        self.assertTrue(cpu.locked)
+        self.assertEqual(0x150, cpu.PC)
 
-class Test_test_cpu(unittest.TestCase):
-    #def test_A(self):
-    #    self.fail("Not implemented")
-    pass
 
 if __name__ == '__main__':
     unittest.main()
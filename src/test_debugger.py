@@ -0,0 +1,161 @@
+import unittest
+from assembler import Assembler
+from cart import Cart
+from debugger import Debugger, Break
+from rombuilder import build_rom
+from stubs import Uint8Array
+from system import System
+
+source = '''
+    .org $150
+    LD HL,$C000
+loop:
+    LD A,(HL)
+    INC A
+    LD (HL),A
+    LD B,$C0
+    JR loop
+'''
+
+class Test_debugger(unittest.TestCase):
+    def setUp(self):
+        assembler = Assembler(source)
+        self.system = System(Cart('test.gb', Uint8Array(build_rom(assembler))), fast_boot=True)
+        self.debugger = Debugger(self.system)
+        self.loop = 0x153
+        self.reads = self.system.memory._read[:]
+        self.fetches = self.system.memory._fetch[:]
+        self.writes = self.system.memory._write[:]
+
+    def run_until_break(self):
+        with self.assertRaises(Break) as context:
+            for i in range(10):
+                self.system.run_frame()
+        return context.exception
+
+    def test_break(self):
+        cpu = self.system.cpu
+        self.debugger.break_at(0, self.loop)
+        hit = self.run_until_break()
+        self.assertEqual((hit.kind, hit.addr, hit.bank), ('break', self.loop, 0))
+        self.assertEqual(cpu.PC, self.loop)
+        self.assertEqual(self.system.memory.wram[0], 0)
+        # Al seguir, para en la siguiente vuelta y no otra vez en la misma
+        hit = self.run_until_break()
+        self.assertEqual(cpu.PC, self.loop)
+        self.assertEqual(self.system.memory.wram[0], 1)
+
+    def test_ei(self):
+        system = System(Cart('test.gb', Uint8Array(build_rom(Assembler('''
+            .org $150
+            EI
+            NOP
+            NOP
+        done:
+            JR done
+        ''')))), fast_boot=True)
+        cpu = system.cpu
+        cpu.PC = 0x150
+        system.memory.io[0xFF] = 0x01
+        system.memory.io[0x0F] = 0x01
+        debugger = Debugger(system)
+        debugger.break_at(0, 0x151)
+        cpu.step()
+        with self.assertRaises(Break):
+            cpu.step()
+        self.assertEqual(cpu.PC, 0x151)
+        # La instrucción de después de EI se ejecuta antes de atender la interrupción
+        cpu.step()
+        self.assertEqual(cpu.PC, 0x152)
+        cpu.step()
+        self.assertEqual(cpu.PC, 0x40)
+
+    def test_bank(self):
+        self.debugger.break_at(1, self.loop)
+        self.system.run_frame()
+        self.debugger.break_at(None, self.loop)
+        self.assertEqual(self.run_until_break().bank, 0)
+
+    def test_operand(self):
+        # $C0, el operando de LD B,$C0, nunca se ejecuta como instrucción
+        self.debugger.break_at(None, self.loop + 4)
+        self.system.run_frame()
+
+    def test_page_boundary(self):
+        # El operando de LD A,$18 es el primer byte de la página $02; el código de operación no
+        system = System(Cart('test.gb', Uint8Array(build_rom(Assembler('''
+            .org $1FF
+            LD A,$18
+            NOP
+        ''')))), fast_boot=True)
+        cpu = system.cpu
+        cpu.PC = 0x1FF
+        debugger = Debugger(system)
+        debugger.break_at(None, 0x200)
+        cpu.step()
+        self.assertEqual((cpu.PC, cpu.A), (0x201, 0x18))
+        debugger.break_at(None, 0x201)
+        with self.assertRaises(Break) as context:
+            cpu.step()
+        self.assertEqual(context.exception.addr, 0x201)
+        self.assertEqual(cpu.PC, 0x201)
+
+    def test_watch(self):
+        cpu = self.system.cpu
+        self.debugger.watch(0xC000, 'w')
+        hit = self.run_until_break()
+        self.assertEqual((hit.kind, hit.addr, hit.value), ('write', 0xC000, 1))
+        # Para tras la instrucción que escribe
+        self.assertEqual(cpu.PC, self.loop + 3)
+        self.assertEqual(self.system.memory.wram[0], 1)
+        self.debugger.unwatch(0xC000)
+        self.debugger.watch(0xC000, 'r')
+        hit = self.run_until_break()
+        self.assertEqual((hit.kind, hit.value), ('read', 1))
+        self.assertEqual(cpu.PC, self.loop + 1)
+        with self.assertRaises(ValueError):
+            self.debugger.watch(0xC000, 'x')
+
+    def test_restore(self):
+        memory = self.system.memory
+        self.debugger.break_at(0, self.loop)
+        self.debugger.watch(0xC000, 'rw')
+        self.assertIsNot(memory._fetch[0x01], self.fetches[0x01])
+        self.assertIs(memory._read[0x01], self.reads[0x01])
+        self.assertIsNot(memory._write[0xC0], self.writes[0xC0])
+        self.debugger.clear()
+        self.assertEqual(memory._fetch, self.fetches)
+        self.assertEqual(memory._read, self.reads)
+        self.assertEqual(memory._write, self.writes)
+
+    def test_locked_bus(self):
+        memory = self.system.memory
+        memory.lock_bus()
+        self.debugger.watch(0xC000, 'r')
+        memory.unlock_bus()
+        self.assertEqual(self.run_until_break().kind, 'read')
+        memory.lock_bus()
+        self.debugger.unwatch(0xC000)
+        memory.unlock_bus()
+        self.assertEqual(memory._read, self.reads)
+        self.assertEqual(memory._fetch, self.fetches)
+        # HRAM sigue accesible durante la DMA: JR a sí mismo en $FF80, como la espera
+        cpu = self.system.cpu
+        memory.poke(0xFF80, 0x18)
+        memory.poke(0xFF81, 0xFE)
+        memory.lock_bus()
+        self.debugger.break_at(None, 0xFF80)
+        cpu.PC = 0xFF80
+        with self.assertRaises(Break) as context:
+            cpu.step()
+        self.assertEqual(context.exception.addr, 0xFF80)
+        memory.unlock_bus()
+        self.assertEqual(self.run_until_break().addr, 0xFF80)
+        memory.lock_bus()
+        self.debugger.clear_break(None, 0xFF80)
+        memory.unlock_bus()
+        self.assertEqual(memory._read, self.reads)
+        self.assertEqual(memory._fetch, self.fetches)
+
+if __name__ == '__main__':
+    unittest.main()
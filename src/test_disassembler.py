@@ -0,0 +1,78 @@
+import unittest
+from assembler import Assembler
+from disassembler import Disassembler, decode, disassemble, opcodes, cb_opcodes
+
+class Test_disassembler(unittest.TestCase):
+    def test_tables(self):
+        self.assertIsNone(opcodes[0xCB])
+        self.assertEqual(11, sum(1 for op in opcodes if op is not None and op.fmt.startswith('.byte')))
+        self.assertTrue(all(op is not None for op in cb_opcodes))
+        self.assertEqual('HALT', opcodes[0x76].text)
+        self.assertEqual('LD (HL),A', opcodes[0x77].text)
+        self.assertEqual('SWAP (HL)', cb_opcodes[0x36].text)
+        self.assertEqual('SET 7,A', cb_opcodes[0xFF].text)
+
+    def test_operands(self):
+        code = bytes([
+            0x18, 0xFE,
+            0x38, 0x10,
+            0xC2, 0x50, 0x01,
+            0x3E, 0x9A,
+            0xE0, 0x40,
+            0xE8, 0xFE,
+            0xF8, 0x05,
+            0xCB, 0x46,
+            0xC7,
+        ])
+        self.assertEqual([
+            (0x200, 2, 'JR $0200'),
+            (0x202, 2, 'JR C,$0214'),
+            (0x204, 3, 'JP NZ,$0150'),
+            (0x207, 2, 'LD A,$9A'),
+            (0x209, 2, 'LDH ($40),A'),
+            (0x20B, 2, 'ADD SP,-$02'),
+            (0x20D, 2, 'LD HL,SP+$05'),
+            (0x20F, 2, 'BIT 0,(HL)'),
+            (0x211, 1, 'RST $00'),
+        ], disassemble(code, 0x200))
+        self.assertEqual(('JR C,$0214', 2), decode(code, 2, 0x202))
+
+    def test_truncated(self):
+        self.assertEqual([(0, 1, '.byte $C3'), (1, 1, 'NOP')], disassemble(bytes([0xC3, 0x00])))
+        self.assertEqual([(0, 1, '.byte $CB')], disassemble(bytes([0xCB, 0x00]), end=1))
+
+    def test_assembler_round_trip(self):
+        code = '''
+            LD B, C
+            LD (HL), A
+            ADD A, (HL)
+            XOR A
+            CP $10
+            HALT
+            SRL D
+            RRCA
+        '''
+        p = Assembler(code).get_patch()
+        data = bytes(p[i] for i in range(len(p)))
+        lines = disassemble(data)
+        self.assertEqual(['LD B,C', 'LD (HL),A', 'ADD A,(HL)', 'XOR A,A', 'CP A,$10', 'HALT', 'SRL D', 'RRCA'],
+                         [text for addr, size, text in lines])
+        again = Assembler('\n'.join(text for addr, size, text in lines)).get_patch()
+        self.assertEqual(p, again)
+
+    def test_banks(self):
+        rom = bytearray(0x8000)
+        rom[0x4000] = 0xC9
+        d = Disassembler(rom)
+        self.assertEqual(2, d.bank_count)
+        bank = d.bank(1)
+        self.assertEqual((0x4000, 1, 'RET'), bank[0])
+        self.assertEqual(0x4000, len(bank))
+        self.assertIs(bank, d.bank(1))
+        self.assertTrue(d.listing(1).startswith('01:4000  C9      RET\n01:4001  00      NOP'))
+        with self.assertRaises(IndexError):
+            d.bank(2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+from assembler import Assembler
+from cart import Cart, Capability
+from dma import OAM_DMA_CYCLES, HDMA_BLOCK_CYCLES
+from ppu import LINE_CYCLES
+from rombuilder import build_rom
+from stubs import Uint8Array
+from system import System
+
+class Test_dma(unittest.TestCase):
+    def load(self, cgb=Capability.Unavailable):
+        rom = build_rom(Assembler('''
+            .org $150
+            NOP
+            .org $3F00
+            .byte 1, 2, 3, 4
+        '''), cgb=cgb)
+        system = System(Cart('test.gb', Uint8Array(rom)))
+        return system.cpu, system.memory, system.dma
+
+    def test_oam_dma(self):
+        cpu, mem, dma = self.load()
+        for i in range(0xA0):
+            mem.poke(0xC100 + i, i ^ 0x5A)
+        mem.poke(0xFF80, 0x12)
+        cpu.cycles = 1000
+        mem.poke(0xFF46, 0xC1)
+        self.assertEqual(bytes(i ^ 0x5A for i in range(0xA0)), bytes(mem.oam))
+        self.assertTrue(dma.oam_active)
+        self.assertEqual(0xFF, mem.peek(0xC100))
+        self.assertEqual(0xFF, mem.peek(0x0150))
+        self.assertEqual(0x12, mem.peek(0xFF80))
+        self.assertEqual(0xC1, mem.peek(0xFF46))
+        cpu.cycles += OAM_DMA_CYCLES
+        cpu.scheduler.run(cpu.cycles)
+        self.assertFalse(dma.oam_active)
+        self.assertEqual(0x5A, mem.peek(0xC100))
+
+    def test_oam_dma_from_rom(self):
+        cpu, mem, dma = self.load()
+        mem.poke(0xFF46, 0x3F)
+        self.assertEqual(bytes([1, 2, 3, 4]), bytes(mem.oam[0:4]))
+        # Un segundo DMA durante el primero lee la memoria, no el bus bloqueado
+        mem.poke(0xFF46, 0x3F)
+        self.assertEqual(bytes([1, 2, 3, 4]), bytes(mem.oam[0:4]))
+
+    def test_cgb_banks(self):
+        cpu, mem, dma = self.load(Capability.Required)
+        self.assertTrue(mem.cgb)
+        mem.poke(0xFF70, 3)
+        mem.poke(0xD000, 0x33)
+        mem.poke(0xFF70, 0)
+        self.assertEqual(0xF9, mem.peek(0xFF70))
+        self.assertEqual(0, mem.peek(0xD000))
+        self.assertEqual(0x33, mem.wram[0x3000])
+        mem.poke(0xFF4F, 1)
+        mem.poke(0x8000, 0x44)
+        self.assertEqual(0x44, mem.vram[0x2000])
+        self.assertEqual(0xFF, mem.peek(0xFF4F))
+
+    def test_gdma(self):
+        cpu, mem, dma = self.load(Capability.Required)
+        mem.poke(0xFF70, 2)
+        for i in range(0x20):
+            mem.poke(0xCFF0 + i, i)
+        mem.poke(0xFF4F, 1)
+        mem.poke(0xFF51, 0xCF)
+        mem.poke(0xFF52, 0xF0)
+        mem.poke(0xFF53, 0x81)
+        mem.poke(0xFF54, 0x00)
+        mem.poke(0xFF55, 0x01)
+        self.assertEqual(bytes(range(0x20)), bytes(mem.vram[0x2100:0x2120]))
+        self.assertEqual(2 * HDMA_BLOCK_CYCLES, cpu.cycles)
+        self.assertEqual(0xFF, mem.peek(0xFF55))
+        self.assertEqual(0x120, dma.hdma_destination)
+
+    def test_hdma(self):
+        cpu, mem, dma = self.load(Capability.Required)
+        for i in range(0x30):
+            mem.poke(0xC000 + i, i + 1)
+        mem.poke(0xFF51, 0xC0)
+        mem.poke(0xFF52, 0x00)
+        mem.poke(0xFF53, 0x00)
+        mem.poke(0xFF54, 0x00)
+        mem.poke(0xFF40, 0x80)
+        mem.poke(0xFF55, 0x82)
+        self.assertEqual(0x02, mem.peek(0xFF55))
+        self.assertEqual(0, mem.vram[0])
+        cpu.cycles = 252
+        mem.peek(0xFF44)
+        self.assertEqual(bytes(range(1, 17)), bytes(mem.vram[0:16]))
+        self.assertEqual(0, mem.vram[16])
+        self.assertEqual(0x01, mem.peek(0xFF55))
+        cpu.cycles = LINE_CYCLES + 252
+        mem.peek(0xFF44)
+        mem.poke(0xFF55, 0x00)
+        self.assertEqual(0x80, mem.peek(0xFF55))
+        cpu.cycles = LINE_CYCLES * 3
+        mem.peek(0xFF44)
+        self.assertEqual(bytes(range(1, 33)) + bytes(16), bytes(mem.vram[0:48]))
+
+
+if __name__ == '__main__':
+    unittest.main()
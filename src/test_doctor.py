@@ -0,0 +1,74 @@
+import io
+import itertools
+import unittest
+from assembler import Assembler
+from cart import Cart
+from cpu import Cpu
+from doctor import compare, cpu_lines, parse_line, read_lines, set_state, state_line, trace_lines
+from memory import Memory
+from rombuilder import build_rom
+from stubs import Uint8Array
+from tracer import TraceRecorder
+
+class Test_doctor(unittest.TestCase):
+    def load(self):
+        rom = build_rom(Assembler('''
+            .org $150
+                LD HL, $C000
+            loop:
+                INC (HL)
+                LD A, (HL)
+                JR loop
+        '''))
+        cpu = Cpu(Memory(Cart('test.gb', Uint8Array(rom))))
+        cpu.PC = 0x150
+        cpu.SP = 0xFFFE
+        return cpu
+
+    def reference(self, n):
+        return list(itertools.islice(cpu_lines(self.load()), n))
+
+    def test_state_line(self):
+        cpu = self.load()
+        cpu.AF = 0x01B0
+        line = state_line(cpu)
+        self.assertEqual('A:01 F:B0 B:00 C:00 D:00 E:00 H:00 L:00 SP:FFFE PC:0150 PCMEM:21,00,C0,34', line)
+        other = self.load()
+        set_state(other, line)
+        self.assertEqual(line, state_line(other))
+        self.assertEqual('FFFE', parse_line(line)['SP'])
+
+    def test_read_lines(self):
+        text = 'A:01 F:00\r\nA:02 F:00\n\nA:03 F:00'
+        for size in (1, 3, 100):
+            self.assertEqual(['A:01 F:00', 'A:02 F:00', 'A:03 F:00'], list(read_lines(io.BytesIO(text.encode()), size)))
+
+    def test_match(self):
+        log = io.BytesIO('\n'.join(self.reference(300)).encode() + b'\n')
+        self.assertIsNone(compare(read_lines(log, 100), cpu_lines(self.load())))
+
+    def test_divergence(self):
+        lines = self.reference(300)
+        lines[200] = 'A:FF' + lines[200][4:]
+        result = compare(iter(lines), cpu_lines(self.load()), context=3)
+        self.assertEqual(201, result.line)
+        self.assertEqual(lines[197:200], result.context)
+        self.assertEqual(['A'], result.fields)
+        self.assertIn('Differs in: A', str(result))
+
+    def test_short_trace(self):
+        lines = self.reference(10)
+        result = compare(lines, lines[:5])
+        self.assertEqual(6, result.line)
+        self.assertIsNone(result.got)
+
+    def test_binary_trace(self):
+        cpu = self.load()
+        with TraceRecorder(cpu) as tracer:
+            for _ in range(100):
+                cpu.step()
+        self.assertIsNone(compare(self.reference(100), trace_lines(tracer.records())))
+
+
+if __name__ == '__main__':
+    unittest.main()
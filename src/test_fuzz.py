@@ -0,0 +1,74 @@
+import unittest
+from assembler import Assembler
+from cart import Cart
+from joypad import A, START
+from fuzz import Coverage, Fuzzer, fuzz_code
+from rombuilder import build_rom
+from stubs import Uint8Array
+from system import System
+
+# Cada cuadro lee los botones de acción: A y START llevan a caminos distintos
+source = '''
+    .org $40
+    RETI
+    .org $150
+    LD A,$01
+    LD ($FFFF),A
+    EI
+loop:
+    HALT
+    NOP
+    LD A,$10
+    LD ($FF00),A
+    LD A,($FF00)
+    BIT 0,A
+    JR Z,pressed_a
+    BIT 3,A
+    JR Z,pressed_start
+    JR loop
+pressed_a:
+    LD A,1
+    LD ($C002),A
+    JR loop
+pressed_start:
+    LD A,2
+    LD ($C003),A
+    JR loop
+'''
+
+class Test_fuzz(unittest.TestCase):
+    def load(self):
+        return System(Cart('test.gb', Uint8Array(build_rom(Assembler(source)))), fast_boot=True)
+
+    def test_coverage(self):
+        system = self.load()
+        with Coverage(system.cpu) as coverage:
+            system.run_inputs([0] * 3)
+        self.assertEqual({0: coverage.covered()}, coverage.banks())
+        bank = coverage.bank(0)
+        self.assertEqual([1, 1, 0], [bank[0x150], bank[0x40], bank[0x120]])
+        first = coverage.take_new()
+        self.assertEqual(coverage.covered(), first)
+        # Sin instrumentar no se marca nada
+        system.run_inputs([0x10] * 2)
+        self.assertEqual(0, coverage.take_new())
+        self.assertIs(system.cpu._ops, coverage._saved)
+
+    def test_fuzzer(self):
+        fuzzer = Fuzzer(self.load(), frames=8, seed=1)
+        self.assertEqual(1, len(fuzzer.corpus))
+        fuzzer.run(60)
+        self.assertGreaterEqual(len(fuzzer.corpus), 3)
+        self.assertEqual([], fuzzer.crashes)
+        # Los dos caminos, encontrados mutando las entradas
+        system = self.load()
+        with Coverage(system.cpu) as coverage:
+            system.run_inputs([0, A, START])
+        self.assertEqual(bytes(coverage.bank(0)), bytes(fuzzer.coverage.bank(0)))
+
+    def test_fuzz_code(self):
+        self.assertEqual([], fuzz_code(0, 3, count=100, cycles=20000))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+import wave
+from assembler import Assembler
+from headless import Headless, main
+from rombuilder import build_rom
+
+# Suma uno a $A000 en cada arranque y se queda parado
+source = '''
+    .org $150
+    LD A,$0A
+    LD ($0000),A
+    LD HL,$A000
+    INC (HL)
+done:
+    JR done
+'''
+
+class Test_headless(unittest.TestCase):
+    def write_rom(self, directory, cart_type):
+        path = os.path.join(directory, 'game.gb')
+        with open(path, 'wb') as f:
+            f.write(bytes(build_rom(Assembler(source), cart_type=cart_type, ram_size_id=0x02)))
+        return path
+
+    def test_save(self):
+        with tempfile.TemporaryDirectory() as directory:
+            rom = self.write_rom(directory, 0x13)
+            save = os.path.join(directory, 'game.sav')
+            with Headless(rom) as runner:
+                runner.run(2)
+                self.assertIs(runner.system.memory.sram, runner.save.ram)
+            with open(save, 'rb') as f:
+                data = f.read()
+            self.assertEqual((8 * 1024, 1), (len(data), data[0]))
+            # La siguiente ejecución sigue desde lo guardado, también desde la línea de órdenes
+            with contextlib.redirect_stdout(io.StringIO()) as out:
+                self.assertEqual(0, main([rom, '--frames', '2']))
+            self.assertIn(save, out.getvalue())
+            with open(save, 'rb') as f:
+                self.assertEqual(2, f.read()[0])
+            with Headless(rom, '') as runner:
+                runner.run(2)
+                self.assertIsNone(runner.save)
+                self.assertEqual(1, runner.system.memory.sram[0])
+            with open(save, 'rb') as f:
+                self.assertEqual(2, f.read()[0])
+
+    def test_no_battery(self):
+        with tempfile.TemporaryDirectory() as directory:
+            rom = self.write_rom(directory, 0x12)
+            with Headless(rom) as runner:
+                runner.run(2)
+                self.assertIsNone(runner.save)
+            self.assertFalse(os.path.exists(os.path.join(directory, 'game.sav')))
+
+    def test_capture(self):
+        with tempfile.TemporaryDirectory() as directory:
+            rom = self.write_rom(directory, 0x12)
+            video = os.path.join(directory, 'run.y4m')
+            audio = os.path.join(directory, 'run.wav')
+            self.assertEqual(0, main([rom, '--frames', '3', '--video', video, '--audio', audio]))
+            with open(video, 'rb') as f:
+                self.assertTrue(f.readline().startswith(b'YUV4MPEG2 W160 H144'))
+                self.assertEqual(3, f.read().count(b'FRAME\n'))
+            # Silencio con la duración de tres cuadros: 3 * 44100 * 70224 / 4194304 muestras
+            with wave.open(audio, 'rb') as w:
+                self.assertEqual(2215, w.getnframes())
+                self.assertEqual(bytes(4 * 2215), w.readframes(2215))
+            with Headless(rom, video=video, video_format='rgba') as runner:
+                runner.run(2)
+            with open(video, 'rb') as f:
+                self.assertEqual(2 * 160 * 144 * 4, len(f.read()))
+
+
+if __name__ == '__main__':
+    unittest.main()
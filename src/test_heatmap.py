@@ -0,0 +1,108 @@
+import io
+import json
+import struct
+import unittest
+import zlib
+from assembler import Assembler
+from cart import Cart
+from cpu import Cpu
+from heatmap import BusHeatmap
+from memory import Memory
+from rombuilder import build_rom
+from stubs import Uint8Array
+
+class Test_heatmap(unittest.TestCase):
+    code = '''
+            LD B, 10
+            LD HL, $C000
+        loop:
+            LDH A, ($44)
+            LD (HL+), A
+            DEC B
+            JR NZ, loop
+            HALT
+    '''
+
+    def load(self):
+        rom = build_rom(Assembler('.org $150\n' + self.code))
+        cpu = Cpu(Memory(Cart('test.gb', Uint8Array(rom))))
+        cpu.PC = 0x150
+        cpu.SP = 0xFFFE
+        return cpu
+
+    def run_heatmap(self, cpu, **kwargs):
+        with BusHeatmap(cpu.memory, **kwargs) as heatmap:
+            while not cpu.halted:
+                cpu.step()
+        return heatmap
+
+    def test_counts(self):
+        cpu = self.load()
+        heatmap = self.run_heatmap(cpu)
+        self.assertNotIn('peek', vars(cpu.memory))
+        self.assertEqual(heatmap.writes[0xC0], 10)
+        self.assertEqual(heatmap.io_reads[0x44], 10)
+        self.assertEqual(heatmap.reads[0xFF], 10)
+        self.assertEqual(sum(heatmap.writes), 10)
+        # Código: 2 + 3 + 10 * (2 + 1 + 1 + 2) + 1 bytes leídos en la página $01
+        self.assertEqual(heatmap.reads[0x01], 66)
+        data = heatmap.to_dict()
+        self.assertEqual(data['pages']['C0'], {'reads': 0, 'writes': 10})
+        self.assertEqual(data['io']['FF44'], {'reads': 10, 'writes': 0})
+        f = io.StringIO()
+        heatmap.dump_json(f)
+        self.assertEqual(json.loads(f.getvalue())['reads'], 76)
+
+    def test_reset(self):
+        # Accesos de los 10 primeros pasos
+        cpu = self.load()
+        with BusHeatmap(cpu.memory) as heatmap:
+            for i in range(10):
+                cpu.step()
+        first = sum(heatmap.reads) + sum(heatmap.writes)
+        cpu = self.load()
+        with BusHeatmap(cpu.memory) as heatmap:
+            for i in range(10):
+                cpu.step()
+            heatmap.reset()
+            self.assertEqual(0, sum(heatmap.reads))
+            while not cpu.halted:
+                cpu.step()
+        # Lo de después de reset() se sigue contando
+        self.assertEqual(86 - first, sum(heatmap.reads) + sum(heatmap.writes))
+
+    def test_sample(self):
+        heatmap = self.run_heatmap(self.load(), sample=4)
+        total = sum(heatmap.reads) + sum(heatmap.writes)
+        self.assertEqual(total, (86 // 4) * 4)
+
+    def test_windows(self):
+        heatmap = BusHeatmap(Memory(Cart('test.gb', Uint8Array(build_rom(Assembler('.org $150\nNOP'))))),
+                             max_windows=4)
+        for i in range(10):
+            heatmap.reads[0x80] += i
+            heatmap.split()
+        self.assertLessEqual(len(heatmap.windows), 4)
+        self.assertEqual(heatmap.window_size, 4)
+        self.assertEqual(sum(reads[0x80] for reads, writes in heatmap.rows()), 45)
+
+    def test_png(self):
+        heatmap = self.run_heatmap(self.load())
+        heatmap.split()
+        f = io.BytesIO()
+        heatmap.dump_png(f)
+        data = f.getvalue()
+        self.assertEqual(data[:8], b'\x89PNG\r\n\x1a\n')
+        width, height = struct.unpack('>II', data[16:24])
+        self.assertEqual((width, height), (256, 1))
+        start = data.index(b'IDAT') + 4
+        size = struct.unpack('>I', data[start - 8:start - 4])[0]
+        row = zlib.decompress(data[start:start + size])
+        self.assertEqual(len(row), 1 + 256 * 3)
+        # Página $01: la más leída, verde a tope; $C0: solo escrituras
+        self.assertEqual(row[1 + 0x01 * 3:1 + 0x01 * 3 + 3], bytes([0, 255, 0]))
+        self.assertGreater(row[1 + 0xC0 * 3], 0)
+        self.assertEqual(row[1 + 0xC0 * 3 + 1], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,32 @@
+import unittest
+from assembler import Assembler
+from cart import Cart
+from joypad import A, B, DOWN, RIGHT, START
+from rombuilder import build_rom
+from stubs import Uint8Array
+from system import System
+
+class Test_joypad(unittest.TestCase):
+    def test_p1(self):
+        system = System(Cart('test.gb', Uint8Array(build_rom(Assembler('.org $150\nNOP')))))
+        mem, joypad = system.memory, system.joypad
+        self.assertEqual(0xFF, mem.peek(0xFF00))
+        joypad.set_buttons(RIGHT | DOWN | A)
+        # Sin grupo seleccionado no hay interrupción
+        self.assertEqual(0xFF, mem.peek(0xFF00))
+        self.assertEqual(0, mem.io[0x0F])
+        mem.poke(0xFF00, 0x20)
+        self.assertEqual(0xE6, mem.peek(0xFF00))
+        mem.poke(0xFF00, 0x10)
+        self.assertEqual(0xDE, mem.peek(0xFF00))
+        joypad.press(START | B)
+        self.assertEqual(0xD4, mem.peek(0xFF00))
+        self.assertEqual(0x10, mem.io[0x0F])
+        mem.io[0x0F] = 0
+        joypad.release(A | RIGHT)
+        self.assertEqual(0xD5, mem.peek(0xFF00))
+        self.assertEqual(0, mem.io[0x0F])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import os
+import socket
+import tempfile
+import threading
+import unittest
+from assembler import Assembler
+from cart import Cart
+from link import LocalLink
+from linksocket import SocketLink
+from rombuilder import build_rom
+from stubs import Uint8Array
+from system import System
+
+# Envía SB con SC = `sc` y guarda en $C000 el byte recibido
+exchange = '''
+    .org $150
+    LD A,{sb}
+    LD ($FF01),A
+    LD A,{sc}
+    LD ($FF02),A
+wait:
+    LD A,($FF02)
+    BIT 7,A
+    JR NZ,wait
+    LD A,($FF01)
+    LD ($C000),A
+done:
+    JR done
+'''
+
+def load(source):
+    return System(Cart('test.gb', Uint8Array(build_rom(Assembler(source)))), fast_boot=True)
+
+class Test_link(unittest.TestCase):
+    def test_sink(self):
+        system = load('''
+            .org $150
+            LD HL,text
+        next:
+            LD A,(HL+)
+            OR A,A
+        done:
+            JR Z,done
+            LD ($FF01),A
+            LD A,$81
+            LD ($FF02),A
+        wait:
+            LD A,($FF02)
+            BIT 7,A
+            JR NZ,wait
+            JR next
+        text:
+            .byte "Passed", 10, 0
+        ''')
+        output = bytearray()
+        system.serial.sink = output.append
+        system.cpu.run(8 * 4096 + 1000)
+        self.assertEqual(b'Passed\n', bytes(output))
+        # Sin cable se recibe $FF y cada byte pide la interrupción
+        self.assertEqual(0xFF, system.memory.io[0x01])
+        self.assertEqual(0x08, system.memory.io[0x0F] & 0x08)
+
+    def test_local(self):
+        master = load(exchange.format(sb='$42', sc='$81'))
+        slave = load(exchange.format(sb='$99', sc='$80'))
+        received = bytearray()
+        slave.serial.sink = received.append
+        link = LocalLink(master, slave, quantum=1024)
+        link.run(4096 + 2048)
+        self.assertEqual(0x99, master.memory.wram[0])
+        self.assertEqual(0x42, slave.memory.wram[0])
+        self.assertEqual(b'\x99', bytes(received))
+        self.assertEqual(0x7F, master.memory.peek(0xFF02))
+
+    def check_socket(self, make_pair):
+        master = load(exchange.format(sb='$42', sc='$81'))
+        slave = load(exchange.format(sb='$99', sc='$80'))
+        link_master, link_slave = make_pair(master, slave)
+        thread = threading.Thread(target=link_slave.run, args=(8192,))
+        thread.start()
+        link_master.run(8192)
+        thread.join()
+        link_master.close()
+        link_slave.close()
+        self.assertEqual(0x99, master.memory.wram[0])
+        self.assertEqual(0x42, slave.memory.wram[0])
+
+    def test_socket(self):
+        def pair(master, slave):
+            a, b = socket.socketpair()
+            return SocketLink(master, a, 1024), SocketLink(slave, b, 1024)
+        self.check_socket(pair)
+
+    def test_unix_path(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'link')
+            def pair(master, slave):
+                links = []
+                thread = threading.Thread(target=lambda: links.append(SocketLink.listen(slave, path, 1024)))
+                thread.start()
+                while not os.path.exists(path):
+                    pass
+                master_link = SocketLink.connect(master, path, 1024)
+                thread.join()
+                return master_link, links[0]
+            self.check_socket(pair)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+from assembler import Assembler
+from cart import Cart, Capability
+from palette import dmg_shades, cgb_table, rgba
+from ppu import LINE_CYCLES
+from rombuilder import build_rom
+from stubs import Uint8Array
+from system import System
+
+class Test_palette(unittest.TestCase):
+    def load(self, cgb=Capability.Unavailable):
+        rom = build_rom(Assembler('.org $150\nNOP'), cgb=cgb)
+        system = System(Cart('test.gb', Uint8Array(rom)))
+        return system.cpu, system.memory, system.ppu
+
+    def test_dmg(self):
+        cpu, mem, ppu = self.load()
+        palettes = ppu.palettes
+        mem.poke(0xFF47, 0x1B)
+        self.assertEqual(0x1B, mem.peek(0xFF47))
+        self.assertEqual([dmg_shades[i] for i in (3, 2, 1, 0)], list(palettes.bg[0:4]))
+        mem.poke(0xFF48, 0xE4)
+        mem.poke(0xFF49, 0x00)
+        self.assertEqual(list(dmg_shades), list(palettes.obj[0:4]))
+        self.assertEqual([dmg_shades[0]] * 4, list(palettes.obj[4:8]))
+        # Sin paletas de CGB
+        mem.poke(0xFF69, 0x12)
+        self.assertEqual(0xFF, palettes.bg_ram[0])
+
+    def test_cgb_ram(self):
+        cpu, mem, ppu = self.load(Capability.Required)
+        palettes = ppu.palettes
+        # Paleta 1 de fondo, color 2, con autoincremento: rojo puro
+        mem.poke(0xFF68, 0x80 | 0x0C)
+        mem.poke(0xFF69, 0x1F)
+        mem.poke(0xFF69, 0x00)
+        self.assertEqual(0xC0 | 0x0E, mem.peek(0xFF68))
+        self.assertEqual(rgba(0xFF, 0, 0), palettes.bg[6])
+        # Sin autoincremento: se escriben los dos bytes en el mismo sitio
+        mem.poke(0xFF6A, 0x02)
+        mem.poke(0xFF6B, 0xE0)
+        mem.poke(0xFF6B, 0x03)
+        self.assertEqual(0x03, mem.peek(0xFF6B))
+        self.assertEqual(0x42, mem.peek(0xFF6A))
+        self.assertEqual(0xFF, palettes.obj_ram[3])
+        # La escritura en BGP no afecta a las tablas en CGB
+        mem.poke(0xFF47, 0x00)
+        self.assertEqual(rgba(0xFF, 0, 0), palettes.bg[6])
+        palettes.set_color_correction(True)
+        self.assertEqual(cgb_table(True)[0x001F], palettes.bg[6])
+        self.assertNotEqual(rgba(0xFF, 0, 0), palettes.bg[6])
+
+    def test_cgb_render(self):
+        cpu, mem, ppu = self.load(Capability.Required)
+        # Tile 1 del banco 1 de color 1 entero, en la paleta 2 de fondo con volteo horizontal
+        mem.vram[0x2000 + 16:0x2000 + 32] = bytes([0xFF, 0x00] * 8)
+        mem.vram[0x1800] = 1
+        mem.vram[0x2000 + 0x1800] = 0x08 | 0x02
+        # Fondo de la paleta 0, color 0: azul
+        mem.poke(0xFF68, 0x80)
+        mem.poke(0xFF69, 0x00)
+        mem.poke(0xFF69, 0x7C)
+        mem.poke(0xFF68, 0x80 | 0x12)
+        mem.poke(0xFF69, 0xE0)
+        mem.poke(0xFF69, 0x03)
+        mem.poke(0xFF40, 0x91)
+        cpu.cycles = LINE_CYCLES
+        mem.peek(0xFF44)
+        self.assertEqual([rgba(0, 0xFF, 0)] * 8 + [rgba(0, 0, 0xFF)], list(ppu.frame[0:9]))
+
+
+if __name__ == '__main__':
+    unittest.main()
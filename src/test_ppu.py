@@ -0,0 +1,129 @@
+import unittest
+from assembler import Assembler
+from cart import Cart
+from palette import dmg_shades
+from ppu import FRAME_CYCLES, LINE_CYCLES
+from rombuilder import build_rom
+from stubs import Uint8Array
+from system import System
+
+class Test_ppu(unittest.TestCase):
+    def load(self):
+        rom = build_rom(Assembler('.org $150\nNOP'))
+        system = System(Cart('test.gb', Uint8Array(rom)))
+        return system.cpu, system.memory, system.ppu
+
+    def test_lcd_off(self):
+        cpu, mem, ppu = self.load()
+        cpu.cycles = 1000
+        self.assertEqual(0, mem.peek(0xFF44))
+        self.assertEqual(0x80, mem.peek(0xFF41))
+        self.assertEqual(cpu.scheduler.next_time, 1 << 52)
+
+    def test_ly_stat(self):
+        cpu, mem, ppu = self.load()
+        cpu.cycles = 100
+        mem.poke(0xFF40, 0x91)
+        mem.poke(0xFF45, 10)
+        for dot, mode in ((5, 2), (100, 3), (300, 0)):
+            cpu.cycles = 100 + LINE_CYCLES * 10 + dot
+            self.assertEqual(10, mem.peek(0xFF44))
+            self.assertEqual(0x84 | mode, mem.peek(0xFF41))
+        cpu.cycles = 100 + LINE_CYCLES * 150
+        self.assertEqual(150, mem.peek(0xFF44))
+        self.assertEqual(0x81, mem.peek(0xFF41))
+        cpu.cycles = 100 + LINE_CYCLES * 153 + 8
+        self.assertEqual(0, mem.peek(0xFF44))
+        cpu.cycles = 100 + FRAME_CYCLES + LINE_CYCLES * 3
+        self.assertEqual(3, mem.peek(0xFF44))
+        mem.poke(0xFF40, 0x11)
+        self.assertEqual(0, mem.peek(0xFF44))
+
+    def test_vblank(self):
+        cpu, mem, ppu = self.load()
+        mem.poke(0xFF40, 0x91)
+        events = []
+        callback = ppu._event.callback
+        ppu._event.callback = lambda time: events.append(time) or callback(time)
+        cpu.cycles = LINE_CYCLES * 144 - 1
+        mem.peek(0xFF44)
+        self.assertEqual(0, mem.io[0x0F])
+        cpu.cycles += 1
+        mem.peek(0xFF44)
+        self.assertEqual(0x01, mem.io[0x0F])
+        self.assertEqual(1, ppu.frame_count)
+        # Sin interrupciones STAT: un evento por HBlank más el de VBlank
+        self.assertEqual(145, len(events))
+        cpu.cycles = FRAME_CYCLES * 3
+        mem.peek(0xFF44)
+        self.assertEqual(3, ppu.frame_count)
+
+    def test_stat_interrupts(self):
+        cpu, mem, ppu = self.load()
+        mem.poke(0xFF40, 0x91)
+        mem.poke(0xFF45, 5)
+        mem.poke(0xFF41, 0x40)
+        cpu.cycles = LINE_CYCLES * 5 - 1
+        mem.peek(0xFF44)
+        self.assertEqual(0, mem.io[0x0F])
+        cpu.cycles += 1
+        mem.peek(0xFF44)
+        self.assertEqual(0x02, mem.io[0x0F])
+        mem.io[0x0F] = 0
+        mem.poke(0xFF41, 0x08)
+        cpu.cycles = LINE_CYCLES * 5 + 252
+        mem.peek(0xFF44)
+        self.assertEqual(0x02, mem.io[0x0F])
+
+    def test_render(self):
+        cpu, mem, ppu = self.load()
+        # Tile 1: una fila con colores 0, 1, 2, 3, 3, 2, 1, 0
+        mem.vram[16:18] = bytes([0b01011010, 0b00111100])
+        mem.vram[0x1800] = 1
+        mem.poke(0xFF47, 0xE4)
+        mem.poke(0xFF48, 0x1B)
+        mem.poke(0xFF49, 0xE4)
+        # En la línea 1, sprite 0 en x=4 y sprite 1 en x=2: el 1 tiene prioridad donde se solapan
+        mem.oam[0:4] = bytes([17, 12, 2, 0x00])
+        mem.oam[4:8] = bytes([17, 10, 2, 0x10])
+        mem.vram[32:34] = bytes([0xFF, 0x00])
+        mem.poke(0xFF40, 0x93)
+        cpu.cycles = LINE_CYCLES * 2
+        mem.peek(0xFF44)
+        shades = [dmg_shades[shade] for shade in (0, 1, 2, 3, 3, 2, 1, 0, 0)]
+        self.assertEqual(shades, list(ppu.frame[0:9]))
+        shades = [dmg_shades[shade] for shade in (0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 2, 2, 0)]
+        self.assertEqual(shades, list(ppu.frame[160:173]))
+
+    def test_sprite_index(self):
+        cpu, mem, ppu = self.load()
+        for i in range(12):
+            mem.oam[i * 4:i * 4 + 2] = bytes([16 + 20, 100 - i])
+        mem.oam[12 * 4:12 * 4 + 2] = bytes([16 + 40, 50])
+        mem.oam[13 * 4:13 * 4 + 2] = bytes([16 + 40, 50])
+        ppu.oam_changed()
+        # Solo los 10 primeros en OAM, ordenados por X
+        self.assertEqual(list(range(9, -1, -1)), ppu.sprites_on_line(20))
+        self.assertEqual([12, 13], ppu.sprites_on_line(47))
+        self.assertEqual([], ppu.sprites_on_line(48))
+        # Escrituras sueltas en OAM actualizan el índice
+        mem.poke(0xFE00 + 13 * 4, 16 + 60)
+        self.assertEqual([12], ppu.sprites_on_line(40))
+        self.assertEqual([13], ppu.sprites_on_line(60))
+        mem.poke(0xFE00 + 13 * 4, 16 + 40)
+        mem.poke(0xFE00 + 13 * 4 + 1, 40)
+        self.assertEqual([13, 12], ppu.sprites_on_line(40))
+        mem.poke(0xFE00 + 1, 0)
+        self.assertEqual([0, 9, 8, 7, 6, 5, 4, 3, 2, 1], ppu.sprites_on_line(20))
+        # Sprites de 8x16
+        mem.poke(0xFF40, 0x04)
+        self.assertEqual([13, 12], ppu.sprites_on_line(55))
+        # DMA
+        mem.wram[0:4] = bytes([16, 8, 0, 0])
+        mem.poke(0xFF46, 0xC0)
+        self.assertEqual([0], ppu.sprites_on_line(15))
+        self.assertEqual([], ppu.sprites_on_line(20))
+
+
+if __name__ == '__main__':
+    unittest.main()
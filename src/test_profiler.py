@@ -0,0 +1,118 @@
+import io
+import json
+import unittest
+from assembler import Assembler
+from cart import Cart
+from cpu import Cpu
+from memory import Memory
+from profiler import Profiler
+from rombuilder import build_rom
+from stubs import Uint8Array
+from tracer import TraceRecorder
+
+class Test_profiler(unittest.TestCase):
+    def load(self, code):
+        rom = build_rom(Assembler('.org $150\n' + code))
+        cpu = Cpu(Memory(Cart('test.gb', Uint8Array(rom))))
+        cpu.PC = 0x150
+        cpu.SP = 0xFFFE
+        return cpu
+
+    def run_profile(self, cpu, **kwargs):
+        with Profiler(cpu, **kwargs) as prof:
+            while not cpu.halted:
+                cpu.step()
+        return prof
+
+    code = '''
+            LD B, 2
+        loop:
+            CALL work
+            DEC B
+            JR NZ, loop
+            HALT
+        work:
+            SWAP A
+            RET
+    '''
+
+    def test_counts(self):
+        cpu = self.load(self.code)
+        ops = cpu._ops
+        prof = self.run_profile(cpu)
+        self.assertIs(ops, cpu._ops)
+        self.assertFalse(prof.running)
+        self.assertEqual(cpu.cycles, prof.cycles)
+        self.assertEqual(2, prof.op_counts[0xCD])
+        self.assertEqual(2, prof.op_counts[0xCB])
+        self.assertEqual(2, prof.cb_counts[0x37])
+        self.assertEqual(16, prof.cb_cycles[0x37])
+        self.assertEqual(1, prof.op_counts[0x76])
+        self.assertEqual(2, prof.pc_hits[0x15B])
+        self.assertEqual(12, prof.instructions)
+
+    def test_json(self):
+        cpu = self.load(self.code)
+        prof = self.run_profile(cpu)
+        f = io.StringIO()
+        prof.dump_json(f)
+        data = json.loads(f.getvalue())
+        self.assertEqual({'name': 'CALL nn', 'count': 2, 'cycles': 48}, data['opcodes']['CD'])
+        self.assertEqual('SWAP A', data['cb_opcodes']['37']['name'])
+        self.assertEqual(1, data['pc']['00']['0150'])
+        self.assertEqual(2, data['pc']['00']['015B'])
+
+    def test_folded(self):
+        cpu = self.load(self.code)
+        prof = self.run_profile(cpu, symbols={0x159: 'work'})
+        lines = prof.folded()
+        self.assertIn('work;SWAP A 16', lines)
+        self.assertIn('work;RET 32', lines)
+        self.assertIn('CALL nn 48', lines)
+        self.assertEqual(cpu.cycles, sum(int(line.rsplit(' ', 1)[1]) for line in lines))
+
+    def test_interrupt(self):
+        cpu = self.load('''
+            EI
+            HALT
+            NOP
+            .org $40
+            NOP
+        ''')
+        cpu.memory.io[0xFF] = 0x01
+        with Profiler(cpu) as prof:
+            cpu.step()
+            cpu.step()
+            cpu.memory.request_interrupt(0)
+            cpu.step()
+            cpu.step()
+        self.assertEqual(0x41, cpu.PC)
+        self.assertEqual(['00:0040;NOP 4'], [line for line in prof.folded() if line.startswith('00:0040')])
+
+    def test_hooks_out_of_order(self):
+        cpu = self.load('''
+        loop:
+            INC B
+            JR loop
+        ''')
+        ops = cpu._ops
+        prof = Profiler(cpu)
+        tracer = TraceRecorder(cpu, capacity=1000)
+        prof.start()
+        tracer.start()
+        cpu.step()
+        prof.stop()
+        # El trazador sigue grabando; el perfilador ya no cuenta
+        cpu.step()
+        cpu.step()
+        self.assertEqual(1, prof.instructions)
+        self.assertEqual(3, tracer.count)
+        tracer.stop()
+        cpu.step()
+        self.assertEqual(1, prof.instructions)
+        self.assertEqual(3, tracer.count)
+        self.assertIs(ops, cpu._ops)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+from assembler import Assembler
+from cart import Cart, Capability
+from rombuilder import build_rom
+from stubs import Uint8Array
+
+class Test_rombuilder(unittest.TestCase):
+    def load(self, rom):
+        return Cart('test.gb', Uint8Array(rom))
+
+    def test_minimal(self):
+        rom = build_rom(Assembler('''
+            .org $150
+            XOR A
+        '''), 'TEST')
+        self.assertEqual(0x8000, len(rom))
+        self.assertEqual(bytes([0x00, 0xC3, 0x50, 0x01]), rom[0x100:0x104])
+        self.assertEqual(0xAF, rom[0x150])
+        self.assertEqual(0xFF, rom[0x151])
+        cart = self.load(rom)
+        self.assertTrue(cart.check_logo())
+        self.assertTrue(cart.check_header_checksum())
+        self.assertTrue(cart.check_rom_checksum())
+        self.assertEqual('TEST', cart.title)
+        self.assertEqual('ROM ONLY', cart.cart_type.description)
+
+    def test_header(self):
+        rom = build_rom({0x100: 0x18, 0x101: 0x4E}, 'CGB TITLE', cart_type=0x1B, ram_size_id=0x03,
+                        cgb=Capability.Required, manufacturer='ABCD', sgb=True, banks={5: {0x4000: 0x12}})
+        cart = self.load(rom)
+        self.assertEqual(0x20000, len(rom))
+        self.assertEqual(bytes([0x18, 0x4E, 0xFF, 0xFF]), rom[0x100:0x104])
+        self.assertEqual(0x12, rom[5 * 0x4000])
+        self.assertTrue(cart.check_logo())
+        self.assertTrue(cart.check_header_checksum())
+        self.assertTrue(cart.check_rom_checksum())
+        self.assertEqual('CGB TITLE', cart.title)
+        self.assertEqual('ABCD', cart.manufacturer)
+        self.assertEqual(Capability.Required, cart.cgb_flag)
+        self.assertEqual(Capability.Capable, cart.sgb_flag)
+        self.assertEqual(8, cart.rom_size)
+        self.assertEqual(32, cart.ram_size)
+        self.assertTrue(cart.cart_type.battery)
+
+    def test_title(self):
+        # Todo título que se acepta vuelve igual al leerlo con Cart
+        for cgb, manufacturer, limit in ((Capability.Unavailable, '', 16), (Capability.Capable, '', 14),
+                                         (Capability.Required, 'ABCD', 11)):
+            for length in range(18):
+                title = 'ABCDEFGHIJKLMNOPQR'[:length]
+                if length > limit:
+                    with self.assertRaises(ValueError):
+                        build_rom({}, title, cgb=cgb, manufacturer=manufacturer)
+                    continue
+                cart = self.load(build_rom({}, title, cgb=cgb, manufacturer=manufacturer))
+                self.assertEqual(title, cart.title)
+                self.assertEqual(cgb, cart.cgb_flag)
+                self.assertEqual(manufacturer or None, getattr(cart, 'manufacturer', None))
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            build_rom({0x134: 0})
+        with self.assertRaises(ValueError):
+            build_rom({}, 'A TITLE TOO LONG FOR A CART')
+        with self.assertRaises(ValueError):
+            build_rom({}, cart_type=0x04)
+        with self.assertRaises(ValueError):
+            build_rom({0x9000: 0})
+        with self.assertRaises(ValueError):
+            build_rom({}, rom_size_id=0x00, banks={2: {0x4000: 0}})
+
+
+if __name__ == '__main__':
+    unittest.main()
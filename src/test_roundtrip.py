@@ -0,0 +1,56 @@
+import os
+import random
+import unittest
+import roundtrip
+
+class Test_roundtrip(unittest.TestCase):
+    def test_every_opcode(self):
+        rng = random.Random(1)
+        code = roundtrip.random_code(rng, 5000, straight=False)
+        self.assertEqual(len(roundtrip._pools[False]), len(set(roundtrip._pools[False])))
+        listing, mismatches = roundtrip.check_round_trip(code)
+        self.assertEqual([], mismatches)
+
+    def test_straight_code(self):
+        for seed in range(5):
+            self.assertEqual([], roundtrip.check(seed, 500))
+
+    def test_detects_mismatch(self):
+        # JP a sí mismo: el PC no avanza a la instrucción siguiente
+        code = bytes([0x00, 0xC3, 0x51, 0x01, 0x00])
+        listing, mismatches = roundtrip.check_round_trip(code)
+        self.assertEqual([], mismatches)
+        self.assertEqual([(0x154, 'NOP', 'PC is $0151')], roundtrip.check_execution(code, listing))
+
+    def test_cycles(self):
+        self.assertEqual((4,), roundtrip.expected_cycles(bytes([0x00])))
+        self.assertEqual((8, 12), roundtrip.expected_cycles(bytes([0x20, 0x00])))
+        self.assertEqual((12,), roundtrip.expected_cycles(bytes([0xCB, 0x46])))
+        self.assertEqual((16,), roundtrip.expected_cycles(bytes([0xCB, 0x86])))
+        # La CPU no coincide con la tabla: se informa
+        code = bytes([0x00, 0x00])
+        listing, mismatches = roundtrip.check_round_trip(code)
+        roundtrip._cycles[0x00] = 8
+        try:
+            mismatches = roundtrip.check_execution(code, listing)
+        finally:
+            roundtrip._cycles[0x00] = 4
+        self.assertEqual([(0x150, 'NOP', '4 cycles instead of 8'), (0x151, 'NOP', '4 cycles instead of 8')], mismatches)
+
+    def test_vectors(self):
+        self.assertEqual([], roundtrip.check_vectors())
+        self.assertEqual([(0x150, 'INC A; INC A', 'A is $02 instead of $03')],
+                         roundtrip.check_vectors([('INC A\nINC A', {}, {'A': 3, 'F': 0})]))
+
+    def test_regressions(self):
+        baseline = {'a': 100.0, 'b': 100.0}
+        self.assertEqual(['b'], roundtrip.regressions({'a': 80.0, 'b': 70.0, 'c': 1.0}, baseline))
+
+    @unittest.skipUnless(os.environ.get('GB2001_BENCH'), 'set GB2001_BENCH=1 to run the benchmarks')
+    def test_benchmark(self):
+        results = roundtrip.benchmark()
+        self.assertEqual([], roundtrip.regressions(results, roundtrip.load_baseline()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+from assembler import Assembler
+from cart import Cart
+from rombuilder import build_rom
+from rtc import CLOCK, DAY
+from stubs import Uint8Array
+from system import System
+
+class Test_rtc(unittest.TestCase):
+    def load(self):
+        rom = build_rom(Assembler('.org $150\nNOP'), cart_type=0x10, ram_size_id=0x02)
+        system = System(Cart('test.gb', Uint8Array(rom)))
+        mem = system.memory
+        mem.poke(0x0000, 0x0A)
+        return system.cpu, mem, system.rtc
+
+    def latch(self, mem):
+        mem.poke(0x6000, 0x00)
+        mem.poke(0x6000, 0x01)
+
+    def read(self, mem):
+        values = []
+        for register in range(0x08, 0x0D):
+            mem.poke(0x4000, register)
+            values.append(mem.peek(0xA000))
+        return values
+
+    def test_registers(self):
+        cpu, mem, rtc = self.load()
+        cpu.cycles = (DAY + 3600 * 2 + 60 * 3 + 4) * CLOCK + 100
+        self.assertEqual([0] * 5, self.read(mem))
+        self.latch(mem)
+        self.assertEqual([4, 3, 2, 1, 0], self.read(mem))
+        # Los latches no cambian hasta el siguiente 0 -> 1
+        cpu.cycles += 10 * CLOCK
+        mem.poke(0x6000, 0x01)
+        self.assertEqual(4, self.read(mem)[0])
+        self.latch(mem)
+        self.assertEqual(14, self.read(mem)[0])
+        # La RAM sigue en los bancos 0-3
+        mem.poke(0x4000, 0x00)
+        mem.poke(0xA000, 0x42)
+        self.assertEqual(0x42, mem.peek(0xA000))
+
+    def test_write_halt_carry(self):
+        cpu, mem, rtc = self.load()
+        mem.poke(0x4000, 0x0C)
+        mem.poke(0xA000, 0x41)
+        mem.poke(0x4000, 0x0B)
+        mem.poke(0xA000, 0xFF)
+        mem.poke(0x4000, 0x08)
+        mem.poke(0xA000, 59)
+        cpu.cycles += 100 * CLOCK
+        self.latch(mem)
+        self.assertEqual([59, 0, 0, 0xFF, 0x41], self.read(mem))
+        # Al quitar el halt pasa un segundo y el contador de días se desborda
+        mem.poke(0x4000, 0x0C)
+        mem.poke(0xA000, 0x01)
+        mem.poke(0x4000, 0x0A)
+        mem.poke(0xA000, 23)
+        mem.poke(0x4000, 0x09)
+        mem.poke(0xA000, 59)
+        cpu.cycles += CLOCK
+        self.latch(mem)
+        self.assertEqual([0, 0, 0, 0, 0x80], self.read(mem))
+
+    def test_advance_and_state(self):
+        cpu, mem, rtc = self.load()
+        rtc.advance(3600)
+        state = rtc.save_state()
+        cpu.cycles = CLOCK // 2
+        rtc.advance(1)
+        self.assertEqual([1, 0, 1, 0, 0], rtc.registers())
+        rtc.load_state(state)
+        self.assertEqual([0, 0, 1, 0, 0], rtc.registers())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import tempfile
+import unittest
+from assembler import Assembler
+from battery import DirtyPages
+from cart import Cart
+from rombuilder import build_rom
+from savefile import SaveFile, rtc_footer
+from stubs import Uint8Array
+from system import System
+
+class Test_savefile(unittest.TestCase):
+    def load(self, cart_type=0x10):
+        rom = build_rom(Assembler('.org $150\nNOP'), cart_type=cart_type, ram_size_id=0x03)
+        system = System(Cart('test.gb', Uint8Array(rom)))
+        system.memory.poke(0x0000, 0x0A)
+        return system
+
+    def test_persist(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'test.sav')
+            system = self.load()
+            mem = system.memory
+            with SaveFile(mem, path):
+                mem.poke(0x4000, 0x02)
+                mem.poke(0xA123, 0x5A)
+                # Sin flush: la escritura ya está en el fichero
+                with open(path, 'rb') as f:
+                    self.assertEqual(0x5A, f.read()[0x4123])
+                system.rtc.set_registers([10, 20, 3, 4, 0x40])
+            self.assertEqual(0x5A, mem.sram[0x4123])
+            self.assertEqual(32 * 1024 + rtc_footer.size, os.path.getsize(path))
+            system = self.load()
+            with SaveFile(system.memory, path):
+                system.memory.poke(0x4000, 0x02)
+                self.assertEqual(0x5A, system.memory.peek(0xA123))
+                self.assertEqual([10, 20, 3, 4, 0x40], system.rtc.registers())
+                state = system.save_state()
+                system.load_state(state)
+
+    def test_no_rtc(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'test.sav')
+            mem = self.load(0x13).memory
+            with SaveFile(mem, path):
+                mem.poke(0xA000, 1)
+            self.assertEqual(32 * 1024, os.path.getsize(path))
+
+    def test_dirty_pages(self):
+        mem = self.load(0x13).memory
+        calls = []
+        tracker = DirtyPages(mem, lambda: calls.append(1))
+        mem.poke(0xA010, 1)
+        mem.poke(0xA020, 2)
+        mem.poke(0xA310, 3)
+        mem.poke(0x4000, 0x01)
+        mem.poke(0xA000, 4)
+        self.assertEqual(1, len(calls))
+        self.assertEqual([0x00, 0x03, 0x20], tracker.take())
+        self.assertEqual([], tracker.take())
+        mem.poke(0xA000, 5)
+        self.assertEqual(2, len(calls))
+        self.assertEqual([0x20], tracker.take())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import unittest
+from assembler import Assembler
+from cart import Cart
+from joypad import A, B, START
+from rombuilder import build_rom
+from search import explore, state_hash
+from stubs import Uint8Array
+from system import System
+from test_statecache import source
+
+class Test_search(unittest.TestCase):
+    def setUp(self):
+        self.system = System(Cart('test.gb', Uint8Array(build_rom(Assembler(source)))), fast_boot=True)
+        self.system.run_inputs([0] * 3)
+        self.branches = [[0, 0], [A, A], [0, B | START], [A, A]]
+        self.metrics = {'frames': lambda s: s.memory.wram[0], 'p1': lambda s: s.memory.wram[1]}
+
+    def check(self, mode):
+        start = state_hash(self.system)
+        results = explore(self.system, self.branches, self.metrics, mode=mode, workers=2)
+        self.assertEqual(start, state_hash(self.system))
+        self.assertEqual(self.branches, [branch.inputs for branch in results])
+        self.assertEqual([{'frames': 5, 'p1': p1} for p1 in (0xDF, 0xDE, 0xD5, 0xDE)],
+                         [branch.metrics for branch in results])
+        hashes = [branch.state_hash for branch in results]
+        self.assertEqual(hashes[1], hashes[3])
+        self.assertEqual(3, len(set(hashes)))
+        return results
+
+    def test_restore(self):
+        self.check('restore')
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'needs os.fork')
+    def test_fork(self):
+        self.assertEqual(self.check('restore'), self.check('fork'))
+
+    def test_state_hash(self):
+        system = self.system
+        start = state_hash(system)
+        # Estado que no está en los registros ni en la RAM, pero cambia lo que pasa después
+        for obj, name, value in ((system.cpu, 'ime', not system.cpu.ime), (system.cpu, '_ei_pending', True),
+                                 (system.memory, 'ram_enabled', True), (system.memory, '_bank_hi', 1),
+                                 (system.memory, 'rom_bank', 0x101), (system.timer, 'tac', 5),
+                                 (system.joypad, '_select', system.joypad._select ^ 0x30)):
+            saved = getattr(obj, name)
+            setattr(obj, name, value)
+            self.assertNotEqual(start, state_hash(system), name)
+            setattr(obj, name, saved)
+        self.assertEqual(start, state_hash(system))
+        # El cuadro en pantalla no cuenta
+        system.ppu.frame[0] ^= 1
+        self.assertEqual(start, state_hash(system))
+
+    def check_failure(self, mode):
+        start = state_hash(self.system)
+        metrics = {'fail': lambda s: 1 // (s.memory.wram[1] & 1)}
+        with self.assertRaises((ZeroDivisionError, RuntimeError)):
+            explore(self.system, self.branches, metrics, mode=mode, workers=2)
+        self.assertEqual(start, state_hash(self.system))
+
+    def test_restore_failure(self):
+        self.check_failure('restore')
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'needs os.fork')
+    def test_fork_failure(self):
+        self.check_failure('fork')
+        # Todos los hijos se han recogido
+        with self.assertRaises(ChildProcessError):
+            os.waitpid(-1, os.WNOHANG)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+from assembler import Assembler
+from cart import Cart
+from palette import dmg_shades
+from rombuilder import build_rom
+from sharedexport import SharedExport, SharedView
+from stubs import Uint8Array
+from system import System
+from test_statecache import source
+
+class Test_sharedexport(unittest.TestCase):
+    def test_export(self):
+        system = System(Cart('test.gb', Uint8Array(build_rom(Assembler(source)))), fast_boot=True)
+        system.memory.poke(0xC123, 0x77)
+        with SharedExport(system, ('frame', 'wram', 'vram')) as export:
+            self.assertEqual(0x77, system.memory.peek(0xC123))
+            with SharedView(export.name) as view:
+                wram = view.region('wram')
+                self.assertEqual(0x2000, len(wram))
+                self.assertEqual(0x77, wram[0x123])
+                # Las escrituras del emulador se ven sin copiar nada
+                system.memory.poke(0xC124, 0x88)
+                self.assertEqual(0x88, wram[0x124])
+                self.assertEqual(0, view.sequence)
+                system.run_frame()
+                system.run_frame()
+                self.assertEqual(2, export.sequence)
+                self.assertEqual(2, view.sequence)
+                self.assertEqual(2, wram[0])
+                # Logo del arranque en VRAM y primera línea del cuadro en blanco
+                self.assertEqual(0xF0, view.region('vram')[0x10])
+                self.assertEqual(dmg_shades[0], view.region('frame')[0])
+                sequence, data = view.read('frame')
+                self.assertEqual((2, 160 * 144 * 4), (sequence, len(data)))
+                state = system.save_state()
+                system.load_state(state)
+            # Las vistas se liberan al cerrar
+            with self.assertRaises(ValueError):
+                wram[0]
+        # Tras cerrar, el sistema sigue con copias privadas
+        system.run_frame()
+        self.assertEqual(3, system.memory.wram[0])
+        self.assertEqual(0x88, system.memory.peek(0xC124))
+
+    def test_mid_frame(self):
+        system = System(Cart('test.gb', Uint8Array(build_rom(Assembler(source)))), fast_boot=True)
+        with SharedExport(system) as export, SharedView(export.name) as view:
+            system.run_frame()
+            white = view.read('frame')
+            self.assertEqual((1, dmg_shades[0]), (white[0], view.region('frame')[0]))
+            # Paleta en negro y media pantalla dibujada: el cuadro publicado sigue entero
+            system.memory.poke(0xFF47, 0xFF)
+            while system.ppu.ly() != 72:
+                system.cpu.step()
+            self.assertEqual(dmg_shades[3], system.ppu.frame[0])
+            self.assertEqual(dmg_shades[0], system.ppu.frame[-1])
+            self.assertEqual(white, view.read('frame'))
+            system.run_frame()
+            sequence, data = view.read('frame')
+            self.assertEqual(2, sequence)
+            self.assertEqual(bytes(system.ppu.frame), data)
+            self.assertEqual(dmg_shades[3], view.region('frame')[-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import tempfile
+import unittest
+from assembler import Assembler
+from cart import Cart
+from joypad import A, START
+from rombuilder import build_rom
+from statecache import StateCache, state_key
+from stubs import Uint8Array
+
+# Cuenta cuadros en $C000 y guarda en $C001 los botones de acción leídos de P1
+source = '''
+    .org $40
+    JP vblank
+    .org $150
+    LD A,$01
+    LD ($FFFF),A
+    EI
+loop:
+    HALT
+    NOP
+    LD A,$10
+    LD ($FF00),A
+    LD A,($FF00)
+    LD ($C001),A
+    JR loop
+vblank:
+    LD HL,$C000
+    INC (HL)
+    RETI
+'''
+
+class Test_statecache(unittest.TestCase):
+    def setUp(self):
+        self.cart = Cart('test.gb', Uint8Array(build_rom(Assembler(source))))
+        self.inputs = [0] * 5 + [A | START] * 3
+
+    def test_start(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = StateCache(directory)
+            cold = cache.start(self.cart, self.inputs)
+            self.assertEqual((0, 1), (cache.hits, cache.misses))
+            self.assertEqual(8, cold.memory.wram[0])
+            self.assertEqual(0xD6, cold.memory.wram[1])
+            warm = cache.start(self.cart, self.inputs)
+            self.assertEqual((1, 1), (cache.hits, cache.misses))
+            self.assertEqual(cold.cpu.save_state(), warm.cpu.save_state())
+            self.assertEqual(bytes(cold.memory.wram), bytes(warm.memory.wram))
+            # Los dos siguen igual a partir del estado recuperado
+            cold.run_inputs([0] * 3)
+            warm.run_inputs([0] * 3)
+            self.assertEqual(cold.save_state(), warm.save_state())
+            self.assertEqual(11, warm.memory.wram[0])
+            self.assertEqual(0xDF, warm.memory.wram[1])
+
+    def test_key(self):
+        key = state_key(self.cart, self.inputs)
+        self.assertEqual(key, state_key(self.cart, list(self.inputs)))
+        self.assertNotEqual(key, state_key(self.cart, self.inputs[:-1]))
+        self.assertNotEqual(key, state_key(self.cart, self.inputs, fast_boot=False))
+        # Mismos título y checksums, código distinto
+        rom = self.cart.rom.slice()
+        rom[0x151] ^= 0xFF
+        patched = Cart('test.gb', rom)
+        self.assertEqual((self.cart.title, self.cart.checksum), (patched.title, patched.checksum))
+        self.assertNotEqual(key, state_key(patched, self.inputs))
+
+    def test_evict(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = StateCache(directory)
+            paths = []
+            for frames in range(3):
+                cache.start(self.cart, [0] * frames)
+                path = cache._path(state_key(self.cart, [0] * frames))
+                os.utime(path, (1000 + frames, 1000 + frames))
+                paths.append(path)
+            self.assertEqual(paths, [path for mtime, size, path in cache.entries()])
+            # El primero pasa a ser el usado más recientemente
+            self.assertIsNotNone(cache.get(state_key(self.cart, [])))
+            cache.budget = cache.size() - 1
+            cache.evict()
+            self.assertEqual([paths[2], paths[0]], [path for mtime, size, path in cache.entries()])
+
+if __name__ == '__main__':
+    unittest.main()
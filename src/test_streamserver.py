@@ -0,0 +1,102 @@
+import asyncio
+import os
+import socket
+import time
+import unittest
+from assembler import Assembler
+from cart import Cart
+from rombuilder import build_rom
+from streamserver import StreamServer, StreamClient, KEY_FRAME, DELTA_FRAME, AUDIO, message
+from stubs import Uint8Array
+from system import System
+from test_statecache import source
+
+def wait_for(condition, timeout=5):
+    end = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > end:
+            raise AssertionError('Timed out')
+        time.sleep(0.01)
+
+class Test_streamserver(unittest.TestCase):
+    def setUp(self):
+        self.server = StreamServer()
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_frames(self):
+        system = System(Cart('test.gb', Uint8Array(build_rom(Assembler(source)))), fast_boot=True)
+        self.server.attach(system)
+
+        async def session():
+            client = StreamClient()
+            await client.connect('127.0.0.1', self.server.port)
+            await asyncio.get_running_loop().run_in_executor(None, wait_for, lambda: self.server.clients)
+            kinds = []
+            for i in range(10):
+                system.run_frame()
+                self.server.publish_audio(bytes([i]) * 16)
+            while client.number != system.ppu.frame_count:
+                kinds.append(await client.receive())
+            while len(client.audio) < 10:
+                await client.receive()
+            await client.close()
+            return client, kinds
+
+        client, kinds = asyncio.run(session())
+        self.assertEqual(client.frame, memoryview(system.ppu.frame).cast('B').tobytes())
+        kinds = [kind for kind in kinds if kind != AUDIO]
+        self.assertEqual(kinds[0], KEY_FRAME)
+        self.assertIn(DELTA_FRAME, kinds)
+        self.assertEqual(client.audio, [(i, bytes([i]) * 16) for i in range(10)])
+
+    def test_slow_client(self):
+        frames = [os.urandom(160 * 144 * 4) for i in range(40)]
+
+        async def session():
+            client = StreamClient()
+            await client.connect('127.0.0.1', self.server.port)
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, wait_for, lambda: self.server.clients)
+            remote = next(iter(self.server.clients))
+            # El cliente no lee mientras se publica: publicar no debe bloquearse
+            start = time.monotonic()
+            for number, frame in enumerate(frames):
+                self.server.publish_frame(frame, number)
+            self.assertLess(time.monotonic() - start, 1)
+            await loop.run_in_executor(None, wait_for, lambda: self.server._raw is None and not self.server._encoding)
+            while client.number != len(frames) - 1:
+                await client.receive()
+            await client.close()
+            return client, remote
+
+        client, remote = asyncio.run(session())
+        self.assertEqual(client.frame, frames[-1])
+        self.assertEqual(self.server.skipped + self.server.encoded, len(frames))
+        self.assertGreater(self.server.skipped + remote.dropped, 0)
+        self.assertLess(remote.sent, len(frames))
+
+    def test_websocket(self):
+        with socket.create_connection(('127.0.0.1', self.server.port)) as sock:
+            sock.sendall(b'GET /stream HTTP/1.1\r\nHost: localhost\r\nUpgrade: websocket\r\n'
+                         b'Connection: Upgrade\r\nSec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n'
+                         b'Sec-WebSocket-Version: 13\r\n\r\n')
+            reply = b''
+            while not reply.endswith(b'\r\n\r\n'):
+                reply += sock.recv(1)
+            self.assertTrue(reply.startswith(b'HTTP/1.1 101'))
+            self.assertIn(b'Sec-WebSocket-Accept: s3pPLMBiTxaQ9kYGzzhZRbK+xOo=\r\n', reply)
+            wait_for(lambda: self.server.clients)
+            self.server.publish_audio(b'abc')
+            head = sock.recv(2)
+            self.assertEqual(head, bytes([0x82, message.size + 3]))
+            data = b''
+            while len(data) < message.size + 3:
+                data += sock.recv(64)
+            self.assertEqual(message.unpack(data[:message.size]), (AUDIO, 0, 3))
+            self.assertEqual(data[message.size:], b'abc')
+
+if __name__ == '__main__':
+    unittest.main()
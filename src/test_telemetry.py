@@ -0,0 +1,68 @@
+import unittest
+from assembler import Assembler
+from cart import Cart
+from ppu import FRAME_CYCLES
+from rombuilder import build_rom
+from search import state_hash
+from stubs import Uint8Array
+from system import System
+from telemetry import Telemetry, FIELDS
+
+# Cambia de banco dos veces por vuelta, sin esperar a VBlank
+switching = '''
+    .org $150
+loop:
+    LD A,2
+    LD ($2000),A
+    LD A,1
+    LD ($2000),A
+    JR loop
+'''
+
+def load(source, **options):
+    return System(Cart('test.gb', Uint8Array(build_rom(Assembler(source), **options))), fast_boot=True)
+
+class Test_telemetry(unittest.TestCase):
+    def test_ring(self):
+        telemetry = Telemetry(4)
+        self.assertIsNone(telemetry.latest())
+        for i in range(6):
+            telemetry.record(i * 10, 5, 2, 100, 10 + i, 0)
+        telemetry.rendered(1.5)
+        telemetry.skipped()
+        frames = telemetry.frames()
+        self.assertEqual([frame['instructions'] for frame in frames], [12, 13, 14, 15])
+        self.assertEqual(frames[-1]['render'], 1.5)
+        self.assertEqual(frames[-1]['skipped'], 1)
+        self.assertEqual(frames[0]['cpu'], 3)
+        self.assertEqual(set(frames[0]), set(FIELDS))
+        summary = telemetry.summary()
+        self.assertEqual(summary['frames'], 4)
+        self.assertAlmostEqual(summary['fps'], 100)
+        self.assertAlmostEqual(summary['mhz'], 0.01)
+        self.assertEqual(summary['skipped'], 0.25)
+
+    def test_system(self):
+        measured = load(switching, cart_type=0x01, rom_size_id=0x01)
+        plain = load(switching, cart_type=0x01, rom_size_id=0x01)
+        telemetry = measured.enable_telemetry(8)
+        for i in range(3):
+            measured.run_frame()
+            plain.run_frame()
+        # Medir no cambia la emulación
+        self.assertEqual(state_hash(measured), state_hash(plain))
+        latest = telemetry.latest()
+        self.assertEqual(telemetry.count, 3)
+        self.assertGreaterEqual(latest['cycles'], FRAME_CYCLES)
+        self.assertGreater(latest['instructions'], 1000)
+        # Dos cambios de banco cada cinco instrucciones
+        self.assertAlmostEqual(latest['bank_switches'], latest['instructions'] * 2 // 5, delta=2)
+        self.assertGreater(latest['ppu'], 0)
+        self.assertAlmostEqual(latest['cpu'] + latest['ppu'], latest['host'])
+        measured.disable_telemetry()
+        measured.run_frame()
+        self.assertEqual(telemetry.count, 3)
+        self.assertFalse(measured.ppu.timed)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import unittest
+from assembler import Assembler
+from cart import Cart
+from rombuilder import build_rom
+from stubs import Uint8Array
+from system import System
+
+class Test_timer(unittest.TestCase):
+    def load(self, code=''):
+        rom = build_rom(Assembler('.org $150\n' + code))
+        system = System(Cart('test.gb', Uint8Array(rom)))
+        system.cpu.PC = 0x150
+        system.cpu.SP = 0xFFFE
+        return system.cpu, system.memory
+
+    def test_div(self):
+        cpu, mem = self.load()
+        cpu.cycles = 255
+        self.assertEqual(0, mem.peek(0xFF04))
+        cpu.cycles = 256 * 300
+        self.assertEqual(300 & 0xFF, mem.peek(0xFF04))
+        mem.poke(0xFF04, 0x12)
+        self.assertEqual(0, mem.peek(0xFF04))
+        cpu.cycles += 511
+        self.assertEqual(1, mem.peek(0xFF04))
+
+    def test_tima(self):
+        cpu, mem = self.load()
+        mem.poke(0xFF07, 0x05)
+        self.assertEqual(0xFD, mem.peek(0xFF07))
+        cpu.cycles = 160
+        self.assertEqual(10, mem.peek(0xFF05))
+        mem.poke(0xFF07, 0x04)
+        cpu.cycles = 160 + 1024 * 3
+        self.assertEqual(13, mem.peek(0xFF05))
+        self.assertEqual(0, mem.io[0x0F])
+
+    def test_overflow(self):
+        cpu, mem = self.load()
+        mem.poke(0xFF05, 0xFE)
+        mem.poke(0xFF06, 0x80)
+        mem.poke(0xFF07, 0x05)
+        self.assertEqual(32, cpu.scheduler.next_time)
+        cpu.cycles = 33
+        self.assertEqual(0, mem.peek(0xFF05))
+        self.assertEqual(0, mem.io[0x0F])
+        cpu.cycles = 36
+        self.assertEqual(0x80, mem.peek(0xFF05))
+        self.assertEqual(0x04, mem.io[0x0F])
+        self.assertEqual(32 + 16 * 0x80, cpu.scheduler.next_time)
+
+    def test_write_during_reload(self):
+        cpu, mem = self.load()
+        mem.poke(0xFF05, 0xFF)
+        mem.poke(0xFF07, 0x05)
+        cpu.cycles = 17
+        mem.poke(0xFF05, 0x10)
+        cpu.cycles = 40
+        self.assertEqual(0x11, mem.peek(0xFF05))
+        self.assertEqual(0, mem.io[0x0F])
+
+    def test_div_reset_edge(self):
+        cpu, mem = self.load()
+        mem.poke(0xFF07, 0x05)
+        # Bit 3 del contador a 1: reiniciar DIV es un flanco de bajada
+        cpu.cycles = 8
+        mem.poke(0xFF04, 0)
+        self.assertEqual(1, mem.peek(0xFF05))
+        cpu.cycles = 8 + 7
+        mem.poke(0xFF04, 0)
+        self.assertEqual(1, mem.peek(0xFF05))
+        cpu.cycles += 16
+        self.assertEqual(2, mem.peek(0xFF05))
+
+    def test_tac_edge(self):
+        cpu, mem = self.load()
+        mem.poke(0xFF07, 0x05)
+        cpu.cycles = 24
+        mem.poke(0xFF07, 0x00)
+        self.assertEqual(2, mem.peek(0xFF05))
+        self.assertFalse(cpu.scheduler.next_time < 1 << 40)
+
+    def test_interrupt(self):
+        cpu, mem = self.load('''
+                LD A, $04
+                LDH ($FF), A
+                LD A, $F0
+                LDH ($06), A
+                LD A, $05
+                LDH ($07), A
+                EI
+            wait:
+                HALT
+                JR wait
+            .org $50
+                INC B
+                RETI
+        ''')
+        steps = 0
+        while cpu.B < 3:
+            cpu.step()
+            steps += 1
+        # Sin las esperas en HALT serían cientos de pasos
+        self.assertLess(steps, 40)
+        self.assertGreaterEqual(mem.peek(0xFF05), 0xF0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import io
+import unittest
+from assembler import Assembler
+from cart import Cart
+from cpu import Cpu
+from memory import Memory
+from rombuilder import build_rom
+from stubs import Uint8Array
+from tracer import TraceRecorder, read_trace
+
+class Test_tracer(unittest.TestCase):
+    def load(self):
+        rom = build_rom(Assembler('''
+            .org $150
+                LD B, 0
+            loop:
+                INC B
+                JR loop
+        '''))
+        cpu = Cpu(Memory(Cart('test.gb', Uint8Array(rom))))
+        cpu.PC = 0x150
+        cpu.SP = 0xFFFE
+        return cpu
+
+    def test_file(self):
+        cpu = self.load()
+        f = io.BytesIO()
+        with TraceRecorder(cpu, f, capacity=100) as tracer:
+            for _ in range(1001):
+                cpu.step()
+        self.assertFalse(tracer.running)
+        self.assertEqual(1001, tracer.recorded)
+        f.seek(0)
+        records = list(read_trace(f, chunk_size=64))
+        self.assertEqual(1001, len(records))
+        first, second, third = records[:3]
+        self.assertEqual((0x150, 0, 0x06, 0), (first.pc, first.bank, first.opcode, first.cycles))
+        self.assertEqual((0x152, 0x04, 0, 8), (second.pc, second.opcode, second.b, second.cycles))
+        self.assertEqual((0x153, 0x18, 1, 0xFFFE), (third.pc, third.opcode, third.b, third.sp))
+        self.assertEqual(500 & 0xFF, records[-1].b)
+        self.assertTrue(len(f.getvalue()) < 1001 * 21 // 4)
+
+    def test_ring(self):
+        cpu = self.load()
+        tracer = TraceRecorder(cpu, capacity=10)
+        tracer.start()
+        for _ in range(25):
+            cpu.step()
+        tracer.stop()
+        records = tracer.records()
+        self.assertEqual(10, len(records))
+        self.assertEqual([0x152, 0x153] * 5, [r.pc for r in records])
+        self.assertEqual(cpu.cycles - 12, records[-1].cycles)
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            list(read_trace(io.BytesIO(b'nope')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import unittest
+from assembler import Assembler
+from joypad import A, START
+from rombuilder import build_rom
+from test_statecache import source
+from vecenv import VecEnv, numpy
+
+class Test_vecenv(unittest.TestCase):
+    def setUp(self):
+        self.rom = build_rom(Assembler(source))
+
+    def check(self, workers):
+        with VecEnv(self.rom, 3, workers=workers, observation='ram', frames=2) as env:
+            obs = env.step([0, A, START])
+            self.assertEqual([2, 2, 2], [obs[i][0] for i in range(3)])
+            self.assertEqual([0xDF, 0xDE, 0xD7], [obs[i][1] for i in range(3)])
+            states = env.snapshot()
+            obs = env.step([A, A, A], frames=3)
+            self.assertEqual([5, 5, 5], [obs[i][0] for i in range(3)])
+            obs = env.reset([None, states[1], None])
+            self.assertEqual([0, 2, 0], [obs[i][0] for i in range(3)])
+            return [bytes(obs[i]) for i in range(3)]
+
+    def test_workers(self):
+        self.assertEqual(self.check(0), self.check(2))
+
+    def test_frames(self):
+        with VecEnv(self.rom, 2, workers=2) as env:
+            obs = env.step([0, 0])
+            self.assertEqual(160 * 144 * 4, len(bytes(obs[1])))
+            self.assertIs(obs, env.observations())
+        self.assertIsNone(env.shm)
+        with self.assertRaises(ValueError):
+            VecEnv(self.rom, 1, observation='vram')
+
+    def test_failure(self):
+        # Una ROM vacía no llega a cargarse y el bloque compartido no se queda en /dev/shm
+        blocks = set(os.listdir('/dev/shm')) if os.path.isdir('/dev/shm') else set()
+        with self.assertRaises(RuntimeError) as context:
+            VecEnv(b'', 2, workers=2)
+        self.assertIn('Worker for instances 0-0 failed', str(context.exception))
+        self.assertIsInstance(context.exception.__cause__, Exception)
+        with self.assertRaises(Exception):
+            VecEnv(b'', 2, workers=0)
+        if os.path.isdir('/dev/shm'):
+            self.assertEqual(blocks, set(os.listdir('/dev/shm')))
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed')
+    def test_numpy(self):
+        with VecEnv(self.rom, 2, workers=2) as env:
+            obs = env.step([0, A])
+            self.assertEqual((2, 144, 160, 4), obs.shape)
+            self.assertEqual(numpy.uint8, obs.dtype)
+            self.assertEqual(bytes(obs[1]), bytes(env.observations()[1]))
+            obs = None
+        with VecEnv(self.rom, 2, workers=0, observation='ram', frames=2) as env:
+            obs = env.step([0, START])
+            self.assertEqual((2, 0x2000), obs.shape)
+            self.assertEqual([2, 2], list(obs[:, 0]))
+            self.assertEqual([0xDF, 0xD7], list(obs[:, 1]))
+            obs = None
+        self.assertIsNone(env.shm)
+
+
+if __name__ == '__main__':
+    unittest.main()
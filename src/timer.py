@@ -0,0 +1,158 @@
+'''DIV/TIMA timer ($FF04-$FF07)'''
+
+from scheduler import Event
+
+# Ciclos por incremento de TIMA según TAC: 4096, 262144, 65536 y 16384 Hz.
+# Se usa // y no >> porque en JavaScript >> trunca a 32 bits y los ciclos no caben
+_periods = [1024, 16, 64, 256]
+
+class Timer:
+    """Timer registers computed from the CPU cycle counter when they are accessed.
+
+    DIV is the high byte of a 16-bit counter that runs at the CPU clock; only the
+    cycle at which it was last reset is stored. TIMA is stored together with the
+    cycle at which it had that value, and brought up to date on access. Its next
+    overflow is a single scheduler event, moved whenever DIV, TIMA or TAC change.
+    """
+    def __init__(self, cpu):
+        self.cpu = cpu
+        self.scheduler = cpu.scheduler
+        memory = cpu.memory
+        self.memory = memory
+        # Ciclo en el que el contador interno valía 0
+        self._div_base = 0
+        self._tima = 0
+        self._tima_time = 0
+        self.tma = 0
+        self.tac = 0
+        # Tras desbordarse, TIMA vale 0 durante 4 ciclos antes de cargar TMA
+        self._reloading = False
+        self._overflow = Event('timer overflow', self._on_overflow)
+        self._reload = Event('timer reload', self._on_reload)
+        memory.map_io(0xFF04, self._read_div, self._write_div)
+        memory.map_io(0xFF05, self._read_tima, self._write_tima)
+        memory.map_io(0xFF06, self._read_tma, self._write_tma)
+        memory.map_io(0xFF07, self._read_tac, self._write_tac)
+
+    @property
+    def enabled(self):
+        return bool(self.tac & 0x04)
+
+    def save_state(self):
+        return {
+            'div_base': self._div_base, 'tima': self._tima, 'tima_time': self._tima_time,
+            'tma': self.tma, 'tac': self.tac, 'reloading': self._reloading,
+            'overflow': self._overflow.time, 'reload': self._reload.time,
+        }
+
+    def load_state(self, state):
+        self._div_base = state['div_base']
+        self._tima = state['tima']
+        self._tima_time = state['tima_time']
+        self.tma = state['tma']
+        self.tac = state['tac']
+        self._reloading = state['reloading']
+        self.scheduler.restore(self._overflow, state['overflow'])
+        self.scheduler.restore(self._reload, state['reload'])
+
+    def _now(self):
+        now = self.cpu.cycles
+        if now >= self.scheduler.next_time:
+            self.scheduler.run(now)
+        return now
+
+    def _counter(self, time):
+        return time - self._div_base
+
+    def _signal(self, time):
+        """State of the counter bit that clocks TIMA (AND the enable bit)."""
+        if not self.tac & 0x04:
+            return 0
+        return (self._counter(time) // (_periods[self.tac & 3] // 2)) % 2
+
+    def _sync(self, time):
+        if self.tac & 0x04 and not self._reloading:
+            period = _periods[self.tac & 3]
+            ticks = self._counter(time) // period - self._counter(self._tima_time) // period
+            # El evento de desbordamiento ya ha saltado si TIMA llegaba a pasar de $FF
+            self._tima += ticks
+        self._tima_time = time
+
+    def _increment(self, time):
+        if self._tima == 0xFF:
+            self._start_reload(time)
+        else:
+            self._tima += 1
+
+    def _start_reload(self, time):
+        self._tima = 0
+        self._tima_time = time
+        self._reloading = True
+        self.scheduler.schedule(self._reload, time + 4)
+
+    def _reschedule(self):
+        if self.tac & 0x04 and not self._reloading:
+            period = _periods[self.tac & 3]
+            # Flanco en el que TIMA pasa de $FF a $00
+            tick = self._counter(self._tima_time) // period + 0x100 - self._tima
+            self.scheduler.schedule(self._overflow, self._div_base + tick * period)
+        else:
+            self.scheduler.cancel(self._overflow)
+
+    def _on_overflow(self, time):
+        self._start_reload(time)
+
+    def _on_reload(self, time):
+        self._reloading = False
+        self._tima = self.tma
+        self._tima_time = time
+        self.memory.request_interrupt(2)
+        self._reschedule()
+
+    def _read_div(self, addr):
+        return (self._counter(self._now()) // 256) % 256
+
+    def _write_div(self, addr, value):
+        now = self._now()
+        self._sync(now)
+        # Poner el contador a 0 puede ser un flanco de bajada para TIMA
+        if self._signal(now):
+            self._increment(now)
+        self._div_base = now
+        self._tima_time = now
+        self._reschedule()
+
+    def _read_tima(self, addr):
+        self._sync(self._now())
+        return self._tima
+
+    def _write_tima(self, addr, value):
+        now = self._now()
+        if self._reloading:
+            # Escribir TIMA durante la espera anula la recarga y la interrupción
+            self._reloading = False
+            self.scheduler.cancel(self._reload)
+        self._tima = value
+        self._tima_time = now
+        self._reschedule()
+
+    def _read_tma(self, addr):
+        return self.tma
+
+    def _write_tma(self, addr, value):
+        self._now()
+        self.tma = value
+
+    def _read_tac(self, addr):
+        return self.tac | 0xF8
+
+    def _write_tac(self, addr, value):
+        now = self._now()
+        self._sync(now)
+        old = self._signal(now)
+        self.tac = value & 0x07
+        # En DMG, pasar de 1 a 0 la señal vigilada también cuenta como flanco
+        if old and not self._signal(now):
+            self._increment(now)
+        self._tima_time = now
+        self._reschedule()
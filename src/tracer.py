@@ -0,0 +1,132 @@
+"""
+Binary execution trace
+
+`TraceRecorder` stores one fixed-size record per instruction, with the CPU state
+before it runs, in a preallocated buffer. With an output file, the buffer is
+flushed through a zlib stream each time it fills up; without one it works as a
+ring buffer that keeps the latest instructions. Like the profiler, it is a `Cpu`
+hook over its dispatch tables, so it costs nothing while stopped.
+"""
+
+import struct
+import zlib
+from collections import namedtuple
+
+magic = b'GBT1'
+
+# PC, banco, opcode, A, F, B, C, D, E, H, L, SP, ciclos
+record = struct.Struct('<HBBBBBBBBBBHQ')
+
+TraceRecord = namedtuple('TraceRecord', 'pc bank opcode a f b c d e h l sp cycles')
+
+class TraceRecorder:
+    def __init__(self, cpu, f=None, capacity=0x10000, level=1):
+        """Trace `cpu` into the binary file `f`, or into a ring of `capacity` records if `f` is None."""
+        self.cpu = cpu
+        self.f = f
+        self.capacity = capacity
+        self.buffer = bytearray(record.size * capacity)
+        # Registros en el búfer y registros ya volcados (o sobrescritos)
+        self.count = 0
+        self.recorded = 0
+        self.running = False
+        self._compressor = None
+        if f is not None:
+            f.write(magic)
+            self._compressor = zlib.compressobj(level)
+
+    def start(self):
+        if self.running:
+            return
+        self.cpu.add_hook(self)
+        self.running = True
+
+    def stop(self):
+        if not self.running:
+            return
+        self.cpu.remove_hook(self)
+        self.running = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+        self.close()
+
+    def instrument(self, ops, cb_ops, interrupt):
+        tracer = self
+        cpu = self.cpu
+        mem = cpu.memory
+        pack_into = record.pack_into
+        size = record.size
+        buffer = self.buffer
+        capacity = self.capacity
+
+        def make_op(code, fn):
+            def op():
+                n = tracer.count
+                if n == capacity:
+                    tracer._wrap()
+                    n = tracer.count
+                pc = (cpu._pc - 1) & 0xFFFF
+                pack_into(buffer, n * size, pc, mem.bank_at(pc) if pc < 0x8000 else 0xFF, code,
+                          cpu._a, cpu._f, cpu._b, cpu._c, cpu._d, cpu._e, cpu._h, cpu._l, cpu._sp, cpu.cycles)
+                tracer.count = n + 1
+                return fn()
+            return op
+
+        return [make_op(code, fn) for code, fn in enumerate(ops)], cb_ops, interrupt
+
+    def _wrap(self):
+        if self.f is None:
+            # Anillo: se sobrescriben los registros más antiguos
+            self.recorded += self.count
+            self.count = 0
+        else:
+            self.flush()
+
+    def flush(self):
+        """Compress the buffered records into the output file."""
+        if self._compressor is None or not self.count:
+            return
+        self.f.write(self._compressor.compress(memoryview(self.buffer)[:self.count * record.size]))
+        self.recorded += self.count
+        self.count = 0
+
+    def close(self):
+        """Flush everything and end the compressed stream. The file is left open."""
+        if self._compressor is not None:
+            self.flush()
+            self.f.write(self._compressor.flush())
+            self._compressor = None
+
+    def records(self):
+        """Records still in the buffer, oldest first, as TraceRecord."""
+        size = record.size
+        if self.f is None and self.recorded:
+            # El anillo ha dado la vuelta: lo más antiguo empieza en count
+            data = self.buffer[self.count * size:] + self.buffer[:self.count * size]
+        else:
+            data = self.buffer[:self.count * size]
+        return [TraceRecord._make(fields) for fields in record.iter_unpack(data)]
+
+def read_trace(f, chunk_size=0x100000):
+    """Iterate over the TraceRecord stored in the binary trace file `f`."""
+    if f.read(len(magic)) != magic:
+        raise ValueError('Not a trace file')
+    decompressor = zlib.decompressobj()
+    pending = b''
+    size = record.size
+    while True:
+        chunk = f.read(chunk_size)
+        data = pending + (decompressor.decompress(chunk) if chunk else decompressor.flush())
+        usable = len(data) - len(data) % size
+        for fields in record.iter_unpack(data[:usable]):
+            yield TraceRecord._make(fields)
+        pending = data[usable:]
+        if not chunk:
+            break
+    if pending:
+        raise ValueError('Truncated trace file')
@@ -0,0 +1,262 @@
+"""
+Batch of emulators stepped in lockstep, for reinforcement learning
+
+`VecEnv` owns N `System` instances spread over worker processes. Each call to
+`step()` sends one joypad button mask per instance, every worker runs its
+instances for the requested frames, and the observations (the RGBA frame or the
+8 KiB of WRAM) are written into one `multiprocessing.shared_memory` block, so
+nothing but the actions and a short reply goes through the pipes. With NumPy
+installed the observations come back as a stacked array over that block;
+without it, as one memoryview per instance. An error in a worker is sent back
+with its traceback and raised in the parent as a RuntimeError.
+
+`multiprocessing.shared_memory` needs Python 3.8.
+"""
+
+import multiprocessing
+import os
+import traceback
+
+from cart import Cart
+from ppu import WIDTH, HEIGHT
+from stubs import Uint8Array
+from system import System
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Tamaño de cada observación en bytes
+observation_sizes = {
+    'frame': WIDTH * HEIGHT * 4,
+    'ram': 0x2000,
+}
+
+def _observe(system, kind, buf, offset):
+    if kind == 'frame':
+        buf[offset:offset + observation_sizes['frame']] = memoryview(system.ppu.frame).cast('B')
+    else:
+        buf[offset:offset + 0x2000] = system.memory.wram[0:0x2000]
+
+class _Group:
+    """Instances `first`...`first + count - 1`, run by one worker (or in process)."""
+    def __init__(self, rom, first, count, kind, buf, fast_boot, state):
+        self.first = first
+        self.kind = kind
+        self.buf = buf
+        self.systems = [System(Cart('env.gb', Uint8Array(rom)), fast_boot) for i in range(count)]
+        if state is not None:
+            for system in self.systems:
+                system.load_state(state)
+        self.initial = [system.save_state() for system in self.systems]
+        self.observe()
+
+    def observe(self):
+        size = observation_sizes[self.kind]
+        for i, system in enumerate(self.systems):
+            _observe(system, self.kind, self.buf, (self.first + i) * size)
+
+    def step(self, actions, frames):
+        for system, buttons in zip(self.systems, actions):
+            system.joypad.set_buttons(buttons)
+            for frame in range(frames):
+                system.run_frame()
+        self.observe()
+
+    def reset(self, states):
+        for i, system in enumerate(self.systems):
+            system.load_state(self.initial[i] if states is None or states[i] is None else states[i])
+        self.observe()
+
+    def snapshot(self):
+        return [system.save_state() for system in self.systems]
+
+    def handle(self, command, arg):
+        if command == 'step':
+            self.step(*arg)
+        elif command == 'reset':
+            self.reset(arg)
+        elif command == 'snapshot':
+            return self.snapshot()
+        return None
+
+def _send_error(conn, error):
+    # Respuesta (error, traceback); si la excepción no se puede serializar, va su repr
+    text = traceback.format_exc()
+    try:
+        conn.send((error, text))
+    except Exception:
+        conn.send((RuntimeError(repr(error)), text))
+
+def _worker(conn, name, rom, first, count, kind, fast_boot, state):
+    from multiprocessing import shared_memory
+    shm = shared_memory.SharedMemory(name=name)
+    group = None
+    try:
+        try:
+            group = _Group(rom, first, count, kind, shm.buf, fast_boot, state)
+        except Exception as e:
+            _send_error(conn, e)
+            return
+        conn.send((None, None))
+        while True:
+            command, arg = conn.recv()
+            if command == 'close':
+                break
+            try:
+                result = group.handle(command, arg)
+            except Exception as e:
+                _send_error(conn, e)
+            else:
+                conn.send((None, result))
+    finally:
+        group = None
+        shm.close()
+        conn.close()
+
+class VecEnv:
+    def __init__(self, rom, count, workers=None, observation='frame', frames=1, fast_boot=True, state=None):
+        """`count` instances of the cart image `rom` (bytes), over `workers` processes.
+
+        `workers=0` runs every instance in this process. `state` is a save state
+        every instance starts from (and goes back to on `reset()`); by default they
+        start from power on.
+        """
+        from multiprocessing import shared_memory
+        if observation not in observation_sizes:
+            raise ValueError(f'Unknown observation {observation!r}')
+        self.count = count
+        self.observation = observation
+        self.frames = frames
+        if workers is None:
+            workers = min(count, os.cpu_count() or 1)
+        size = observation_sizes[observation]
+        self.shm = shared_memory.SharedMemory(create=True, size=size * count)
+        self._groups = []
+        self._conns = []
+        self._processes = []
+        self._observations = None
+        try:
+            self._start(bytes(rom), count, workers, observation, size, fast_boot, state)
+        except BaseException:
+            # Sin esto, el bloque quedaría en /dev/shm
+            self.close()
+            raise
+
+    def _start(self, rom, count, workers, observation, size, fast_boot, state):
+        if workers == 0:
+            self._groups.append(_Group(rom, 0, count, observation, self.shm.buf, fast_boot, state))
+        else:
+            # Reparto en bloques contiguos, lo más iguales posible
+            for w in range(workers):
+                first = count * w // workers
+                n = count * (w + 1) // workers - first
+                parent, child = multiprocessing.Pipe()
+                process = multiprocessing.Process(
+                    target=_worker, args=(child, self.shm.name, rom, first, n, observation, fast_boot, state),
+                    daemon=True)
+                process.start()
+                child.close()
+                self._conns.append((parent, first, n))
+                self._processes.append(process)
+            self._gather()
+        # Las vistas se crean una vez y se liberan en close()
+        buf = self.shm.buf
+        if numpy is not None:
+            array = numpy.frombuffer(buf, dtype=numpy.uint8, count=size * count)
+            if observation == 'frame':
+                self._observations = array.reshape(count, HEIGHT, WIDTH, 4)
+            else:
+                self._observations = array.reshape(count, size)
+        else:
+            self._observations = [buf[i * size:(i + 1) * size] for i in range(count)]
+
+    def _gather(self):
+        """Reply of every worker; raises for the first one that failed, after reading them all."""
+        results = []
+        # (mensaje, causa) del primer fallo
+        failure = None
+        for conn, first, n in self._conns:
+            instances = f'{first}-{first + n - 1}'
+            try:
+                error, value = conn.recv()
+            except EOFError as e:
+                failure = failure or (f'Worker for instances {instances} exited', e)
+                continue
+            if error is not None:
+                failure = failure or (f'Worker for instances {instances} failed:\n{value}', error)
+                continue
+            results.append(value)
+        if failure is not None:
+            message, cause = failure
+            raise RuntimeError(message) from cause
+        return results
+
+    def _call(self, command, args):
+        """Run `command` on every group, with the part of `args` (one per instance) that belongs to it."""
+        if self._groups:
+            group = self._groups[0]
+            return [group.handle(command, args(0, self.count))]
+        for conn, first, n in self._conns:
+            conn.send((command, args(first, n)))
+        return self._gather()
+
+    def observations(self):
+        """Current observations, as views over the shared block that the next call overwrites.
+
+        Memoryviews are released by `close()`; NumPy arrays must not be in use
+        when it is called, or it raises BufferError.
+        """
+        return self._observations
+
+    def step(self, actions, frames=None):
+        """Hold button mask actions[i] on instance i for `frames` frames; returns the observations."""
+        if len(actions) != self.count:
+            raise ValueError(f'Expected {self.count} actions, got {len(actions)}')
+        actions = [int(buttons) for buttons in actions]
+        frames = self.frames if frames is None else frames
+        self._call('step', lambda first, n: (actions[first:first + n], frames))
+        return self.observations()
+
+    def reset(self, states=None):
+        """Go back to the initial state, or to states[i] (a `snapshot()` entry) where it is not None."""
+        self._call('reset', lambda first, n: None if states is None else states[first:first + n])
+        return self.observations()
+
+    def snapshot(self):
+        """Save state of every instance."""
+        states = []
+        for group_states in self._call('snapshot', lambda first, n: None):
+            states.extend(group_states)
+        return states
+
+    def close(self):
+        for conn, first, n in self._conns:
+            try:
+                conn.send(('close', None))
+            except (BrokenPipeError, OSError):
+                pass
+            conn.close()
+        for process in self._processes:
+            process.join()
+        self._conns = []
+        self._processes = []
+        self._groups = []
+        if self.shm is not None:
+            if numpy is None and self._observations is not None:
+                for view in self._observations:
+                    view.release()
+            self._observations = None
+            shm = self.shm
+            self.shm = None
+            try:
+                shm.close()
+            finally:
+                shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()